@@ -0,0 +1,11 @@
+from celery_tasks.main import celery_app
+from goods.list_cache import warm_sku_list_pages
+
+
+@celery_app.task(name='warm_sku_list_cache')
+def warm_sku_list_cache(category_id):
+    """
+    预热类别的商品列表缓存
+    :param category_id: 商品类别 id
+    """
+    warm_sku_list_pages(category_id)
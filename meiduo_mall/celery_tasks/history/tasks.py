@@ -0,0 +1,130 @@
+import uuid
+from collections import OrderedDict
+
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from celery_tasks.main import celery_app
+from users import constants
+
+HISTORY_STREAM = 'history_stream'
+HISTORY_GROUP = 'history_consumers'
+HISTORY_CONSUMER = 'history_consumer'
+HISTORY_RUN_LOCK = 'history_consume_running'
+
+# 仍持有执行锁时延长有效期
+# KEYS: 执行锁  ARGV: 加锁时写入的值, 有效期
+EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# 仍持有执行锁时释放
+# KEYS: 执行锁  ARGV: 加锁时写入的值
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _ensure_group(redis_conn):
+    """创建事件流的消费组"""
+    try:
+        redis_conn.xgroup_create(HISTORY_STREAM, HISTORY_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        # 消费组已存在
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _apply_history_events(redis_conn, events):
+    """
+    合并一批浏览事件，批量写入用户浏览历史，并累加商品浏览次数
+    浏览历史、浏览次数与事件确认在同一个事务中执行，处理失败后重新读取未确认的事件时不会重复累加
+    :param events: [(event_id, {'user_id': .., 'sku_id': ..}), ...] 按时间先后排列
+    """
+    user_events = OrderedDict()
+    sku_views = {}
+    for event_id, fields in events:
+        user_id = int(fields[b'user_id'])
+        sku_id = int(fields[b'sku_id'])
+        user_events.setdefault(user_id, []).append(sku_id)
+        sku_views[sku_id] = sku_views.get(sku_id, 0) + 1
+
+    pl = redis_conn.pipeline()
+    for user_id, sku_id_list in user_events.items():
+        # 从最新的浏览记录开始去重，只保留需要的数量
+        recent = []
+        for sku_id in reversed(sku_id_list):
+            if sku_id not in recent:
+                recent.append(sku_id)
+            if len(recent) == constants.USER_BROWSING_HISTORY_COUNTS_LIMIT:
+                break
+
+        key = 'history_%s' % user_id
+        for sku_id in recent:
+            pl.lrem(key, 0, sku_id)
+        # 由旧到新依次追加，最新的记录位于列表头部
+        pl.lpush(key, *reversed(recent))
+        pl.ltrim(key, 0, constants.USER_BROWSING_HISTORY_COUNTS_LIMIT-1)
+
+    for sku_id, count in sku_views.items():
+        pl.zincrby('sku_views', count, sku_id)
+
+    event_ids = [event_id for event_id, fields in events]
+    pl.xack(HISTORY_STREAM, HISTORY_GROUP, *event_ids)
+    pl.xdel(HISTORY_STREAM, *event_ids)
+    pl.execute()
+
+
+@celery_app.task(bind=True, name='consume_browsing_history')
+def consume_browsing_history(self):
+    """批量处理浏览历史事件流"""
+    redis_conn = get_redis_connection('history')
+
+    # 同一时间只有一个任务处理，避免重复读取其他任务尚未确认的事件
+    token = uuid.uuid4().hex
+    if not redis_conn.set(HISTORY_RUN_LOCK, token, nx=True,
+                          ex=constants.USER_BROWSING_HISTORY_CONSUME_RUN_LOCK_EXPIRES):
+        # 正在执行的任务可能已读取完毕，稍后重试，确保之后写入的事件被处理
+        raise self.retry(countdown=constants.USER_BROWSING_HISTORY_CONSUME_DELAY, max_retries=None)
+
+    try:
+        # 先清除调度标记，之后写入的事件会重新调度任务，避免事件滞留
+        redis_conn.delete('history_consume_lock')
+
+        _ensure_group(redis_conn)
+        extend_lock = redis_conn.register_script(EXTEND_LOCK_SCRIPT)
+
+        # 先处理上次异常退出时未确认的事件，再处理新事件
+        for start_id in ('0', '>'):
+            while True:
+                ret = redis_conn.xreadgroup(HISTORY_GROUP, HISTORY_CONSUMER, {HISTORY_STREAM: start_id},
+                                            count=constants.USER_BROWSING_HISTORY_CONSUME_BATCH_SIZE)
+                if not ret or not ret[0][1]:
+                    break
+
+                events = []
+                deleted_ids = []
+                for event_id, fields in ret[0][1]:
+                    if fields:
+                        events.append((event_id, fields))
+                    else:
+                        # 已被截断删除的事件只剩下 id，直接确认
+                        deleted_ids.append(event_id)
+
+                if deleted_ids:
+                    redis_conn.xack(HISTORY_STREAM, HISTORY_GROUP, *deleted_ids)
+                if events:
+                    _apply_history_events(redis_conn, events)
+
+                if not extend_lock(keys=[HISTORY_RUN_LOCK],
+                                   args=[token, constants.USER_BROWSING_HISTORY_CONSUME_RUN_LOCK_EXPIRES]):
+                    # 执行锁已过期，可能已有其他任务开始处理
+                    return
+    finally:
+        redis_conn.register_script(RELEASE_LOCK_SCRIPT)(keys=[HISTORY_RUN_LOCK], args=[token])
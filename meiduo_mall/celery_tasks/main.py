@@ -12,7 +12,9 @@ celery_app = Celery('meiduo')
 celery_app.config_from_object('celery_tasks.config')
 
 # 自动注册celery任务
-celery_app.autodiscover_tasks(['celery_tasks.sms', 'celery_tasks.emails', 'celery_tasks.htmls'])
+celery_app.autodiscover_tasks(['celery_tasks.sms', 'celery_tasks.emails', 'celery_tasks.htmls', 'celery_tasks.stocks',
+                            'celery_tasks.history', 'celery_tasks.caches',
+                            'celery_tasks.search'])
 
 # 开启 celery 命令
 # celery -A 应用路径 (.包路径) worker -l info
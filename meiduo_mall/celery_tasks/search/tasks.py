@@ -0,0 +1,10 @@
+from celery_tasks.main import celery_app
+from goods.search_signals import flush_search_index_queue
+
+
+@celery_app.task(name='process_search_index_queue')
+def process_search_index_queue():
+    """
+    批量处理搜索索引更新队列
+    """
+    flush_search_index_queue()
@@ -0,0 +1,29 @@
+import logging
+
+from django.db import DatabaseError
+
+from celery_tasks.main import celery_app
+from orders.utils import sync_prededucted_stock, record_failed_stock_sync
+
+logger = logging.getLogger('django')
+
+
+@celery_app.task(bind=True, name='sync_sku_stock', max_retries=5, default_retry_delay=5)
+def sync_sku_stock(self, cart_items):
+    """
+    将 redis 中预扣减的库存同步到 mysql，扣减库存、增加销量
+    :param cart_items: 下单的商品 [(sku_id, count), ...]
+    """
+    cart = {}
+    for sku_id, count in cart_items:
+        cart[int(sku_id)] = int(count)
+
+    try:
+        sync_prededucted_stock(cart)
+    except DatabaseError as e:
+        logger.error('[sync_sku_stock] %s' % e)
+        if self.request.retries >= self.max_retries:
+            # 多次重试仍失败，由定时任务补充同步
+            record_failed_stock_sync(cart)
+            return
+        raise self.retry(exc=e)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from areas.tree import AreaTree
+
+
+class Command(BaseCommand):
+    """
+    从数据库生成行政区划树文件，各进程通过 mmap 共享，行政区划数据修改后重新执行并重启服务
+    """
+    help = '生成行政区划树文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.AREA_TREE_FILE, help='文件路径')
+
+    def handle(self, *args, **options):
+        tree = AreaTree.from_db()
+        tree.save(options['path'])
+        self.stdout.write('已写入 %d 个行政区划到 %s' % (len(tree.ids), options['path']))
@@ -1,3 +1,27 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+
+from .views import accepts_gzip, etag_matches
 
 # Create your tests here.
+
+
+class AreaTreeHeadersTest(SimpleTestCase):
+    """
+    行政区划树的请求头解析
+    """
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip, deflate, br'))
+        self.assertTrue(accepts_gzip('deflate;q=1.0, GZIP;q=0.5'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip(''))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('gzip;q=0.000, *'))
+        self.assertFalse(accepts_gzip('identity, *;q=0'))
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"xyz", "abc"', '"abc"'))
+        self.assertTrue(etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches('*', '"abc"'))
+        self.assertFalse(etag_matches('', '"abc"'))
+        self.assertFalse(etag_matches('"abc-gz"', '"abc"'))
@@ -0,0 +1,234 @@
+"""
+行政区划树
+行政区划数据不会变化，每个进程只加载一次，保存为按 id 排序的数组:
+    ids             区划 id
+    parents         上级区划的下标，省份为 -1
+    name_offsets    名称在 names 中的位置
+    child_offsets   下级区划在 children 中的位置，第 i 个区划的下级为 children[child_offsets[i]:child_offsets[i + 1]]
+    children        下级区划的下标，按 id 排列
+整棵树的 json 及其 gzip 压缩数据预先生成，可以直接返回
+可以先用 python manage.py build_area_tree 写入文件，各进程通过 mmap 共享同一份数据
+"""
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Area
+
+# 文件头: 标识, 字节序, 区划数, 下级区划数, 名称长度, json 长度, gzip 长度, 6 个数据段的偏移
+HEADER_FORMAT = '<4sI5Q6Q'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'MDAT'
+
+# 当前进程的行政区划树
+_area_tree = None
+_area_tree_lock = threading.Lock()
+
+
+class AreaTree(object):
+    """
+    数组保存的行政区划树，数组可以是 array 或 mmap 文件的 memoryview
+    """
+    def __init__(self, ids, parents, name_offsets, names, child_offsets, children, tree_json=None, tree_gzip=None):
+        self.ids = ids
+        self.parents = parents
+        self.name_offsets = name_offsets
+        self.names = names
+        self.child_offsets = child_offsets
+        self.children = children
+
+        # 省份，即没有上级的区划
+        self.roots = [i for i in range(len(ids)) if parents[i] == -1]
+
+        if tree_json is None:
+            tree_json = json.dumps(self.get_tree(), ensure_ascii=False, separators=(',', ':')).encode()
+            tree_gzip = gzip.compress(tree_json)
+        self.tree_json = tree_json
+        self.tree_gzip = tree_gzip
+        digest = hashlib.sha1(tree_json).hexdigest()
+        self.etag = '"%s"' % digest
+        self.gzip_etag = '"%s-gz"' % digest
+
+    @classmethod
+    def from_db(cls):
+        """
+        从数据库加载
+        """
+        rows = list(Area.objects.order_by('id').values_list('id', 'name', 'parent_id'))
+        ids = array('I', (row[0] for row in rows))
+        index_of = {area_id: index for index, area_id in enumerate(ids)}
+
+        # 上级不存在的区划按省份处理
+        parents = array('i', (index_of.get(row[2], -1) for row in rows))
+
+        names = bytearray()
+        name_offsets = array('I', [0])
+        for row in rows:
+            names += row[1].encode()
+            name_offsets.append(len(names))
+
+        subs = [[] for _ in rows]
+        for index, parent in enumerate(parents):
+            if parent != -1:
+                subs[parent].append(index)
+        child_offsets = array('I', [0])
+        children = array('I')
+        for sub_list in subs:
+            children.extend(sub_list)
+            child_offsets.append(len(children))
+
+        return cls(ids, parents, name_offsets, bytes(names), child_offsets, children)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        通过 mmap 读取 build_area_tree_file 写入的文件，多个进程共享同一份内存
+        """
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, little_endian, count, child_count, names_len, json_len, gzip_len, *offsets = struct.unpack_from(
+            HEADER_FORMAT, mm)
+        if magic != MAGIC or bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError('无效的行政区划文件: %s' % path)
+
+        view = memoryview(mm)
+        return cls(
+            ids=view[offsets[0]:offsets[0] + 4 * count].cast('I'),
+            parents=view[offsets[1]:offsets[1] + 4 * count].cast('i'),
+            name_offsets=view[offsets[2]:offsets[2] + 4 * (count + 1)].cast('I'),
+            names=view[offsets[3]:offsets[3] + names_len],
+            child_offsets=view[offsets[4]:offsets[4] + 4 * (count + 1)].cast('I'),
+            children=view[offsets[5]:offsets[5] + 4 * child_count].cast('I'),
+            tree_json=mm[offsets[5] + 4 * child_count:offsets[5] + 4 * child_count + json_len],
+            tree_gzip=mm[offsets[5] + 4 * child_count + json_len:offsets[5] + 4 * child_count + json_len + gzip_len],
+        )
+
+    def save(self, path):
+        """
+        写入文件，先写入临时文件再重命名
+        """
+        dir_name = os.path.dirname(path)
+        os.makedirs(dir_name, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'\0' * HEADER_SIZE)
+                offsets = []
+                for data in (self.ids, self.parents, self.name_offsets, self.names, self.child_offsets,
+                             self.children):
+                    f.write(b'\0' * (-f.tell() % 8))
+                    offsets.append(f.tell())
+                    f.write(bytes(data))
+                f.write(self.tree_json)
+                f.write(self.tree_gzip)
+
+                f.seek(0)
+                f.write(struct.pack(HEADER_FORMAT, MAGIC, sys.byteorder == 'little', len(self.ids), len(self.children),
+                                    len(self.names), len(self.tree_json), len(self.tree_gzip), *offsets))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def index(self, area_id):
+        """
+        :return: 区划的下标，不存在时返回 None
+        """
+        try:
+            area_id = int(area_id)
+        except (TypeError, ValueError):
+            return None
+        index = bisect_left(self.ids, area_id)
+        if index < len(self.ids) and self.ids[index] == area_id:
+            return index
+        return None
+
+    def get_name(self, area_id):
+        index = self.index(area_id)
+        return None if index is None else self._name(index)
+
+    def _name(self, index):
+        return bytes(self.names[self.name_offsets[index]:self.name_offsets[index + 1]]).decode()
+
+    def get_parent_id(self, area_id):
+        """
+        :return: 上级区划 id，省份或区划不存在时返回 None
+        """
+        index = self.index(area_id)
+        if index is None or self.parents[index] == -1:
+            return None
+        return self.ids[self.parents[index]]
+
+    def _subs(self, index):
+        return self.children[self.child_offsets[index]:self.child_offsets[index + 1]]
+
+    def get_provinces(self):
+        """
+        :return: [{'id': 省份id, 'name': 名称}, ...]
+        """
+        return [{'id': self.ids[index], 'name': self._name(index)} for index in self.roots]
+
+    def get_area(self, area_id):
+        """
+        :return: {'id': 区划id, 'name': 名称, 'subs': [{'id': 下级区划id, 'name': 名称}, ...]}，区划不存在时返回 None
+        """
+        index = self.index(area_id)
+        if index is None:
+            return None
+        return {
+            'id': self.ids[index],
+            'name': self._name(index),
+            'subs': [{'id': self.ids[sub], 'name': self._name(sub)} for sub in self._subs(index)],
+        }
+
+    def get_tree(self):
+        """
+        :return: 省-市-区县 完整的树 [{'id': 省份id, 'name': 名称, 'subs': [...]}, ...]
+        """
+        def build(index):
+            node = {'id': self.ids[index], 'name': self._name(index)}
+            subs = self._subs(index)
+            if len(subs):
+                node['subs'] = [build(sub) for sub in subs]
+            return node
+        return [build(index) for index in self.roots]
+
+    def is_child(self, parent_id, area_id):
+        """
+        判断 area_id 是否为 parent_id 的直接下级，parent_id 为 None 时判断 area_id 是否为省份
+        """
+        index = self.index(area_id)
+        if index is None:
+            return False
+        if parent_id is None:
+            return self.parents[index] == -1
+        parent = self.index(parent_id)
+        return parent is not None and self.parents[index] == parent
+
+
+def get_area_tree():
+    """
+    获取当前进程的行政区划树，配置的文件存在时通过 mmap 读取，否则从数据库加载
+    """
+    global _area_tree
+    if _area_tree is None:
+        with _area_tree_lock:
+            if _area_tree is None:
+                path = getattr(settings, 'AREA_TREE_FILE', None)
+                if path and os.path.exists(path):
+                    _area_tree = AreaTree.from_file(path)
+                else:
+                    _area_tree = AreaTree.from_db()
+    return _area_tree
@@ -8,7 +8,7 @@ router = DefaultRouter()
 router.register(r'areas', views.AreasViewSet, base_name='areas')
 
 urlpatterns = [
-
+    url(r'^areas/tree/$', views.AreaTreeView.as_view()),  # 完整的行政区划树
 ]
 
 urlpatterns += router.urls
@@ -1,14 +1,17 @@
-from django.shortcuts import render
-from rest_framework.viewsets import ReadOnlyModelViewSet
-from rest_framework_extensions.cache.mixins import CacheResponseMixin
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import ViewSet
 
-from .models import Area
-from . import serializers
+from .tree import get_area_tree
 
 # Create your views here.
 
 
-class AreasViewSet(CacheResponseMixin, ReadOnlyModelViewSet):
+class AreasViewSet(ViewSet):
     """
     list:
     返回所有省份的信息
@@ -16,26 +19,66 @@ class AreasViewSet(CacheResponseMixin, ReadOnlyModelViewSet):
     retrieve:
     返回特定省或市的下属行政规划区域
     """
-    # queryset = Area.objects.all()
-    pagination_class = None  # 关闭分页处理
+    def list(self, request):
+        return Response(get_area_tree().get_provinces())
+
+    def retrieve(self, request, pk=None):
+        area = get_area_tree().get_area(pk)
+        if area is None:
+            raise NotFound()
+        return Response(area)
+
+
+def accepts_gzip(accept_encoding):
+    """
+    判断 Accept-Encoding 请求头是否接受 gzip，q=0 表示不接受，未列出 gzip 时按 * 判断
+    :param accept_encoding: Accept-Encoding 请求头
+    """
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+    return qvalues.get('gzip', qvalues.get('*', 0.0)) > 0
 
-    def get_queryset(self):
-        """
-        提供数据集
-        """
-        if self.action == 'list':
-            return Area.objects.filter(parent=None)
-        else:
-            return Area.objects.all()
-
-    def get_serializer_class(self):
-        """
-        提供序列化器
-        """
-        if self.action == 'list':
-            return serializers.AreaSerializer
-        else:
-            return serializers.SubAreaSerializer
 
+def etag_matches(if_none_match, etag):
+    """
+    判断 If-None-Match 请求头是否匹配 ETag，支持多个 ETag、* 及弱验证器 W/ (按弱比较)
+    :param if_none_match: If-None-Match 请求头
+    """
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in etags)
 
 
+class AreaTreeView(APIView):
+    """
+    一次返回 省-市-区县 完整的行政区划树，区县没有 subs 字段
+    返回预先生成的 json，客户端支持时直接返回 gzip 压缩后的数据，通过 ETag 判断客户端缓存是否有效
+    gzip 与未压缩的数据内容不同，使用不同的 ETag
+    """
+    def get(self, request):
+        tree = get_area_tree()
+        gzipped = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        etag = tree.gzip_etag if gzipped else tree.etag
+
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(tree.tree_gzip if gzipped else tree.tree_json,
+                                    content_type='application/json; charset=utf-8')
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,5 @@
+# 批量操作购物车时，一次请求最多包含的操作数
+CART_BATCH_OPERATIONS_LIMIT = 100
+
+# 购物车中商品种类的上限，登录合并购物车时超出的商品不再加入
+CART_MAX_SKU_COUNT = 100
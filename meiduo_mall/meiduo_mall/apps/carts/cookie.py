@@ -0,0 +1,123 @@
+"""
+未登录用户购物车 cookie 的编码与解码
+
+cookie 格式（urlsafe base64，去掉末尾的 =）：
+    版本号(1字节) + 商品数据 + 签名(8字节)
+商品数据为每件商品依次写入两个 varint：
+    sku_id, count << 1 | selected
+签名为对版本号与商品数据计算的 HMAC-SHA1 的前 8 个字节
+"""
+import base64
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+# cookie 格式版本号
+CART_COOKIE_VERSION = 1
+
+# 签名长度，单位字节
+CART_COOKIE_SIGNATURE_LENGTH = 8
+
+CART_COOKIE_SALT = 'carts.cookie'
+
+# 已初始化密钥的 hmac 对象，避免每次签名都重新派生密钥
+_hmac_base = None
+
+
+def _sign(data):
+    """
+    计算签名，与 django.utils.crypto.salted_hmac 的结果一致
+    """
+    global _hmac_base
+    if _hmac_base is None:
+        key = hashlib.sha1((CART_COOKIE_SALT + settings.SECRET_KEY).encode()).digest()
+        _hmac_base = hmac.new(key, digestmod=hashlib.sha1)
+
+    mac = _hmac_base.copy()
+    mac.update(data)
+    return mac.digest()[:CART_COOKIE_SIGNATURE_LENGTH]
+
+
+def _write_varint(buf, value):
+    """
+    以 varint 格式向 buf 中写入非负整数
+    """
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data, pos):
+    """
+    从 data 的 pos 位置读取一个 varint
+    :return: (value, 下一个读取位置)
+    """
+    byte = data[pos]
+    if byte < 0x80:
+        # 绝大多数数值只占一个字节
+        return byte, pos + 1
+
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_cart_cookie(cart_dict):
+    """
+    编码购物车数据
+    :param cart_dict: {sku_id: {'count': count, 'selected': selected}, ...}
+    :return: cookie 字符串
+    """
+    buf = bytearray([CART_COOKIE_VERSION])
+    for sku_id, item in cart_dict.items():
+        _write_varint(buf, int(sku_id))
+        _write_varint(buf, int(item['count']) << 1 | bool(item['selected']))
+
+    data = bytes(buf)
+    return base64.urlsafe_b64encode(data + _sign(data)).rstrip(b'=').decode()
+
+
+def decode_cart_cookie(cart_str):
+    """
+    解码购物车数据，格式错误、签名不正确时返回空购物车
+    :param cart_str: cookie 字符串
+    :return: {sku_id: {'count': count, 'selected': selected}, ...}
+    """
+    if not cart_str:
+        return {}
+
+    try:
+        raw = base64.urlsafe_b64decode(cart_str.encode() + b'=' * (-len(cart_str) % 4))
+    except (ValueError, TypeError):
+        return {}
+
+    if len(raw) <= CART_COOKIE_SIGNATURE_LENGTH:
+        return {}
+
+    data, signature = raw[:-CART_COOKIE_SIGNATURE_LENGTH], raw[-CART_COOKIE_SIGNATURE_LENGTH:]
+    if data[0] != CART_COOKIE_VERSION or not constant_time_compare(signature, _sign(data)):
+        return {}
+
+    cart_dict = {}
+    pos = 1
+    try:
+        while pos < len(data):
+            sku_id, pos = _read_varint(data, pos)
+            value, pos = _read_varint(data, pos)
+            cart_dict[sku_id] = {
+                'count': value >> 1,
+                'selected': bool(value & 1)
+            }
+    except IndexError:
+        return {}
+
+    return cart_dict
@@ -0,0 +1,37 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from carts.repository import PackedRedisCartStorage
+
+
+class Command(BaseCommand):
+    """
+    把原有结构（hash + set）的购物车迁移为单 hash 结构
+    可以在服务运行时执行，每个用户的迁移在 lua 脚本中原子完成
+    """
+    help = '迁移购物车到单 hash 存储结构'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每次 SCAN 的键数量')
+
+    def handle(self, *args, **options):
+        redis_conn = get_redis_connection('cart')
+        storage = PackedRedisCartStorage()
+        pattern = re.compile(r'^cart_(?:selected_)?(\d+)$')
+
+        migrated = set()
+        for key in redis_conn.scan_iter(match='cart_*', count=options['batch_size']):
+            match = pattern.match(key.decode())
+            if match is None:
+                continue
+
+            user_id = int(match.group(1))
+            if user_id in migrated:
+                continue
+
+            storage.migrate(user_id)
+            migrated.add(user_id)
+
+        self.stdout.write('迁移完成，共 %d 个用户的购物车' % len(migrated))
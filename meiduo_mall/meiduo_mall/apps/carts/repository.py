@@ -0,0 +1,437 @@
+"""
+登录用户购物车的数据仓库
+
+视图、订单、登录合并购物车都通过 CartRepository 读写购物车，
+具体的存储由配置 CART_STORAGE_CLASS 指定：
+
+RedisCartStorage（原有结构）
+    hash  cart_<user_id>           {sku_id: count}
+    set   cart_selected_<user_id>  {sku_id, ...}
+
+PackedRedisCartStorage（单 hash 结构）
+    hash  cart_packed_<user_id>    {sku_id: count << 1 | selected}
+    读写时在 lua 脚本中把原有结构的数据原子地迁移过来，可以在线切换
+
+MemoryCartStorage
+    保存在进程内存中，用于测试与压测，不依赖 redis
+
+存储类的批量操作接收的购物车数据格式均为
+    {sku_id: {'count': count, 'selected': selected}, ...}
+增加、修改、删除统一通过 apply 批量执行，每个批量操作在 redis 中只有一次网络往返
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+
+
+# 登录合并购物车时计算商品数量的策略
+# overwrite: 使用 cookie 中的数量，sum: 数量相加，max: 取较大的数量
+MERGE_POLICIES = ('overwrite', 'sum', 'max')
+
+MERGE_COUNT_FUNCTION = """
+local function merge_count(policy, origin, count)
+    if not origin or policy == 'overwrite' then
+        return count
+    end
+    if policy == 'sum' then
+        return tonumber(origin) + count
+    end
+    return math.max(tonumber(origin), count)
+end
+"""
+
+
+class RedisCartStorage(object):
+    """
+    hash 保存商品数量，set 保存勾选的商品
+    """
+    # 全选：把 hash 中的所有商品加入勾选 set
+    # KEYS: cart_<user_id>, cart_selected_<user_id>
+    SELECT_ALL_SCRIPT = """
+    local sku_ids = redis.call('hkeys', KEYS[1])
+    for i = 1, #sku_ids do
+        redis.call('sadd', KEYS[2], sku_ids[i])
+    end
+    return #sku_ids
+    """
+
+    # 合并购物车，只写入 cookie 中的商品，超过数量上限的新商品不再加入
+    # KEYS: cart_<user_id>, cart_selected_<user_id>
+    # ARGV: policy, max_count, sku_id, count, selected, ...
+    MERGE_SCRIPT = MERGE_COUNT_FUNCTION + """
+    local size = redis.call('hlen', KEYS[1])
+    for i = 3, #ARGV, 3 do
+        local origin = redis.call('hget', KEYS[1], ARGV[i])
+        if origin or size < tonumber(ARGV[2]) then
+            if not origin then
+                size = size + 1
+            end
+            redis.call('hset', KEYS[1], ARGV[i], merge_count(ARGV[1], origin, tonumber(ARGV[i + 1])))
+            if ARGV[i + 2] == '1' then
+                redis.call('sadd', KEYS[2], ARGV[i])
+            end
+        end
+    end
+    return size
+    """
+
+    def __init__(self):
+        self.redis_conn = get_redis_connection('cart')
+        self.select_all_script = self.redis_conn.register_script(self.SELECT_ALL_SCRIPT)
+        self.merge_script = self.redis_conn.register_script(self.MERGE_SCRIPT)
+
+    def apply(self, user_id, added, updated, removed):
+        """
+        在一个 pipeline 中批量执行增加、修改、删除
+        :param added: 增加数量的商品，勾选时设置为勾选
+        :param updated: 修改数量和勾选状态的商品
+        :param removed: 删除的商品 id 列表
+        """
+        pl = self.redis_conn.pipeline()
+        for sku_id, item in added.items():
+            pl.hincrby('cart_%s' % user_id, sku_id, item['count'])
+            if item['selected']:
+                pl.sadd('cart_selected_%s' % user_id, sku_id)
+
+        if updated:
+            pl.hmset('cart_%s' % user_id, {sku_id: item['count'] for sku_id, item in updated.items()})
+        for sku_id, item in updated.items():
+            if item['selected']:
+                pl.sadd('cart_selected_%s' % user_id, sku_id)
+            else:
+                pl.srem('cart_selected_%s' % user_id, sku_id)
+
+        if removed:
+            pl.hdel('cart_%s' % user_id, *removed)
+            pl.srem('cart_selected_%s' % user_id, *removed)
+        pl.execute()
+
+    def select_all(self, user_id, selected):
+        """全选或取消全选"""
+        if selected:
+            self.select_all_script(keys=['cart_%s' % user_id, 'cart_selected_%s' % user_id])
+        else:
+            self.redis_conn.delete('cart_selected_%s' % user_id)
+
+    def merge(self, user_id, cart_dict, policy, max_count):
+        """合并购物车，勾选的商品设置为勾选"""
+        args = [policy, max_count]
+        for sku_id, item in cart_dict.items():
+            args.extend([sku_id, item['count'], int(item['selected'])])
+        self.merge_script(keys=['cart_%s' % user_id, 'cart_selected_%s' % user_id], args=args)
+
+    def get_all(self, user_id):
+        """
+        :return: {sku_id: {'count': count, 'selected': selected}, ...}
+        """
+        pl = self.redis_conn.pipeline()
+        pl.hgetall('cart_%s' % user_id)
+        pl.smembers('cart_selected_%s' % user_id)
+        redis_cart, cart_selected = pl.execute()
+
+        cart_dict = {}
+        for sku_id, count in redis_cart.items():
+            cart_dict[int(sku_id)] = {
+                'count': int(count),
+                'selected': sku_id in cart_selected
+            }
+        return cart_dict
+
+
+# 把原有结构的购物车迁移到单 hash 结构，迁移期间新结构中已写入的商品优先
+# KEYS: cart_packed_<user_id>, cart_<user_id>, cart_selected_<user_id>
+MIGRATE_SCRIPT = """
+local function migrate()
+    if redis.call('exists', KEYS[2]) == 0 and redis.call('exists', KEYS[3]) == 0 then
+        return
+    end
+    local old = redis.call('hgetall', KEYS[2])
+    for i = 1, #old, 2 do
+        if redis.call('hexists', KEYS[1], old[i]) == 0 then
+            local selected = redis.call('sismember', KEYS[3], old[i])
+            redis.call('hset', KEYS[1], old[i], tonumber(old[i + 1]) * 2 + selected)
+        end
+    end
+    redis.call('del', KEYS[2], KEYS[3])
+end
+migrate()
+"""
+
+# 批量增加、修改、删除
+# ARGV: 增加的商品数 n, n 组 (sku_id, count, selected),
+#       修改的商品数 m, m 组 (sku_id, count << 1 | selected),
+#       删除的 sku_id, ...
+APPLY_SCRIPT = MIGRATE_SCRIPT + """
+local pos = 2
+for i = 1, tonumber(ARGV[1]) do
+    local value = tonumber(redis.call('hget', KEYS[1], ARGV[pos]) or '0')
+    local selected = value % 2
+    if ARGV[pos + 2] == '1' then
+        selected = 1
+    end
+    local count = (value - value % 2) / 2 + tonumber(ARGV[pos + 1])
+    redis.call('hset', KEYS[1], ARGV[pos], count * 2 + selected)
+    pos = pos + 3
+end
+local updated = tonumber(ARGV[pos])
+pos = pos + 1
+for i = 1, updated do
+    redis.call('hset', KEYS[1], ARGV[pos], ARGV[pos + 1])
+    pos = pos + 2
+end
+for i = pos, #ARGV do
+    redis.call('hdel', KEYS[1], ARGV[i])
+end
+return 1
+"""
+
+# ARGV: selected
+SELECT_ALL_SCRIPT = MIGRATE_SCRIPT + """
+local values = redis.call('hgetall', KEYS[1])
+local selected = tonumber(ARGV[1])
+for i = 1, #values, 2 do
+    local value = tonumber(values[i + 1])
+    redis.call('hset', KEYS[1], values[i], value - value % 2 + selected)
+end
+return 1
+"""
+
+# 合并购物车，只写入 cookie 中的商品，超过数量上限的新商品不再加入
+# ARGV: policy, max_count, sku_id, count, selected, ...
+MERGE_SCRIPT = MIGRATE_SCRIPT + MERGE_COUNT_FUNCTION + """
+local size = redis.call('hlen', KEYS[1])
+for i = 3, #ARGV, 3 do
+    local value = redis.call('hget', KEYS[1], ARGV[i])
+    if value or size < tonumber(ARGV[2]) then
+        local origin = nil
+        local selected = tonumber(ARGV[i + 2])
+        if value then
+            value = tonumber(value)
+            origin = (value - value % 2) / 2
+            selected = math.max(selected, value % 2)
+        else
+            size = size + 1
+        end
+        local count = merge_count(ARGV[1], origin, tonumber(ARGV[i + 1]))
+        redis.call('hset', KEYS[1], ARGV[i], count * 2 + selected)
+    end
+end
+return size
+"""
+
+GET_ALL_SCRIPT = MIGRATE_SCRIPT + """
+return redis.call('hgetall', KEYS[1])
+"""
+
+
+class PackedRedisCartStorage(object):
+    """
+    一个 hash 保存购物车，值为 count << 1 | selected
+    """
+    def __init__(self):
+        self.redis_conn = get_redis_connection('cart')
+        self.apply_script = self.redis_conn.register_script(APPLY_SCRIPT)
+        self.select_all_script = self.redis_conn.register_script(SELECT_ALL_SCRIPT)
+        self.merge_script = self.redis_conn.register_script(MERGE_SCRIPT)
+        self.get_all_script = self.redis_conn.register_script(GET_ALL_SCRIPT)
+        self.migrate_script = self.redis_conn.register_script(MIGRATE_SCRIPT)
+
+    @staticmethod
+    def get_keys(user_id):
+        return ['cart_packed_%s' % user_id, 'cart_%s' % user_id, 'cart_selected_%s' % user_id]
+
+    def migrate(self, user_id):
+        """把用户原有结构的购物车迁移过来"""
+        self.migrate_script(keys=self.get_keys(user_id))
+
+    def apply(self, user_id, added, updated, removed):
+        args = [len(added)]
+        for sku_id, item in added.items():
+            args.extend([sku_id, item['count'], int(item['selected'])])
+        args.append(len(updated))
+        for sku_id, item in updated.items():
+            args.extend([sku_id, item['count'] << 1 | int(item['selected'])])
+        args.extend(removed)
+        self.apply_script(keys=self.get_keys(user_id), args=args)
+
+    def select_all(self, user_id, selected):
+        self.select_all_script(keys=self.get_keys(user_id), args=[int(selected)])
+
+    def merge(self, user_id, cart_dict, policy, max_count):
+        args = [policy, max_count]
+        for sku_id, item in cart_dict.items():
+            args.extend([sku_id, item['count'], int(item['selected'])])
+        self.merge_script(keys=self.get_keys(user_id), args=args)
+
+    def get_all(self, user_id):
+        values = self.get_all_script(keys=self.get_keys(user_id))
+
+        cart_dict = {}
+        for i in range(0, len(values), 2):
+            value = int(values[i + 1])
+            cart_dict[int(values[i])] = {
+                'count': value >> 1,
+                'selected': bool(value & 1)
+            }
+        return cart_dict
+
+
+class MemoryCartStorage(object):
+    """
+    购物车保存在进程内存中，同一进程内的实例共享数据
+    """
+    carts = {}
+    lock = threading.Lock()
+
+    def _get_cart(self, user_id):
+        return self.carts.setdefault(user_id, OrderedDict())
+
+    def apply(self, user_id, added, updated, removed):
+        with self.lock:
+            cart = self._get_cart(user_id)
+            for sku_id, item in added.items():
+                origin = cart.get(sku_id)
+                if origin is None:
+                    cart[sku_id] = {'count': item['count'], 'selected': bool(item['selected'])}
+                else:
+                    origin['count'] += item['count']
+                    origin['selected'] = origin['selected'] or bool(item['selected'])
+
+            for sku_id, item in updated.items():
+                cart[sku_id] = {'count': item['count'], 'selected': bool(item['selected'])}
+
+            for sku_id in removed:
+                cart.pop(sku_id, None)
+
+    def select_all(self, user_id, selected):
+        with self.lock:
+            for item in self._get_cart(user_id).values():
+                item['selected'] = selected
+
+    def merge(self, user_id, cart_dict, policy, max_count):
+        with self.lock:
+            cart = self._get_cart(user_id)
+            for sku_id, item in cart_dict.items():
+                origin = cart.get(sku_id)
+                if origin is None:
+                    if len(cart) >= max_count:
+                        continue
+                    count = item['count']
+                elif policy == 'sum':
+                    count = origin['count'] + item['count']
+                elif policy == 'max':
+                    count = max(origin['count'], item['count'])
+                else:
+                    count = item['count']
+
+                cart[sku_id] = {
+                    'count': count,
+                    'selected': bool(item['selected']) or (origin is not None and origin['selected'])
+                }
+
+    def get_all(self, user_id):
+        with self.lock:
+            return {sku_id: dict(item) for sku_id, item in self.carts.get(user_id, {}).items()}
+
+    @classmethod
+    def clear(cls):
+        """清空所有购物车"""
+        with cls.lock:
+            cls.carts.clear()
+
+
+def get_cart_storage():
+    """
+    按照配置创建购物车存储对象
+    """
+    return import_string(settings.CART_STORAGE_CLASS)()
+
+
+class CartRepository(object):
+    """
+    登录用户的购物车
+    """
+    def __init__(self, user_id, storage=None):
+        self.user_id = user_id
+        self.storage = storage or get_cart_storage()
+
+    def add(self, sku_id, count, selected=True):
+        """
+        添加商品，已有的商品数量累加
+        """
+        self.add_many({sku_id: {'count': count, 'selected': selected}})
+
+    def add_many(self, cart_dict):
+        """
+        批量添加商品
+        :param cart_dict: {sku_id: {'count': count, 'selected': selected}, ...}
+        """
+        self.apply(added=cart_dict)
+
+    def update(self, sku_id, count, selected):
+        """
+        修改商品数量与勾选状态
+        """
+        self.update_many({sku_id: {'count': count, 'selected': selected}})
+
+    def update_many(self, cart_dict):
+        """
+        批量修改商品数量与勾选状态
+        :param cart_dict: {sku_id: {'count': count, 'selected': selected}, ...}
+        """
+        self.apply(updated=cart_dict)
+
+    def remove(self, *sku_id_list):
+        """
+        删除商品
+        """
+        self.apply(removed=sku_id_list)
+
+    def apply(self, added=None, updated=None, removed=None):
+        """
+        一次批量执行增加、修改、删除，三者的商品不能重复
+        :param added: 增加数量的商品 {sku_id: {'count': count, 'selected': selected}, ...}
+        :param updated: 修改数量与勾选状态的商品 {sku_id: {'count': count, 'selected': selected}, ...}
+        :param removed: 删除的商品 id 列表
+        """
+        added = added or {}
+        updated = updated or {}
+        removed = list(removed or [])
+        if added or updated or removed:
+            self.storage.apply(self.user_id, added, updated, removed)
+
+    def select_all(self, selected=True):
+        """
+        全选或取消全选
+        """
+        self.storage.select_all(self.user_id, selected)
+
+    def merge(self, cart_dict, policy='overwrite', max_count=None):
+        """
+        合并未登录时 cookie 中的购物车，只写入 cookie 中的商品，在 redis 中一次原子完成
+        :param cart_dict: {sku_id: {'count': count, 'selected': selected}, ...}
+        :param policy: 已有商品的数量合并策略 overwrite/sum/max，勾选的商品总是设置为勾选
+        :param max_count: 购物车商品种类上限，达到上限后不再加入新的商品
+        """
+        if policy not in MERGE_POLICIES:
+            raise ValueError('不支持的购物车合并策略: %s' % policy)
+
+        if cart_dict:
+            self.storage.merge(self.user_id, cart_dict, policy, max_count if max_count is not None else 2 ** 31)
+
+    def get_all(self):
+        """
+        查询购物车中的所有商品
+        :return: {sku_id: {'count': count, 'selected': selected}, ...}
+        """
+        return self.storage.get_all(self.user_id)
+
+    def get_selected(self):
+        """
+        查询勾选的商品
+        :return: {sku_id: count, ...}
+        """
+        return {sku_id: item['count'] for sku_id, item in self.get_all().items() if item['selected']}
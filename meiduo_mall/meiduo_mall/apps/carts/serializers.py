@@ -1,6 +1,8 @@
 from rest_framework import serializers
 
 from goods.models import SKU
+from goods.utils import get_sku_cards
+from . import constants
 
 
 class CartSerializer(serializers.Serializer):
@@ -53,10 +55,53 @@ class CartDeleteSerializer(serializers.Serializer):
         return value
 
 
+class CartOperationSerializer(serializers.Serializer):
+    """
+    购物车批量操作中的单个操作
+    """
+    ACTION_CHOICES = (
+        ('add', '增加'),
+        ('update', '修改'),
+        ('delete', '删除'),
+    )
 
+    action = serializers.ChoiceField(label='操作', choices=ACTION_CHOICES)
+    sku_id = serializers.IntegerField(label='商品id', min_value=1)
+    count = serializers.IntegerField(label='数量', min_value=1, required=False)
+    selected = serializers.BooleanField(label='是否勾选', default=True)
 
+    def validate(self, attrs):
+        if attrs['action'] != 'delete' and 'count' not in attrs:
+            raise serializers.ValidationError('缺少商品数量')
+        return attrs
 
 
+class CartBatchSerializer(serializers.Serializer):
+    """
+    购物车批量操作序列化器
+    """
+    operations = CartOperationSerializer(label='操作列表', many=True)
+
+    def validate_operations(self, value):
+        if not value:
+            raise serializers.ValidationError('操作列表不能为空')
+        if len(value) > constants.CART_BATCH_OPERATIONS_LIMIT:
+            raise serializers.ValidationError('一次最多%d个操作' % constants.CART_BATCH_OPERATIONS_LIMIT)
+
+        # 一次获取所有商品数据进行校验
+        sku_cards = get_sku_cards(set(operation['sku_id'] for operation in value))
+        for operation in value:
+            sku = sku_cards.get(operation['sku_id'])
+            if sku is None:
+                raise serializers.ValidationError('商品不存在')
+            if operation['action'] != 'delete' and sku['stock'] < operation['count']:
+                raise serializers.ValidationError('商品库存不足')
 
+        return value
 
 
+class CartSelectAllSerializer(serializers.Serializer):
+    """
+    购物车全选序列化器
+    """
+    selected = serializers.BooleanField(label='全选')
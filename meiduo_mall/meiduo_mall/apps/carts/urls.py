@@ -4,7 +4,9 @@ from . import views
 
 
 urlpatterns = [
-    url(r'^cart/$', views.CartView.as_view())
+    url(r'^cart/$', views.CartView.as_view()),
+    url(r'^cart/batch/$', views.CartBatchView.as_view()),  # 购物车批量操作
+    url(r'^cart/selection/$', views.CartSelectAllView.as_view()),  # 购物车全选
 ]
 
 
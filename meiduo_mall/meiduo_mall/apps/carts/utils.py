@@ -1,7 +1,8 @@
-import base64
-import pickle
+from django.conf import settings
 
-from django_redis import get_redis_connection
+from .cookie import decode_cart_cookie
+from .repository import CartRepository
+from . import constants
 
 
 def merge_cart_cookie_to_redis(request, response, user):
@@ -13,38 +14,13 @@ def merge_cart_cookie_to_redis(request, response, user):
     :return:
     """
     # 从 cookie 中取出购物车数据
-    cart_str = request.COOKIES.get('cart')
+    cookie_cart = decode_cart_cookie(request.COOKIES.get('cart'))
 
-    if not cart_str:
+    if not cookie_cart:
         return response
 
-    cookie_cart = pickle.loads(base64.b64decode(cart_str.encode()))
-
-    # 从 redis 中取出购物车数据
-    redis_conn = get_redis_connection('cart')
-    cart_redis = redis_conn.hgetall('cart_%s' % user.id)
-
-    # 把 redis 中取出的字典的键值对数据类型转换为 int
-    cart = {}
-    for sku_id, count in cart_redis.items():
-        cart[int(sku_id)] = int(count)
-
-    selected_sku_id_list = []
-    for sku_id, selected_count_dict in cookie_cart.items():
-        # 如果 redis 购物车中原有商品数据，数量覆盖，如果没有，添加记录
-        cart[sku_id] = selected_count_dict['count']
-
-        if selected_count_dict['selected']:
-            selected_sku_id_list.append(sku_id)
-
-    # 将 cookie 的购物车合并到 redis 中
-    pl = redis_conn.pipeline()
-    # 购物车数据
-    pl.hmset('cart_%s' % user.id, cart)
-    # 勾选状态
-    pl.sadd('cart_selected_%s' % user.id, *selected_sku_id_list)
-
-    pl.execute()
+    # 将 cookie 的购物车合并到 redis 中，已有商品的数量按照配置的策略合并，勾选的商品设置为勾选
+    CartRepository(user.id).merge(cookie_cart, settings.CART_MERGE_POLICY, constants.CART_MAX_SKU_COUNT)
 
     # 清楚 cookie 中的购物车数据
     response.delete_cookie('cart')
@@ -52,7 +28,74 @@ def merge_cart_cookie_to_redis(request, response, user):
     return response
 
 
-
-
-
-
+def reduce_cart_operations(operations):
+    """
+    把按顺序执行的购物车操作合并为互不重复的增加、修改、删除三组，便于一次批量执行
+    :param operations: [{'action': 'add'|'update'|'delete', 'sku_id':, 'count':, 'selected':}, ...]
+    :return: (added, updated, removed)
+        added: 在原有数量上增加的商品 {sku_id: {'count': count, 'selected': selected}, ...}
+        updated: 设置为指定数量与勾选状态的商品 {sku_id: {'count': count, 'selected': selected}, ...}
+        removed: 删除的商品 id 列表
+    """
+    added = {}
+    updated = {}
+    removed = []
+    for operation in operations:
+        sku_id = operation['sku_id']
+        action = operation['action']
+
+        if action == 'delete':
+            added.pop(sku_id, None)
+            updated.pop(sku_id, None)
+            if sku_id not in removed:
+                removed.append(sku_id)
+            continue
+
+        item = {'count': operation['count'], 'selected': operation['selected']}
+        if action == 'update':
+            added.pop(sku_id, None)
+            updated[sku_id] = item
+        elif sku_id in updated:
+            # 在设置的数量上继续增加，结果仍是设置为确定的数量
+            updated[sku_id] = {
+                'count': updated[sku_id]['count'] + item['count'],
+                'selected': updated[sku_id]['selected'] or item['selected']
+            }
+        elif sku_id in removed:
+            # 删除后重新添加，等价于设置为添加的数量
+            updated[sku_id] = item
+        elif sku_id in added:
+            added[sku_id] = {
+                'count': added[sku_id]['count'] + item['count'],
+                'selected': added[sku_id]['selected'] or item['selected']
+            }
+        else:
+            added[sku_id] = item
+
+        if sku_id in removed:
+            removed.remove(sku_id)
+
+    return added, updated, removed
+
+
+def apply_cart_operations(cart_dict, added, updated, removed):
+    """
+    在未登录用户 cookie 中的购物车上执行合并后的批量操作
+    """
+    for sku_id, item in added.items():
+        origin = cart_dict.get(sku_id)
+        if origin is None:
+            cart_dict[sku_id] = dict(item)
+        else:
+            cart_dict[sku_id] = {
+                'count': origin['count'] + item['count'],
+                'selected': origin['selected'] or item['selected']
+            }
+
+    for sku_id, item in updated.items():
+        cart_dict[sku_id] = dict(item)
+
+    for sku_id in removed:
+        cart_dict.pop(sku_id, None)
+
+    return cart_dict
@@ -1,14 +1,14 @@
-import base64
-import pickle
-
 from django.shortcuts import render
 from rest_framework import status
 from rest_framework.views import APIView
-from django_redis import get_redis_connection
 from rest_framework.response import Response
 
-from goods.models import SKU
-from .serializers import CartSerializer, CartsSKUSerializer, CartDeleteSerializer
+from goods.utils import get_sku_cards
+from .serializers import CartSerializer, CartsSKUSerializer, CartDeleteSerializer, CartBatchSerializer, \
+    CartSelectAllSerializer
+from .cookie import encode_cart_cookie, decode_cart_cookie
+from .repository import CartRepository
+from .utils import reduce_cart_operations, apply_cart_operations
 
 # Create your views here.
 
@@ -40,28 +40,13 @@ class CartView(APIView):
         # 保存购物车数据
         if user is not None and user.is_authenticated:
             # 用户已登录， 保存到 redis 中
-            redis_conn = get_redis_connection('cart')
-            pl = redis_conn.pipeline()
-
-            # 购物车数据 hash
-            pl.hincrby('cart_%s' % user.id, sku_id, count)
-
-            # 勾选 set
-            if selected:
-                pl.sadd('cart_selected_%s' % user.id, sku_id)
-
-            pl.execute()
+            CartRepository(user.id).add(sku_id, count, selected)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         else:
             # 用户未登录，保存到 cookie 中
             # 尝试从 cookie 中读取购物车数据
-            cart_str = request.COOKIES.get('cart')
-
-            if cart_str is not None:
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
-                cart_dict = {}
+            cart_dict = decode_cart_cookie(request.COOKIES.get('cart'))
 
             # 如果有相同商品，求和
             if sku_id in cart_dict:
@@ -73,7 +58,7 @@ class CartView(APIView):
                 'selected': selected
             }
 
-            cookie_cart = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cookie_cart = encode_cart_cookie(cart_dict)
 
             response = Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -92,40 +77,27 @@ class CartView(APIView):
             user = None
 
         if user is not None and user.is_authenticated:
-            # 如果用户登录，从 redis 中查询
-            redis_conn = get_redis_connection('cart')
-            redis_cart = redis_conn.hgetall('cart_%s' % user.id)
-            cart_selected = redis_conn.smembers('cart_selected_%s' % user.id)
-
-            # 将 redis 中的数据进行整合，形成一个字典，与 cookie 中解读的一致，方便数据库查询
-            cart_dict ={}
-            for sku_id, count in redis_cart.items():
-                cart_dict[int(sku_id)] = {
-                    'count': int(count),
-                    'selected': sku_id in cart_selected
-                }
+            # 如果用户登录，从 redis 中查询，形成一个字典，与 cookie 中解读的一致
+            cart_dict = CartRepository(user.id).get_all()
 
         else:
             # 如果用户未登录，从 cookie 中查询
-            cart_str = request.COOKIES.get('cart')
-
-            if cart_str is not None:
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
-                cart_dict = {}
+            cart_dict = decode_cart_cookie(request.COOKIES.get('cart'))
 
         sku_id_list = cart_dict.keys()
 
-        # 数据库查询 sku 对象
-        sku_obj_list = SKU.objects.filter(id__in=sku_id_list)
+        # 从缓存中批量获取商品卡片数据
+        sku_cards = get_sku_cards(sku_id_list)
 
         # 向结果集中补充 count 和 selected 字段
-        for sku in sku_obj_list:
-            sku.count = cart_dict[sku.id]['count']
-            sku.selected = cart_dict[sku.id]['selected']
+        sku_list = []
+        for sku_id, sku in sku_cards.items():
+            sku['count'] = cart_dict[sku_id]['count']
+            sku['selected'] = cart_dict[sku_id]['selected']
+            sku_list.append(sku)
 
         # 将数据序列化返回
-        serializer = CartsSKUSerializer(sku_obj_list, many=True)
+        serializer = CartsSKUSerializer(sku_list, many=True)
         return Response(serializer.data)
 
     def put(self, request):
@@ -146,28 +118,12 @@ class CartView(APIView):
 
         if user is not None and user.is_authenticated:
             # 用户已登录，修改 redis 中的数据
-            redis_conn = get_redis_connection('cart')
-            pl = redis_conn.pipeline()
-            pl.hset('cart_%s' % user.id, sku_id, count)
-
-            if selected:
-                # 勾选增加记录
-                pl.sadd('cart_selected_%s' % user.id, sku_id)
-            else:
-                # 未勾选，删除记录
-                pl.srem('cart_selected_%s' % user.id, sku_id)
-
-            pl.execute()
+            CartRepository(user.id).update(sku_id, count, selected)
             return Response(serializer.data)
 
         else:
             # 用户未登录，修改 cookie 中的数据
-            cart_str = request.COOKIES.get('cart')
-
-            if cart_str:
-                cart_dict = pickle.loads(base64.b16decode(cart_str.encode()))
-            else:
-                cart_dict = {}
+            cart_dict = decode_cart_cookie(request.COOKIES.get('cart'))
 
             if sku_id in cart_dict:
                 cart_dict[sku_id] = {
@@ -175,7 +131,7 @@ class CartView(APIView):
                     'selected': selected
                 }
 
-            cookie_cart = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cookie_cart = encode_cart_cookie(cart_dict)
 
             # 返回
             response = Response(serializer.data)
@@ -199,22 +155,11 @@ class CartView(APIView):
 
         if user is not None and user.is_authenticated:
             # 用户已登录，修改 redis 中的数据
-            redis_conn = get_redis_connection('cart')
-            pl = redis_conn.pipeline()
-
-            pl.hdel('cart_%s' % user.id, sku_id)
-            pl.srem('cart_selected_%s' % user.id, sku_id)
-
-            pl.execute()
+            CartRepository(user.id).remove(sku_id)
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             # 用户未登录，修改 cookie 中的数据
-            cart_str = request.COOKIES.get('cart')
-
-            if cart_str:
-                cart_dict = pickle.loads(base64.b16decode(cart_str.encode()))
-            else:
-                cart_dict = {}
+            cart_dict = decode_cart_cookie(request.COOKIES.get('cart'))
 
             response = Response(serializer.data)
 
@@ -222,31 +167,87 @@ class CartView(APIView):
                 # 删除字典的键值对
                 del cart_dict[sku_id]
 
-                cookie_cart = base64.b64encode(pickle.dumps(cart_dict)).decode()
+                cookie_cart = encode_cart_cookie(cart_dict)
 
                 response.set_cookie('cart', cookie_cart)
 
             return response
 
 
+class CartBatchView(APIView):
+    """
+    购物车批量操作
+    """
+    def perform_authentication(self, request):
+        """重写检查 JWT token 是否正确   忽略掉"""
+        pass
 
+    def post(self, request):
+        """
+        按顺序执行一组增加、修改、删除操作
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
+        # 合并为互不重复的增加、修改、删除，一次写入
+        added, updated, removed = reduce_cart_operations(serializer.validated_data['operations'])
 
+        # 判断用户是否登录
+        try:
+            user = request.user
+        except Exception:
+            user = None
 
+        if user is not None and user.is_authenticated:
+            # 用户已登录，一次批量修改 redis 中的数据
+            CartRepository(user.id).apply(added, updated, removed)
+            return Response(serializer.data)
 
+        else:
+            # 用户未登录，修改 cookie 中的数据
+            cart_dict = decode_cart_cookie(request.COOKIES.get('cart'))
+            cart_dict = apply_cart_operations(cart_dict, added, updated, removed)
 
+            response = Response(serializer.data)
+            response.set_cookie('cart', encode_cart_cookie(cart_dict))
 
+            return response
 
 
+class CartSelectAllView(APIView):
+    """
+    购物车全选
+    """
+    def perform_authentication(self, request):
+        """重写检查 JWT token 是否正确   忽略掉"""
+        pass
 
+    def put(self, request):
+        serializer = CartSelectAllSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        selected = serializer.validated_data['selected']
 
+        # 判断用户是否登录
+        try:
+            user = request.user
+        except Exception:
+            user = None
 
+        if user is not None and user.is_authenticated:
+            # 用户已登录，修改 redis 中的数据
+            CartRepository(user.id).select_all(selected)
+            return Response({'message': 'OK'})
 
+        else:
+            # 用户未登录，修改 cookie 中的数据
+            cart_dict = decode_cart_cookie(request.COOKIES.get('cart'))
 
+            response = Response({'message': 'OK'})
 
+            if cart_dict:
+                for item in cart_dict.values():
+                    item['selected'] = selected
 
+                response.set_cookie('cart', encode_cart_cookie(cart_dict))
 
-
-
-
-
+            return response
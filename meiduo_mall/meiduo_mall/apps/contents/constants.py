@@ -0,0 +1,2 @@
+# 广告内容修改后，两次生成主页静态文件的最小间隔，单位秒
+INDEX_HTML_MIN_INTERVAL = 10
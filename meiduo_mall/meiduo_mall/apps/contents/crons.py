@@ -1,57 +1,41 @@
-from collections import OrderedDict
 from django.conf import settings
+from django.db.models import Prefetch
 from django.template import loader
+from django_redis import get_redis_connection
 import os
 import time
 
-from goods.models import GoodsChannel
-from .models import ContentCategory
+from goods.static_html import record_static_html_deps, write_static_html
+from goods.utils import get_categories, get_categories_version
+from .models import ContentCategory, Content
+from .utils import get_contents_version
 
 
-def generate_static_index_html():
+def generate_static_index_html(force=False):
     """
-    生成静态的主页html文件
+    生成静态的主页html文件，分类菜单与广告内容的版本都没有变化时跳过
+    :param force: 是否强制生成
     """
     print('%s: generate_static_index_html' % time.ctime())
-    # 商品频道及分类菜单
-    # 使用有序字典保存类别的顺序
-    # categories = {
-    #     1: { # 组1
-    #         'channels': [{'id':, 'name':, 'url':},{}, {}...],
-    #         'sub_cats': [{'id':, 'name':, 'sub_cats':[{},{}]}, {}, {}, ..]
-    #     },
-    #     2: { # 组2
-    #
-    #     }
-    # }
-    categories = OrderedDict()
-    channels = GoodsChannel.objects.order_by('group_id', 'sequence')
-    for channel in channels:
-        group_id = channel.group_id  # 当前组
-
-        if group_id not in categories:
-            categories[group_id] = {'channels': [], 'sub_cats': []}
 
-        cat1 = channel.category  # 当前频道的类别
+    # 主页使用的数据的版本，需在读取数据前读取，版本号在修改提交后才增加，读取的数据不会比版本号旧
+    version = '%s:%s' % (get_categories_version(), get_contents_version())
+    redis_conn = get_redis_connection('default')
+    file_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'index.html')
+    if not force and redis_conn.get('index_html_version') == version.encode() and os.path.exists(file_path):
+        return
 
-        # 追加当前频道
-        categories[group_id]['channels'].append({
-            'id': cat1.id,
-            'name': cat1.name,
-            'url': channel.url
-        })
-        # 构建当前类别的子类别
-        for cat2 in cat1.goodscategory_set.all():
-            cat2.sub_cats = []
-            for cat3 in cat2.goodscategory_set.all():
-                cat2.sub_cats.append(cat3)
-            categories[group_id]['sub_cats'].append(cat2)
+    # 商品频道及分类菜单
+    categories = get_categories()
 
-    # 广告内容
+    # 广告内容，一次预取所有类别展示的内容，从主库查询，避免从库延迟时以旧内容标记为最新版本
     contents = {}
-    content_categories = ContentCategory.objects.all()
+    content_categories = ContentCategory.objects.using('default').prefetch_related(
+        Prefetch('content_set', queryset=Content.objects.using('default').filter(status=True).order_by('sequence'),
+                 to_attr='contents')
+    )
     for cat in content_categories:
-        contents[cat.key] = cat.content_set.filter(status=True).order_by('sequence')
+        contents[cat.key] = cat.contents
 
     # 渲染模板
     context = {
@@ -60,6 +44,9 @@ def generate_static_index_html():
     }
     template = loader.get_template('index.html')
     html_text = template.render(context)
-    file_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'index.html')
-    with open(file_path, 'w') as f:
-        f.write(html_text)
\ No newline at end of file
+    write_static_html('index.html', html_text)
+    record_static_html_deps({'index.html': ['menu']})
+
+    # 生成期间数据又有修改时不记录版本，下次执行时重新生成
+    if version == '%s:%s' % (get_categories_version(), get_contents_version()):
+        redis_conn.set('index_html_version', version)
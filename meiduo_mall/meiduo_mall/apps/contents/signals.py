@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Content, ContentCategory
+from .utils import incr_contents_version, schedule_index_html
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+@receiver(post_save, sender=ContentCategory)
+@receiver(post_delete, sender=ContentCategory)
+def content_changed(sender, instance, **kwargs):
+    """
+    广告内容修改后增加版本号，并调度生成主页静态文件
+    """
+    transaction.on_commit(incr_contents_version)
+    schedule_index_html()
@@ -0,0 +1,38 @@
+import time
+
+from django_redis import get_redis_connection
+
+from . import constants
+
+
+def get_contents_version():
+    """
+    获取广告内容的版本号
+    """
+    redis_conn = get_redis_connection('default')
+    version = redis_conn.get('contents_version')
+    if version is None:
+        # 版本号丢失时使用当前时间初始化，避免与之前的版本号重复
+        redis_conn.set('contents_version', int(time.time() * 1000), nx=True)
+        version = redis_conn.get('contents_version')
+    return int(version)
+
+
+def incr_contents_version():
+    """
+    广告内容修改后增加版本号
+    """
+    # 确保版本号已初始化
+    get_contents_version()
+    redis_conn = get_redis_connection('default')
+    redis_conn.incr('contents_version')
+
+
+def schedule_index_html():
+    """
+    调度异步任务生成主页静态文件，最小间隔内的多次修改合并为一次生成
+    """
+    redis_conn = get_redis_connection('default')
+    if redis_conn.set('index_html_lock', 1, nx=True, ex=constants.INDEX_HTML_MIN_INTERVAL):
+        from celery_tasks.htmls.tasks import regenerate_static_index_html
+        regenerate_static_index_html.apply_async(countdown=constants.INDEX_HTML_MIN_INTERVAL)
@@ -51,7 +51,6 @@ class GoodsCategoryAdmin(admin.ModelAdmin):
         generate_static_list_search_html.delay()
 
     def delete_model(self, request, obj):
-        sku_id = obj.sku.id
         obj.delete()
         from celery_tasks.htmls.tasks import generate_static_list_search_html
         generate_static_list_search_html.delay()
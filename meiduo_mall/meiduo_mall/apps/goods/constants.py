@@ -1,3 +1,77 @@
 # 热销产品显示数量
 HOT_SKUS_COUNT_LIMIT = 2
 
+# 商品卡片缓存有效期，单位秒
+SKU_CARD_REDIS_EXPIRES = 24 * 60 * 60
+
+# 加载上架商品 id 集合时，每条 SADD 命令包含的 id 数量
+LAUNCHED_SKU_IDS_BATCH_SIZE = 1000
+
+# 加载上架商品 id 集合时临时键的有效期，单位秒，加载进程异常退出时自动删除
+LAUNCHED_SKU_IDS_TMP_EXPIRES = 10 * 60
+
+# 批量生成静态详情页时，每个任务包含的商品 SPU 数量
+STATIC_HTML_GOODS_CHUNK_SIZE = 20
+
+# 生成的静态文件权限，供 nginx 读取
+STATIC_HTML_FILE_MODE = 0o644
+
+# 数据修改后，延迟多少秒重新生成依赖的静态页面，期间的修改合并处理
+STATIC_HTML_FANOUT_DELAY = 5
+
+# 静态页面重新生成任务调度标记的有效期，防止任务异常退出后不再调度
+STATIC_HTML_FANOUT_LOCK_EXPIRES = 60
+
+# 商品分类菜单缓存有效期，单位秒
+CATEGORIES_CACHE_EXPIRES = 24 * 60 * 60
+
+# 热销排行的时间窗口，窗口名称: 天数
+HOT_SKUS_WINDOWS = {'day': 1, 'week': 7}
+
+# 合并多天的热销排行时每早一天销量的权重系数，第 n 天前的销量乘以 decay^n
+HOT_SKUS_DAILY_DECAY = 0.8
+
+# 热销排行按天统计的销量有效期，单位秒
+HOT_SKUS_DAILY_EXPIRES = 8 * 24 * 60 * 60
+
+# 按时间窗口合并后的热销排行缓存有效期，单位秒
+HOT_SKUS_WINDOW_CACHE_EXPIRES = 60
+
+# 读取热销排行时最多检查的商品数量，跳过已下架的商品
+HOT_SKUS_MAX_SCAN = 100
+
+# 缓存商品列表的前几页
+SKU_LIST_CACHE_PAGES = 3
+
+# 预热商品列表缓存的排序方式，与前端列表页一致
+SKU_LIST_CACHE_ORDERINGS = ('-create_time', 'price', 'sales')
+
+# 商品列表缓存有效期，单位秒
+SKU_LIST_CACHE_EXPIRES = 60 * 60
+
+# 商品列表缓存失效后，延迟多少秒预热，期间的修改合并处理
+SKU_LIST_WARM_DELAY = 2
+
+# 数据修改后，延迟多少秒批量更新搜索索引，期间的修改合并处理
+SEARCH_INDEX_DELAY = 2
+
+# 搜索索引更新任务调度标记的有效期，防止任务异常退出后不再调度
+SEARCH_INDEX_LOCK_EXPIRES = 60
+
+# 批量更新搜索索引时，每批查询的对象数量
+SEARCH_INDEX_BATCH_SIZE = 500
+
+# 重建搜索索引期间记录修改的标记有效期，重建命令异常退出后不再记录
+SEARCH_INDEX_REBUILD_EXPIRES = 24 * 60 * 60
+
+# 输入提示默认返回的数量
+SUGGEST_LIMIT = 10
+
+# 输入提示最多返回的数量，前缀树每个节点保存的提示数量
+SUGGEST_MAX_LIMIT = 20
+
+# 前缀树中提示路径的最大长度，更长的输入按此长度截取匹配
+SUGGEST_MAX_KEY_LENGTH = 20
+
+# 各进程读取修改集合增量更新输入提示的间隔，单位秒
+SUGGEST_REFRESH_INTERVAL = 1
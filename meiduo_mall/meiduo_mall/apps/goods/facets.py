@@ -0,0 +1,220 @@
+"""
+商品列表按品牌、规格筛选
+每个类别的上架商品按 id 排序编号，每个品牌、每个规格值对应一个 python 整数位图，第 i 位表示第 i 个商品
+筛选和统计数量只需对位图做与、或运算，不需要关联查询 tb_sku_specification
+不同商品 SPU 的规格是分别保存的，按 规格名称 + 选项值 合并，如所有 "颜色: 金色" 的选项为同一个筛选项
+位图在每个进程中按类别的版本号缓存，数据修改后增加版本号
+"""
+import time
+
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .models import Brand, SKU, SKUSpecification
+
+# 当前进程中缓存的类别筛选数据 {类别id: (版本号, FacetIndex)}
+_facet_index_memo = {}
+
+
+def _popcount(bitmap):
+    return bin(bitmap).count('1')
+
+
+def _to_bitmap(positions, size):
+    """
+    由编号列表生成位图，先写入 bytearray 再一次转换为整数，避免逐位或运算反复复制大整数
+    """
+    data = bytearray((size + 7) // 8)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+class FacetIndex(object):
+    """
+    一个类别的筛选位图
+    """
+    def __init__(self, category_id):
+        self.category_id = category_id
+        # 按编号排列的商品 id
+        self.sku_ids = []
+        # 全部商品的位图
+        self.all = 0
+        # {品牌id: 位图}
+        self.brand_bitmaps = {}
+        self.brand_names = {}
+        # 规格名称列表，按首次出现的顺序
+        self.spec_names = []
+        # {(规格名称, 选项值): 位图}
+        self.option_bitmaps = {}
+        # {选项id: (规格名称, 选项值)}
+        self.option_groups = {}
+        # {(规格名称, 选项值): 最小的选项id}，作为筛选项的 id 返回
+        self.group_ids = {}
+
+    def build(self):
+        """
+        从主库查询，版本号增加后立即重建，避免从库延迟
+        """
+        skus = SKU.objects.using('default').filter(category_id=self.category_id, is_launched=True).order_by(
+            'id').values_list('id', 'goods__brand_id')
+        positions = {}
+        brand_positions = {}
+        for position, (sku_id, brand_id) in enumerate(skus):
+            positions[sku_id] = position
+            self.sku_ids.append(sku_id)
+            brand_positions.setdefault(brand_id, []).append(position)
+        size = len(self.sku_ids)
+        self.all = (1 << size) - 1
+        self.brand_bitmaps = {brand_id: _to_bitmap(position_list, size)
+                              for brand_id, position_list in brand_positions.items()}
+        self.brand_names = dict(Brand.objects.using('default').filter(
+            id__in=self.brand_bitmaps).values_list('id', 'name'))
+
+        sku_specs = SKUSpecification.objects.using('default').filter(
+            sku__category_id=self.category_id, sku__is_launched=True).order_by('spec_id', 'option_id').values_list(
+            'sku_id', 'spec__name', 'option_id', 'option__value')
+        option_positions = {}
+        for sku_id, spec_name, option_id, value in sku_specs:
+            position = positions.get(sku_id)
+            if position is None:
+                continue
+            group = (spec_name, value)
+            if spec_name not in self.spec_names:
+                self.spec_names.append(spec_name)
+            option_positions.setdefault(group, []).append(position)
+            self.option_groups[option_id] = group
+            self.group_ids[group] = min(option_id, self.group_ids.get(group, option_id))
+        self.option_bitmaps = {group: _to_bitmap(position_list, size)
+                               for group, position_list in option_positions.items()}
+        return self
+
+    def get_filter_bitmaps(self, brand_ids, option_ids):
+        """
+        计算各筛选条件的位图，同一规格的多个值之间为或，不同规格、品牌之间为与
+        :return: (品牌位图, {规格名称: 位图}, 是否没有商品满足)，没有筛选品牌时品牌位图为 None
+        """
+        brand_bitmap = None
+        if brand_ids:
+            brand_bitmap = 0
+            for brand_id in brand_ids:
+                brand_bitmap |= self.brand_bitmaps.get(brand_id, 0)
+
+        spec_bitmaps = {}
+        empty = False
+        for option_id in option_ids:
+            group = self.option_groups.get(option_id)
+            if group is None:
+                # 不属于该类别的选项，没有商品满足
+                empty = True
+                continue
+            spec_bitmaps[group[0]] = spec_bitmaps.get(group[0], 0) | self.option_bitmaps[group]
+        return brand_bitmap, spec_bitmaps, empty
+
+    @staticmethod
+    def _intersect(bitmap, brand_bitmap, spec_bitmaps, exclude_spec=None):
+        if brand_bitmap is not None:
+            bitmap &= brand_bitmap
+        for spec_name, spec_bitmap in spec_bitmaps.items():
+            if spec_name != exclude_spec:
+                bitmap &= spec_bitmap
+        return bitmap
+
+    def filter(self, brand_ids=(), option_ids=()):
+        """
+        :return: 满足筛选条件的商品 id 列表
+        """
+        brand_bitmap, spec_bitmaps, empty = self.get_filter_bitmaps(brand_ids, option_ids)
+        if empty:
+            return []
+        bitmap = self._intersect(self.all, brand_bitmap, spec_bitmaps)
+
+        sku_ids = []
+        while bitmap:
+            low = bitmap & -bitmap
+            sku_ids.append(self.sku_ids[low.bit_length() - 1])
+            bitmap ^= low
+        return sku_ids
+
+    def get_counts(self, brand_ids=(), option_ids=()):
+        """
+        统计各筛选项的商品数量
+        每个筛选项的数量按 其他维度的筛选条件 计算，同一维度内选择多个值时数量不会变为 0
+        """
+        brand_bitmap, spec_bitmaps, empty = self.get_filter_bitmaps(brand_ids, option_ids)
+        # 有无效选项时全部数量为 0
+        base_all = 0 if empty else self.all
+
+        brand_base = self._intersect(base_all, None, spec_bitmaps)
+        brands = [{'id': brand_id, 'name': self.brand_names.get(brand_id), 'count': _popcount(bitmap & brand_base)}
+                  for brand_id, bitmap in self.brand_bitmaps.items()]
+        brands.sort(key=lambda item: (-item['count'], item['id']))
+
+        specs = []
+        for spec_name in self.spec_names:
+            base = self._intersect(base_all, brand_bitmap, spec_bitmaps, exclude_spec=spec_name)
+            options = [{'id': self.group_ids[group], 'value': group[1], 'count': _popcount(bitmap & base)}
+                       for group, bitmap in self.option_bitmaps.items() if group[0] == spec_name]
+            specs.append({'name': spec_name, 'options': options})
+
+        return {
+            'count': _popcount(self._intersect(base_all, brand_bitmap, spec_bitmaps)),
+            'brands': brands,
+            'specs': specs,
+        }
+
+
+def get_facets_version(category_id):
+    """
+    获取类别筛选数据的版本号
+    """
+    redis_conn = get_redis_connection('goods')
+    key = 'facets_version_%s' % category_id
+    version = redis_conn.get(key)
+    if version is None:
+        # 版本号丢失时使用当前时间初始化，避免与之前的版本号重复
+        redis_conn.set(key, int(time.time() * 1000), nx=True)
+        version = redis_conn.get(key)
+    return int(version)
+
+
+def get_facet_index(category_id):
+    """
+    获取类别的筛选位图，当前进程已构建过该版本时直接使用
+    """
+    category_id = int(category_id)
+    version = get_facets_version(category_id)
+    memo = _facet_index_memo.get(category_id)
+    if memo is not None and memo[0] == version:
+        return memo[1]
+
+    index = FacetIndex(category_id).build()
+    _facet_index_memo[category_id] = (version, index)
+    return index
+
+
+def mark_facets_changed(category_id_list):
+    """
+    商品、规格、品牌修改后，事务提交后增加所在类别的版本号，各进程下次请求时重建位图
+    """
+    category_id_list = set(category_id_list) - {None}
+    if not category_id_list:
+        return
+
+    def incr():
+        redis_conn = get_redis_connection('goods')
+        for category_id in category_id_list:
+            # 确保版本号已初始化
+            get_facets_version(category_id)
+            redis_conn.incr('facets_version_%s' % category_id)
+
+    transaction.on_commit(incr)
+
+
+def mark_facets_changed_for_goods(goods_id_list):
+    """
+    增加商品 SPU 下 sku 所在类别的版本号
+    """
+    category_id_list = SKU.objects.using('default').filter(goods_id__in=goods_id_list).values_list(
+        'category_id', flat=True).distinct()
+    mark_facets_changed(list(category_id_list))
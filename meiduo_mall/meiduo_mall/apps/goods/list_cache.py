@@ -0,0 +1,148 @@
+import json
+
+from django_redis import get_redis_connection
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from meiduo_mall.renders import JSONRender
+from meiduo_mall.utils.pagination import StandardResultsSetPagination
+from .models import SKU
+from .serializers import SKUSerializer
+from . import constants
+
+# 类别版本号没有变化时才写入缓存，避免写入缓存失效前查询到的数据
+# KEYS: sku_list_<category_id>, sku_list_version_<category_id>  ARGV: 版本号, 缓存字段, 缓存数据, 有效期
+SAVE_SKU_LIST_PAGE_SCRIPT = """
+local version = redis.call('get', KEYS[2]) or '0'
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('hset', KEYS[1], ARGV[2], ARGV[3])
+redis.call('expire', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+def get_sku_list_cache_params(request, ordering_fields):
+    """
+    判断商品列表请求是否可以使用缓存
+    :param ordering_fields: 允许的排序字段
+    :return: (排序, 页码, 每页数量)，不能使用缓存时返回 None
+    """
+    query_params = request.query_params
+    pagination = StandardResultsSetPagination
+    try:
+        page = int(query_params.get(pagination.page_query_param, 1))
+        page_size = int(query_params.get(pagination.page_size_query_param, pagination.page_size))
+    except ValueError:
+        return None
+    if not 1 <= page <= constants.SKU_LIST_CACHE_PAGES or not 0 < page_size <= pagination.max_page_size:
+        return None
+
+    ordering = query_params.get('ordering', '')
+    if ordering and ordering.lstrip('-') not in ordering_fields:
+        return None
+
+    return ordering, page, page_size
+
+
+def get_sku_list_page(category_id, ordering, page, page_size):
+    """
+    获取一页商品列表数据，优先读取缓存
+    :return: (商品总数, 序列化后的商品列表 json)，页码超出范围时返回 None
+    """
+    redis_conn = get_redis_connection('goods')
+    field = '%s:%s:%s' % (ordering, page_size, page)
+    pl = redis_conn.pipeline()
+    pl.hget('sku_list_%s' % category_id, field)
+    pl.get('sku_list_version_%s' % category_id)
+    cached, version = pl.execute()
+
+    if cached is not None:
+        count, results = cached.split(b'\n', 1)
+        return int(count), results
+
+    count, results = query_sku_list_page(category_id, ordering, page, page_size)
+    if page > 1 and (page - 1) * page_size >= count:
+        return None
+
+    script = redis_conn.register_script(SAVE_SKU_LIST_PAGE_SCRIPT)
+    script(keys=['sku_list_%s' % category_id, 'sku_list_version_%s' % category_id],
+           args=[version or b'0', field, b'%d\n' % count + results, constants.SKU_LIST_CACHE_EXPIRES])
+    return count, results
+
+
+def query_sku_list_page(category_id, ordering, page, page_size):
+    """
+    从数据库查询一页商品列表并序列化
+    数据修改后缓存会立即失效，从主库查询，避免从库延迟导致缓存旧数据
+    :return: (商品总数, 序列化后的商品列表 json)
+    """
+    queryset = SKU.objects.using('default').filter(category_id=category_id, is_launched=True)
+    if ordering:
+        queryset = queryset.order_by(ordering)
+    count = queryset.count()
+    start = (page - 1) * page_size
+    serializer = SKUSerializer(queryset[start:start + page_size], many=True)
+    return count, JSONRender().render(serializer.data)
+
+
+def render_sku_list_page(request, count, results, page, page_size):
+    """
+    组装与分页响应相同的 json，翻页链接根据当前请求生成
+    """
+    pagination = StandardResultsSetPagination
+    url = request.build_absolute_uri()
+
+    next_link = None
+    if page * page_size < count:
+        next_link = replace_query_param(url, pagination.page_query_param, page + 1)
+
+    previous_link = None
+    if page > 1:
+        if page == 2:
+            previous_link = remove_query_param(url, pagination.page_query_param)
+        else:
+            previous_link = replace_query_param(url, pagination.page_query_param, page - 1)
+
+    return b'{"count":%d,"next":%s,"previous":%s,"results":%s}' % (
+        count, json.dumps(next_link).encode(), json.dumps(previous_link).encode(), results)
+
+
+def clear_sku_list_cache(category_id_list):
+    """
+    商品价格、销量、上下架等修改后，删除所在类别的商品列表缓存，并调度异步任务预热
+    """
+    category_id_list = set(category_id_list)
+    if not category_id_list:
+        return
+
+    redis_conn = get_redis_connection('goods')
+    pl = redis_conn.pipeline()
+    for category_id in category_id_list:
+        pl.incr('sku_list_version_%s' % category_id)
+        pl.delete('sku_list_%s' % category_id)
+    pl.execute()
+
+    from celery_tasks.caches.tasks import warm_sku_list_cache
+    for category_id in category_id_list:
+        # 已有等待执行的预热任务时不再重复调度
+        if redis_conn.set('sku_list_warm_lock_%s' % category_id, 1, nx=True, ex=constants.SKU_LIST_WARM_DELAY):
+            warm_sku_list_cache.apply_async(args=[category_id], countdown=constants.SKU_LIST_WARM_DELAY)
+
+
+def clear_sku_list_cache_for_skus(sku_id_list):
+    """
+    删除商品所在类别的商品列表缓存
+    """
+    category_id_list = SKU.objects.using('default').filter(id__in=sku_id_list).values_list('category_id', flat=True)
+    clear_sku_list_cache(category_id_list)
+
+
+def warm_sku_list_pages(category_id):
+    """
+    预热类别的前几页商品列表缓存
+    """
+    for ordering in constants.SKU_LIST_CACHE_ORDERINGS:
+        for page in range(1, constants.SKU_LIST_CACHE_PAGES + 1):
+            if get_sku_list_page(category_id, ordering, page, StandardResultsSetPagination.page_size) is None:
+                break
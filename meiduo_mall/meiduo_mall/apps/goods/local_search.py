@@ -0,0 +1,369 @@
+"""
+纯 python 实现的本地搜索引擎，elasticsearch 不可用时作为 haystack 的备用后端
+索引按 文档字段 -> 词 -> 倒排表 的结构写入一个文件，查询时通过 mmap 读取，不需要整体加载到内存
+分词: 英文和数字按单词切分，中文按相邻两个字（bigram）切分，索引时同时写入单个汉字，单字查询也能匹配
+排序: BM25，查询词之间为 AND 关系
+"""
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, SearchNode, log_query
+from haystack.models import SearchResult
+
+logger = logging.getLogger('django')
+
+# 文件头: 标识, 版本, 字节序, 文档数, 词数, 倒排表项数, 平均文档长度, 元数据长度, 元数据偏移, 9 个数据段的偏移
+HEADER_FORMAT = '<4sII3Qd11Q'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'MDSI'
+VERSION = 2
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 未指定结束位置时返回的结果数量
+DEFAULT_PAGE_SIZE = 10
+
+TOKEN_RE = re.compile(r'[a-z0-9]+|[一-鿿]+')
+
+
+def tokenize(text, unigrams=False):
+    """
+    分词，英文和数字按单词，中文按 bigram，只有一个汉字时作为一个词
+    :param unigrams: 是否同时切分出每个汉字，建立索引时使用，查询单个汉字时可以匹配包含该字的 bigram 的文档
+    :return: 词列表
+    """
+    tokens = []
+    for word in TOKEN_RE.findall(text.lower()):
+        if word[0] < '一':
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+            if unigrams:
+                tokens.extend(word)
+    return tokens
+
+
+def _contains(values, value):
+    """在有序数组中二分查找"""
+    position = bisect_left(values, value)
+    return position < len(values) and values[position] == value
+
+
+def _write_array(f, values):
+    """写入数组并按 8 字节对齐，返回写入的起始位置"""
+    offset = f.tell()
+    values.tofile(f)
+    f.write(b'\0' * (-f.tell() % 8))
+    return offset
+
+
+def build_local_index(path, documents, django_ct, content_field='text'):
+    """
+    构建本地搜索索引文件，先写入临时文件再重命名，查询中的进程在下次查询时读取新文件
+    :param documents: 可迭代的文档字典，包含 id、索引内容字段以及需要返回的字段
+    :param django_ct: 文档对应的模型，如 goods.sku
+    :param content_field: 建立索引的内容字段
+    :return: 文档数量
+    """
+    doc_ids = array('I')
+    doc_lens = array('H')
+    doc_offsets = array('Q', [0])
+    postings = {}
+
+    dir_name = os.path.dirname(path)
+    os.makedirs(dir_name, exist_ok=True)
+
+    # 文档的返回字段先写入临时文件，避免全部保存在内存中
+    with tempfile.TemporaryFile(dir=dir_name) as stored:
+        for ordinal, document in enumerate(documents):
+            tokens = tokenize(document[content_field], unigrams=True)
+            doc_ids.append(int(document['id']))
+            doc_lens.append(min(len(tokens), 65535))
+
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                posting = postings.get(token)
+                if posting is None:
+                    posting = postings[token] = (array('I'), array('H'))
+                posting[0].append(ordinal)
+                posting[1].append(min(count, 65535))
+
+            stored.write(json.dumps(document, ensure_ascii=False, separators=(',', ':'), default=str).encode())
+            doc_offsets.append(stored.tell())
+
+        terms = sorted(postings)
+        term_blob = bytearray()
+        term_offsets = array('Q', [0])
+        posting_offsets = array('Q', [0])
+        for term in terms:
+            term_blob += term.encode()
+            term_offsets.append(len(term_blob))
+            posting_offsets.append(posting_offsets[-1] + len(postings[term][0]))
+
+        doc_count = len(doc_ids)
+        avg_len = sum(doc_lens) / doc_count if doc_count else 0.0
+        meta = json.dumps({
+            'django_ct': django_ct,
+            'content_field': content_field,
+            'max_len': max(doc_lens) if doc_count else 0,
+        }).encode()
+
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'\0' * HEADER_SIZE)
+                meta_offset = f.tell()
+                f.write(meta)
+                f.write(b'\0' * (-f.tell() % 8))
+                offsets = [
+                    _write_array(f, doc_ids),
+                    _write_array(f, doc_lens),
+                    _write_array(f, doc_offsets),
+                ]
+
+                # 文档返回字段
+                offsets.append(f.tell())
+                stored.seek(0)
+                while True:
+                    chunk = stored.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                f.write(b'\0' * (-f.tell() % 8))
+
+                offsets.append(_write_array(f, term_offsets))
+                offsets.append(f.tell())
+                f.write(term_blob)
+                f.write(b'\0' * (-f.tell() % 8))
+                offsets.append(_write_array(f, posting_offsets))
+
+                # 倒排表：文档序号与词频分别连续存放
+                offsets.append(f.tell())
+                for term in terms:
+                    postings[term][0].tofile(f)
+                f.write(b'\0' * (-f.tell() % 8))
+                offsets.append(f.tell())
+                for term in terms:
+                    postings[term][1].tofile(f)
+
+                f.seek(0)
+                f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, sys.byteorder == 'little', doc_count, len(terms),
+                                    posting_offsets[-1], avg_len, len(meta), meta_offset, *offsets))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    return doc_count
+
+
+class LocalIndex(object):
+    """
+    通过 mmap 读取本地搜索索引文件
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, little_endian, self.doc_count, self.term_count, posting_count, self.avg_len, meta_len,
+         meta_offset, *offsets) = struct.unpack_from(HEADER_FORMAT, self.mm)
+        if magic != MAGIC or version != VERSION or bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError('无效的本地搜索索引文件: %s' % path)
+
+        meta = json.loads(self.mm[meta_offset:meta_offset + meta_len].decode())
+        self.app_label, self.model_name = meta['django_ct'].split('.')
+        self.max_len = meta['max_len']
+
+        view = memoryview(self.mm)
+        n, t, p = self.doc_count, self.term_count, posting_count
+        self.doc_ids = view[offsets[0]:offsets[0] + 4 * n].cast('I')
+        self.doc_lens = view[offsets[1]:offsets[1] + 2 * n].cast('H')
+        self.doc_offsets = view[offsets[2]:offsets[2] + 8 * (n + 1)].cast('Q')
+        self.stored_start = offsets[3]
+        self.term_offsets = view[offsets[4]:offsets[4] + 8 * (t + 1)].cast('Q')
+        self.term_start = offsets[5]
+        self.posting_offsets = view[offsets[6]:offsets[6] + 8 * (t + 1)].cast('Q')
+        self.posting_docs = view[offsets[7]:offsets[7] + 4 * p].cast('I')
+        self.posting_tfs = view[offsets[8]:offsets[8] + 2 * p].cast('H')
+
+    def get_term(self, i):
+        start = self.term_start + self.term_offsets[i]
+        end = self.term_start + self.term_offsets[i + 1]
+        return self.mm[start:end].decode()
+
+    def find_term(self, term):
+        """
+        二分查找词的序号，不存在时返回 None
+        """
+        low, high = 0, self.term_count
+        while low < high:
+            mid = (low + high) // 2
+            if self.get_term(mid) < term:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.term_count and self.get_term(low) == term:
+            return low
+        return None
+
+    def get_postings(self, i):
+        """
+        :return: (文档序号, 词频)
+        """
+        start, end = self.posting_offsets[i], self.posting_offsets[i + 1]
+        return self.posting_docs[start:end], self.posting_tfs[start:end]
+
+    def get_document(self, ordinal):
+        start = self.stored_start + self.doc_offsets[ordinal]
+        end = self.stored_start + self.doc_offsets[ordinal + 1]
+        return json.loads(self.mm[start:end].decode())
+
+    def get_length_weights(self, idf, tf):
+        """
+        词频相同时，BM25 得分只与文档长度有关，预先计算每种文档长度的得分
+        :return: 按文档长度索引的得分列表
+        """
+        return [idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_len))
+                for length in range(self.max_len + 1)]
+
+    def search(self, query_string, start=0, end=DEFAULT_PAGE_SIZE):
+        """
+        查询包含所有查询词的文档，按 BM25 得分降序排列，得分相同时按文档序号排列
+        :return: (总数, [(文档序号, 得分), ...])
+        """
+        terms = set(tokenize(query_string))
+        if not terms or not self.doc_count:
+            return 0, []
+
+        postings = []
+        for term in terms:
+            i = self.find_term(term)
+            if i is None:
+                return 0, []
+            postings.append(self.get_postings(i))
+
+        # 从最短的倒排表开始求交集，候选文档较少时在倒排表中二分查找，否则使用集合求交集
+        postings.sort(key=lambda posting: len(posting[0]))
+        matched = postings[0][0].tolist()
+        for docs, tfs in postings[1:]:
+            if len(matched) * 16 < len(docs):
+                matched = [ordinal for ordinal in matched if _contains(docs, ordinal)]
+            else:
+                matched = sorted(set(matched).intersection(docs.tolist()))
+            if not matched:
+                return 0, []
+
+        doc_lens = self.doc_lens
+        lengths = [doc_lens[ordinal] for ordinal in matched]
+        scores = [0.0] * len(matched)
+        for docs, tfs in postings:
+            idf = math.log(1 + (self.doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            if max(tfs) == 1:
+                weights = self.get_length_weights(idf, 1)
+                scores = [score + weights[length] for score, length in zip(scores, lengths)]
+            else:
+                weights = {}
+                for i, ordinal in enumerate(matched):
+                    tf = tfs[bisect_left(docs, ordinal)]
+                    if tf not in weights:
+                        weights[tf] = self.get_length_weights(idf, tf)
+                    scores[i] += weights[tf][lengths[i]]
+
+        # nlargest 是稳定的，得分相同时保持文档序号顺序
+        top = heapq.nlargest(end, range(len(matched)), key=scores.__getitem__)
+        return len(matched), [(matched[i], scores[i]) for i in top[start:end]]
+
+
+class LocalSearchBackend(BaseSearchBackend):
+    """
+    本地搜索后端，索引由 python manage.py build_local_search_index 构建，不支持单条更新
+    """
+    def __init__(self, connection_alias, **connection_options):
+        super().__init__(connection_alias, **connection_options)
+        self.path = connection_options['PATH']
+        self.index = None
+
+    def get_index(self):
+        """
+        打开索引文件，文件重建后重新打开
+        旧索引不主动关闭，其他线程可能仍在查询，不再被引用后随 mmap 一起释放
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        index = self.index
+        if index is None or index.mtime != mtime:
+            index = self.index = LocalIndex(self.path)
+        return index
+
+    def update(self, index, iterable, commit=True):
+        pass
+
+    def remove(self, obj_or_string, commit=True):
+        pass
+
+    def clear(self, models=None, commit=True):
+        pass
+
+    @log_query
+    def search(self, query_string, start_offset=0, end_offset=None, result_class=None, **kwargs):
+        index = self.get_index()
+        if index is None:
+            logger.error('本地搜索索引文件不存在: %s' % self.path)
+            return {'results': [], 'hits': 0}
+
+        if end_offset is None:
+            end_offset = start_offset + DEFAULT_PAGE_SIZE
+        hits, top = index.search(query_string, start_offset, end_offset)
+
+        result_class = result_class or SearchResult
+        results = []
+        for ordinal, score in top:
+            document = index.get_document(ordinal)
+            results.append(result_class(index.app_label, index.model_name, document['id'], score, **document))
+        return {'results': results, 'hits': hits}
+
+
+class LocalSearchQuery(BaseSearchQuery):
+    """
+    合并所有查询条件的值作为查询词，不支持字段、排除等条件
+    """
+    def build_query(self):
+        values = []
+        self._collect_values(self.query_filter, values)
+        return ' '.join(values)
+
+    def _collect_values(self, node, values):
+        for child in node.children:
+            if isinstance(child, SearchNode):
+                self._collect_values(child, values)
+            else:
+                value = child[1]
+                values.append(value.query_string if hasattr(value, 'query_string') else str(value))
+
+    def build_query_fragment(self, field, filter_type, value):
+        return value.query_string if hasattr(value, 'query_string') else str(value)
+
+
+class LocalSearchEngine(BaseEngine):
+    backend = LocalSearchBackend
+    query = LocalSearchQuery
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from haystack import connections
+
+from goods.local_search import build_local_index
+from goods.models import SKU
+
+
+class Command(BaseCommand):
+    """
+    构建本地搜索索引文件，elasticsearch 不可用时搜索视图使用该索引
+    索引文件写入完成后替换旧文件，查询中的进程在下次查询时读取新文件
+    """
+    help = '构建本地搜索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--using', default='local', help='haystack 连接名称')
+
+    def handle(self, *args, **options):
+        using = options['using']
+        backend = connections[using].get_backend()
+        index = connections[using].get_unified_index().get_index(SKU)
+        content_field = index.get_content_field()
+        start = time.time()
+
+        def documents():
+            # 从主库流式读取，避免一次加载全部商品
+            for sku in index.index_queryset(using=using).using('default').iterator():
+                prepared = index.full_prepare(sku)
+                yield {name: prepared[field.index_fieldname] for name, field in index.fields.items()}
+
+        count = build_local_index(backend.path, documents(), SKU._meta.label_lower, content_field)
+        self.stdout.write('已写入 %d 个商品到 %s，用时 %.1f 秒' % (count, backend.path, time.time() - start))
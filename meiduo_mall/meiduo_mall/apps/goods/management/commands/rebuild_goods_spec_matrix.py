@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from goods.models import Goods
+from goods.spec_matrix import save_goods_spec_matrix
+
+
+class Command(BaseCommand):
+    """
+    重新生成所有商品的规格组合，直接导入 sql 数据等不触发信号的修改后执行
+    """
+    help = '重新生成商品规格组合'
+
+    def handle(self, *args, **options):
+        count = 0
+        for goods_id in Goods.objects.using('default').order_by('id').values_list('id', flat=True).iterator():
+            save_goods_spec_matrix(goods_id)
+            count += 1
+        self.stdout.write('已生成 %d 个商品的规格组合' % count)
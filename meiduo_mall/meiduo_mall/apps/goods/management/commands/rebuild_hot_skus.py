@@ -0,0 +1,51 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from goods import constants
+from goods.models import SKU
+from goods.utils import save_hot_skus, get_hot_skus_daily_key
+from orders.models import OrderGoods
+
+
+class Command(BaseCommand):
+    """
+    从数据库重建热销排行：累计排行使用 SKU 销量，按天排行使用最近的订单商品
+    """
+    help = '重建商品热销排行'
+
+    def handle(self, *args, **options):
+        # 累计排行
+        all_time = {}
+        for sku_id, category_id, sales in SKU.objects.filter(is_launched=True).values_list(
+                'id', 'category_id', 'sales').iterator():
+            all_time.setdefault(category_id, {})[sku_id] = sales
+
+        # 按天排行，保留最长时间窗口内的订单
+        today = timezone.localdate()
+        start_date = today - timedelta(days=max(constants.HOT_SKUS_WINDOWS.values()) - 1)
+        start_time = timezone.make_aware(datetime.combine(start_date, time.min))
+        daily = {}
+        order_goods = OrderGoods.objects.filter(create_time__gte=start_time).values_list(
+            'create_time', 'sku_id', 'sku__category_id', 'count')
+        for create_time, sku_id, category_id, count in order_goods.iterator():
+            key = get_hot_skus_daily_key(category_id, timezone.localtime(create_time).date())
+            scores = daily.setdefault(key, {})
+            scores[sku_id] = scores.get(sku_id, 0) + count
+
+        for category_id, sku_scores in all_time.items():
+            save_hot_skus('hot_skus_%s' % category_id, sku_scores)
+
+        for key, sku_scores in daily.items():
+            save_hot_skus(key, sku_scores, constants.HOT_SKUS_DAILY_EXPIRES)
+
+        # 删除按时间窗口合并的缓存
+        redis_conn = get_redis_connection('goods')
+        window_keys = ['hot_skus_%s_%s' % (category_id, window)
+                       for category_id in all_time for window in constants.HOT_SKUS_WINDOWS]
+        if window_keys:
+            redis_conn.delete(*window_keys)
+
+        self.stdout.write('重建完成，共 %d 个类别，%d 个按天排行' % (len(all_time), len(daily)))
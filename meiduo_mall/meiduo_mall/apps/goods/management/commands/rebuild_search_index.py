@@ -0,0 +1,159 @@
+import time
+from multiprocessing import Pool
+
+from django import db
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from elasticsearch.helpers import bulk
+from haystack import connections
+from haystack.constants import ID
+from haystack.exceptions import SkipDocument
+
+from goods.search_signals import start_search_index_rebuild, finish_search_index_rebuild
+
+# 工作进程中使用的搜索引擎连接与新索引名称
+_worker_options = {}
+
+
+def prepare_document(backend, index, obj):
+    """
+    生成与 haystack 写入 elasticsearch 时相同的文档
+    """
+    prepped_data = index.full_prepare(obj)
+    document = {}
+    for key, value in prepped_data.items():
+        document[key] = backend._from_python(value)
+    document['_id'] = document[ID]
+    return document
+
+
+def _init_worker(using, index_name, chunk_size):
+    """工作进程初始化，重新建立搜索引擎连接，不复用主进程的连接"""
+    connections.reload(using)
+    _worker_options.update(using=using, index_name=index_name, chunk_size=chunk_size)
+
+
+def _index_range(args):
+    """
+    工作进程中流式读取一段主键范围内的对象，批量写入新索引
+    :return: 写入的文档数量
+    """
+    model, start_pk, end_pk = args
+    using = _worker_options['using']
+    backend = connections[using].get_backend()
+    index = connections[using].get_unified_index().get_index(model)
+
+    queryset = index.index_queryset(using=using).using('default').filter(
+        pk__gte=start_pk, pk__lte=end_pk).order_by('pk')
+
+    def documents():
+        for obj in queryset.iterator():
+            try:
+                yield prepare_document(backend, index, obj)
+            except SkipDocument:
+                continue
+
+    count, errors = bulk(backend.conn, documents(), index=_worker_options['index_name'], doc_type='modelresult',
+                         chunk_size=_worker_options['chunk_size'])
+    return count
+
+
+class Command(BaseCommand):
+    """
+    重建 elasticsearch 索引，不影响线上搜索
+    1. 创建带时间戳的新索引
+    2. 多进程按主键范围流式读取数据，使用 bulk 接口写入新索引
+    3. 原子地将别名（INDEX_NAME）切换到新索引，删除旧索引
+    4. 重建期间索引队列中的修改（包括删除、下架）以及修改时间在重建开始之后的对象，在切换后补充更新
+    """
+    help = '使用别名切换零停机重建搜索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--using', default='default', help='haystack 连接名称')
+        parser.add_argument('--processes', type=int, default=None, help='进程数，默认为 cpu 核数')
+        parser.add_argument('--batch-size', type=int, default=10000, help='每个任务包含的对象数量')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每次 bulk 请求包含的文档数量')
+
+    def handle(self, *args, **options):
+        using = options['using']
+        backend = connections[using].get_backend()
+        unified_index = connections[using].get_unified_index()
+        conn = backend.conn
+        alias = backend.index_name
+        index_name = '%s_%s' % (alias, timezone.now().strftime('%Y%m%d%H%M%S'))
+        start = time.time()
+        start_time = timezone.now()
+
+        # 读取数据之前开始记录修改
+        start_search_index_rebuild(using)
+
+        # 创建新索引，写入期间关闭自动刷新
+        content_field_name, field_mapping = backend.build_schema(unified_index.all_searchfields())
+        body = {
+            'settings': dict(backend.DEFAULT_SETTINGS['settings'], index={'refresh_interval': '-1'}),
+            'mappings': {'modelresult': {'properties': field_mapping}},
+        }
+        conn.indices.create(index=index_name, body=body)
+        self.stdout.write('创建索引 %s' % index_name)
+
+        # 按主键范围分批
+        tasks = []
+        for model in unified_index.get_indexed_models():
+            index = unified_index.get_index(model)
+            pk_list = list(index.index_queryset(using=using).using('default').order_by('pk').values_list(
+                'pk', flat=True))
+            for i in range(0, len(pk_list), options['batch_size']):
+                batch = pk_list[i:i + options['batch_size']]
+                tasks.append((model, batch[0], batch[-1]))
+
+        # 子进程不能复用主进程的数据库连接，fork 之前先关闭
+        db.connections.close_all()
+
+        total = 0
+        with Pool(options['processes'], initializer=_init_worker,
+                  initargs=(using, index_name, options['chunk_size'])) as pool:
+            for count in pool.imap_unordered(_index_range, tasks):
+                total += count
+                elapsed = time.time() - start
+                self.stdout.write('已写入 %d 个文档  用时 %.1fs  %.1f 个/秒' % (total, elapsed, total / elapsed))
+
+        conn.indices.put_settings(index=index_name, body={'index': {'refresh_interval': '1s'}})
+        conn.indices.refresh(index=index_name)
+
+        # 原子切换别名，原来直接使用 INDEX_NAME 作为索引名时，在同一个请求中删除该索引并创建同名别名
+        actions = []
+        old_indices = []
+        if conn.indices.exists_alias(name=alias):
+            old_indices = list(conn.indices.get_alias(name=alias).keys())
+            actions.extend({'remove': {'index': old_index, 'alias': alias}} for old_index in old_indices)
+        elif conn.indices.exists(index=alias):
+            self.stdout.write('删除非别名的旧索引 %s' % alias)
+            actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': index_name, 'alias': alias}})
+        conn.indices.update_aliases(body={'actions': actions})
+        for old_index in old_indices:
+            conn.indices.delete(index=old_index)
+        self.stdout.write('别名 %s 已切换到 %s' % (alias, index_name))
+
+        # 重建期间索引队列中的修改只更新了旧索引，重新应用到新索引
+        count = finish_search_index_rebuild(using)
+        self.stdout.write('补充处理重建期间的 %d 个修改' % count)
+
+        # 补充更新重建期间修改的对象，分批流式读取
+        for model in unified_index.get_indexed_models():
+            index = unified_index.get_index(model)
+            updated_field = index.get_updated_field()
+            if not updated_field:
+                continue
+            queryset = index.index_queryset(using=using).using('default').filter(
+                **{updated_field + '__gte': start_time}).order_by('pk')
+            obj_list = []
+            for obj in queryset.iterator():
+                obj_list.append(obj)
+                if len(obj_list) == options['chunk_size']:
+                    backend.update(index, obj_list)
+                    obj_list = []
+            if obj_list:
+                backend.update(index, obj_list)
+
+        self.stdout.write('完成，共 %d 个文档，用时 %.1fs' % (total, time.time() - start))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_spec_matrix(apps, schema_editor):
+    """
+    为已有商品生成规格组合，与 goods.spec_matrix.build_goods_spec_matrix 相同
+    """
+    Goods = apps.get_model('goods', 'Goods')
+    GoodsSpecification = apps.get_model('goods', 'GoodsSpecification')
+    SpecificationOption = apps.get_model('goods', 'SpecificationOption')
+    SKU = apps.get_model('goods', 'SKU')
+    SKUSpecification = apps.get_model('goods', 'SKUSpecification')
+    GoodsSpecMatrix = apps.get_model('goods', 'GoodsSpecMatrix')
+    db_alias = schema_editor.connection.alias
+
+    matrices = {goods_id: {'specs': [], 'skus': {}, 'sku_keys': {}}
+                for goods_id in Goods.objects.using(db_alias).values_list('id', flat=True)}
+
+    spec_dict = {}
+    for spec_id, goods_id, name in GoodsSpecification.objects.using(db_alias).order_by('id').values_list(
+            'id', 'goods_id', 'name'):
+        spec_dict[spec_id] = {'id': spec_id, 'name': name, 'options': []}
+        matrices[goods_id]['specs'].append(spec_dict[spec_id])
+    for spec_id, option_id, value in SpecificationOption.objects.using(db_alias).order_by(
+            'spec_id', 'id').values_list('spec_id', 'id', 'value'):
+        spec_dict[spec_id]['options'].append({'id': option_id, 'value': value})
+
+    sku_options = {sku_id: (goods_id, []) for sku_id, goods_id in SKU.objects.using(db_alias).order_by(
+        'id').values_list('id', 'goods_id')}
+    for sku_id, option_id in SKUSpecification.objects.using(db_alias).order_by('sku_id', 'spec_id').values_list(
+            'sku_id', 'option_id'):
+        sku_options[sku_id][1].append(option_id)
+    for sku_id, (goods_id, option_ids) in sku_options.items():
+        key = ','.join(str(option_id) for option_id in option_ids)
+        matrices[goods_id]['skus'][key] = sku_id
+        matrices[goods_id]['sku_keys'][str(sku_id)] = key
+
+    GoodsSpecMatrix.objects.using(db_alias).bulk_create([
+        GoodsSpecMatrix(goods_id=goods_id, matrix=json.dumps(matrix, ensure_ascii=False, separators=(',', ':')))
+        for goods_id, matrix in matrices.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0003_sku_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsSpecMatrix',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('matrix', models.TextField(verbose_name='规格组合')),
+                ('goods', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='spec_matrix', to='goods.Goods', verbose_name='商品')),
+            ],
+            options={
+                'db_table': 'tb_goods_spec_matrix',
+                'verbose_name': '商品规格组合',
+                'verbose_name_plural': '商品规格组合',
+            },
+        ),
+        migrations.RunPython(build_spec_matrix, migrations.RunPython.noop),
+    ]
@@ -134,6 +134,12 @@ class SKU(BaseModel):
         db_table = 'tb_sku'
         verbose_name = '商品SKU'
         verbose_name_plural = verbose_name
+        # 类别商品列表按各排序字段游标分页
+        indexes = [
+            models.Index(fields=['category', 'is_launched', 'create_time', 'id'], name='sku_cat_launched_ctime_idx'),
+            models.Index(fields=['category', 'is_launched', 'price', 'id'], name='sku_cat_launched_price_idx'),
+            models.Index(fields=['category', 'is_launched', 'sales', 'id'], name='sku_cat_launched_sales_idx'),
+        ]
 
     def __str__(self):
         return '%s: %s' % (self.id, self.name)
@@ -170,3 +176,24 @@ class SKUSpecification(BaseModel):
 
     def __str__(self):
         return '%s: %s - %s' % (self.sku, self.spec.name, self.option.value)
+
+
+class GoodsSpecMatrix(BaseModel):
+    """
+    商品规格组合，由规格修改信号维护，详情页和规格切换直接读取
+    matrix 为 json: {
+        "specs": [{"id": 规格id, "name": 规格名称, "options": [{"id": 选项id, "value": 选项值}, ...]}, ...],
+        "skus": {"选项id,选项id,...": sku_id, ...}  选项id按规格id排列
+        "sku_keys": {"sku_id": "选项id,选项id,...", ...}  每个 sku 的规格组合，规格相同或没有规格的 sku 不会互相覆盖
+    }
+    """
+    goods = models.OneToOneField(Goods, on_delete=models.CASCADE, related_name='spec_matrix', verbose_name='商品')
+    matrix = models.TextField(verbose_name='规格组合')
+
+    class Meta:
+        db_table = 'tb_goods_spec_matrix'
+        verbose_name = '商品规格组合'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return '%s: %s' % (self.goods_id, self.matrix)
@@ -21,4 +21,8 @@ class SKUIndex(indexes.SearchIndex, indexes.Indexable):
 
     def index_queryset(self, using=None):
         """返回要建立索引的数据查询集"""
-        return self.get_model().objects.filter(is_launched=True)
\ No newline at end of file
+        return self.get_model().objects.filter(is_launched=True)
+
+    def get_updated_field(self):
+        """返回记录修改时间的字段，用于增量更新索引"""
+        return 'update_time'
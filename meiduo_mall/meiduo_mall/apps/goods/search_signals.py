@@ -0,0 +1,146 @@
+from django.apps import apps
+from django.db import models
+from django_redis import get_redis_connection
+from haystack import connections
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+from haystack.utils import get_identifier
+
+from . import constants
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    数据修改后只把索引更新放入 redis 队列，由异步任务批量更新搜索引擎，请求中不再同步访问 elasticsearch
+    """
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def handle_save(self, sender, instance, **kwargs):
+        self._enqueue('update', sender, instance)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        self._enqueue('remove', sender, instance)
+
+    def _enqueue(self, action, sender, instance):
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+            except NotHandled:
+                continue
+            enqueue_search_index(using, action, [get_identifier(instance)])
+
+
+def enqueue_search_index(using, action, identifiers):
+    """
+    将索引更新放入队列，延迟调度异步任务批量处理，期间的修改合并处理
+    :param action: update 更新, remove 删除
+    :param identifiers: haystack 对象标识列表，如 ['goods.sku.1', ...]
+    """
+    redis_conn = get_redis_connection('goods')
+    pl = redis_conn.pipeline()
+    pl.sadd('search_index_%s_%s' % (action, using), *identifiers)
+    pl.exists('search_index_rebuilding_%s' % using)
+    if pl.execute()[1]:
+        # 正在重建索引，另外记录修改，切换到新索引后重新处理，避免只更新了即将删除的旧索引
+        redis_conn.sadd('search_index_rebuild_%s_%s' % (action, using), *identifiers)
+
+    # 已有等待执行的任务时不再重复调度
+    if redis_conn.set('search_index_lock', 1, nx=True, ex=constants.SEARCH_INDEX_LOCK_EXPIRES):
+        from celery_tasks.search.tasks import process_search_index_queue
+        process_search_index_queue.apply_async(countdown=constants.SEARCH_INDEX_DELAY)
+
+
+def start_search_index_rebuild(using):
+    """
+    开始重建索引，之后的修改另外记录，由 finish_search_index_rebuild 应用到新索引
+    """
+    redis_conn = get_redis_connection('goods')
+    pl = redis_conn.pipeline()
+    pl.delete('search_index_rebuild_update_%s' % using, 'search_index_rebuild_remove_%s' % using)
+    pl.set('search_index_rebuilding_%s' % using, 1, ex=constants.SEARCH_INDEX_REBUILD_EXPIRES)
+    pl.execute()
+
+
+def finish_search_index_rebuild(using):
+    """
+    别名切换到新索引后调用，将重建期间记录的修改应用到新索引，包括已删除、已下架的对象
+    """
+    redis_conn = get_redis_connection('goods')
+    # 先停止记录，之后的修改由队列直接更新新索引
+    redis_conn.delete('search_index_rebuilding_%s' % using)
+    updates = _pop_identifiers(redis_conn, 'search_index_rebuild_update_%s' % using)
+    removes = set(_pop_identifiers(redis_conn, 'search_index_rebuild_remove_%s' % using))
+    if updates or removes:
+        _update_search_index(using, updates, removes)
+    return len(updates) + len(removes)
+
+
+def _pop_identifiers(redis_conn, key):
+    pl = redis_conn.pipeline()
+    pl.smembers(key)
+    pl.delete(key)
+    return [identifier.decode() for identifier in pl.execute()[0]]
+
+
+def flush_search_index_queue():
+    """
+    批量处理索引更新队列
+    更新的对象按模型分批查询后批量写入，已不在索引查询集中（如已下架）的对象从索引中删除
+    """
+    redis_conn = get_redis_connection('goods')
+
+    # 先清除调度标记，之后的修改会重新调度任务
+    redis_conn.delete('search_index_lock')
+
+    for using in connections.connections_info:
+        updates = _pop_identifiers(redis_conn, 'search_index_update_%s' % using)
+        removes = set(_pop_identifiers(redis_conn, 'search_index_remove_%s' % using))
+        if not updates and not removes:
+            continue
+
+        try:
+            _update_search_index(using, updates, removes)
+        except Exception:
+            # 搜索引擎不可用时放回队列，由之后调度的任务重新处理
+            if updates:
+                enqueue_search_index(using, 'update', updates)
+            if removes:
+                enqueue_search_index(using, 'remove', list(removes))
+            raise
+
+
+def _update_search_index(using, updates, removes):
+    """
+    更新一个 haystack 连接的索引
+    :param updates: 需要更新的对象标识列表
+    :param removes: 需要删除的对象标识集合
+    """
+    backend = connections[using].get_backend()
+    unified_index = connections[using].get_unified_index()
+
+    # 按模型分组 {模型: [pk, ...]}
+    model_pks = {}
+    for identifier in updates:
+        app_label, model_name, pk = identifier.split('.')
+        model_pks.setdefault(apps.get_model(app_label, model_name), []).append(pk)
+
+    for model, pk_list in model_pks.items():
+        index = unified_index.get_index(model)
+        for i in range(0, len(pk_list), constants.SEARCH_INDEX_BATCH_SIZE):
+            batch = pk_list[i:i + constants.SEARCH_INDEX_BATCH_SIZE]
+            # 从主库查询，避免从库延迟
+            obj_list = list(index.index_queryset(using=using).using('default').filter(pk__in=batch))
+            if obj_list:
+                backend.update(index, obj_list)
+
+            indexed = {str(obj.pk) for obj in obj_list}
+            removes.update('%s.%s' % (model._meta.label_lower, pk) for pk in batch if pk not in indexed)
+
+    for identifier in removes:
+        backend.remove(identifier, commit=False)
@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import SKU, GoodsCategory, GoodsChannel, Goods, GoodsSpecification, SpecificationOption, \
+    SKUSpecification, Brand
+from .facets import mark_facets_changed, mark_facets_changed_for_goods
+from .list_cache import clear_sku_list_cache
+from .spec_matrix import save_goods_spec_matrix
+from .static_html import mark_static_html_deps_changed
+from .suggest import mark_suggest_changed
+from .utils import clear_sku_cards, update_launched_sku, incr_categories_version
+
+
+# 影响商品列表内容或排序的字段
+SKU_LIST_FIELDS = ('category_id', 'is_launched', 'name', 'price', 'sales', 'comments', 'default_image_url')
+
+
+def _get_sku_list_values(instance):
+    # 从 __dict__ 读取，避免访问延迟加载的字段时查询数据库
+    return tuple(instance.__dict__.get(field) for field in SKU_LIST_FIELDS)
+
+
+@receiver(post_init, sender=SKU)
+def sku_loaded(sender, instance, **kwargs):
+    """
+    记录商品加载时的列表字段，保存时据此判断是否需要删除商品列表缓存
+    """
+    instance._sku_list_values = _get_sku_list_values(instance)
+
+
+@receiver(post_save, sender=SKU)
+def sku_saved(sender, instance, created, **kwargs):
+    """
+    商品数据修改后，事务提交后删除商品卡片缓存、更新上架商品集合
+    列表字段修改后，删除修改前后所在类别的商品列表缓存，更新输入提示
+    类别或上架状态修改后，重建修改前后所在类别的筛选位图
+    """
+    sku_id, is_launched = instance.id, instance.is_launched
+    transaction.on_commit(lambda: clear_sku_cards([sku_id]))
+    transaction.on_commit(lambda: update_launched_sku(sku_id, is_launched))
+
+    old_values = instance._sku_list_values
+    new_values = _get_sku_list_values(instance)
+    instance._sku_list_values = new_values
+    if old_values == new_values and not created:
+        return
+
+    mark_suggest_changed(['sku_%s' % instance.id])
+
+    # 修改前后都没有上架的商品不在列表中
+    old_category_id, old_launched = old_values[:2]
+    if old_launched or instance.is_launched:
+        category_id_list = {instance.category_id, old_category_id} - {None}
+        transaction.on_commit(lambda: clear_sku_list_cache(category_id_list))
+        if created or (old_category_id, old_launched) != (instance.category_id, instance.is_launched):
+            mark_facets_changed(category_id_list)
+
+
+@receiver(post_delete, sender=SKU)
+def sku_deleted(sender, instance, **kwargs):
+    """
+    商品删除后，事务提交后删除商品卡片缓存、从上架商品集合中移除，更新商品 SPU 的规格组合
+    """
+    sku_id = instance.id
+    transaction.on_commit(lambda: clear_sku_cards([sku_id]))
+    transaction.on_commit(lambda: update_launched_sku(sku_id, False))
+    mark_suggest_changed(['sku_%s' % instance.id])
+    save_goods_spec_matrix(instance.goods_id, create=False)
+
+    if instance.is_launched:
+        category_id = instance.category_id
+        transaction.on_commit(lambda: clear_sku_list_cache([category_id]))
+        mark_facets_changed([category_id])
+
+
+@receiver(post_save, sender=GoodsCategory)
+@receiver(post_delete, sender=GoodsCategory)
+@receiver(post_save, sender=GoodsChannel)
+@receiver(post_delete, sender=GoodsChannel)
+def goods_menu_changed(sender, instance, **kwargs):
+    """
+    商品分类、频道修改后，使缓存的分类菜单失效，重新生成包含分类菜单的页面
+    """
+    transaction.on_commit(incr_categories_version)
+    mark_static_html_deps_changed(['menu'])
+    if sender is GoodsCategory:
+        mark_suggest_changed(['category_%s' % instance.id])
+
+
+@receiver(post_save, sender=Goods)
+@receiver(post_delete, sender=Goods)
+def goods_changed(sender, instance, **kwargs):
+    """
+    商品 SPU 修改后，重新生成其所有sku的详情页，更新其sku所属品牌的输入提示、筛选位图
+    """
+    mark_static_html_deps_changed(['goods_%s' % instance.id])
+    mark_suggest_changed(['goods_%s' % instance.id])
+    mark_facets_changed_for_goods([instance.id])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def brand_changed(sender, instance, **kwargs):
+    """
+    品牌修改后，更新输入提示、品牌名称所在类别的筛选项
+    """
+    mark_suggest_changed(['brand_%s' % instance.id])
+    mark_facets_changed(SKU.objects.filter(goods__brand_id=instance.id).values_list('category_id', flat=True))
+
+
+@receiver(post_save, sender=GoodsSpecification)
+@receiver(post_delete, sender=GoodsSpecification)
+def goods_specification_changed(sender, instance, **kwargs):
+    """
+    商品规格修改后，更新规格组合，重新生成其商品所有sku的详情页，重建筛选位图
+    """
+    save_goods_spec_matrix(instance.goods_id, create=False)
+    mark_static_html_deps_changed(['goods_%s' % instance.goods_id])
+    mark_facets_changed_for_goods([instance.goods_id])
+
+
+@receiver(post_save, sender=SpecificationOption)
+@receiver(post_delete, sender=SpecificationOption)
+def specification_option_changed(sender, instance, **kwargs):
+    """
+    规格选项修改后，更新规格组合，重新生成展示该选项的详情页，重建筛选位图
+    """
+    goods_id = GoodsSpecification.objects.using('default').filter(id=instance.spec_id).values_list(
+        'goods_id', flat=True).first()
+    if goods_id is not None:
+        save_goods_spec_matrix(goods_id, create=False)
+        mark_facets_changed_for_goods([goods_id])
+    mark_static_html_deps_changed(['option_%s' % instance.id])
+
+
+@receiver(post_save, sender=SKUSpecification)
+@receiver(post_delete, sender=SKUSpecification)
+def sku_specification_changed(sender, instance, **kwargs):
+    """
+    sku规格修改后，更新规格组合，同一商品其他sku详情页中的规格链接也会变化，重建所在类别的筛选位图
+    """
+    # 从主库查询，当前事务中新建的 sku 在从库中还查询不到
+    sku = SKU.objects.using('default').filter(id=instance.sku_id).values('goods_id', 'category_id').first()
+    if sku is not None:
+        save_goods_spec_matrix(sku['goods_id'], create=False)
+        mark_static_html_deps_changed(['goods_%s' % sku['goods_id']])
+        mark_facets_changed([sku['category_id']])
@@ -0,0 +1,79 @@
+import json
+
+from .models import Goods, GoodsSpecification, GoodsSpecMatrix, SKU, SKUSpecification, SpecificationOption
+
+
+def get_spec_key(option_ids):
+    """
+    规格组合的键，选项id按规格id排列后以逗号连接
+    """
+    return ','.join(str(option_id) for option_id in option_ids)
+
+
+def build_goods_spec_matrix(goods_id, using='default'):
+    """
+    查询商品的规格、选项及各 sku 的规格组合
+    在规格修改信号中调用，默认查询主库，能读取到当前事务中的修改
+    :return: 规格组合字典，格式见 GoodsSpecMatrix
+    """
+    specs = []
+    spec_dict = {}
+    for spec_id, name in GoodsSpecification.objects.using(using).filter(goods_id=goods_id).order_by(
+            'id').values_list('id', 'name'):
+        spec_dict[spec_id] = {'id': spec_id, 'name': name, 'options': []}
+        specs.append(spec_dict[spec_id])
+
+    options = SpecificationOption.objects.using(using).filter(spec__goods_id=goods_id).order_by(
+        'spec_id', 'id').values_list('spec_id', 'id', 'value')
+    for spec_id, option_id, value in options:
+        spec_dict[spec_id]['options'].append({'id': option_id, 'value': value})
+
+    sku_options = {sku_id: [] for sku_id in SKU.objects.using(using).filter(goods_id=goods_id).order_by(
+        'id').values_list('id', flat=True)}
+    sku_specs = SKUSpecification.objects.using(using).filter(sku__goods_id=goods_id).order_by(
+        'sku_id', 'spec_id').values_list('sku_id', 'option_id')
+    for sku_id, option_id in sku_specs:
+        sku_options[sku_id].append(option_id)
+
+    return {
+        'specs': specs,
+        'skus': {get_spec_key(option_ids): sku_id for sku_id, option_ids in sku_options.items()},
+        'sku_keys': {str(sku_id): get_spec_key(option_ids) for sku_id, option_ids in sku_options.items()},
+    }
+
+
+def save_goods_spec_matrix(goods_id, create=True):
+    """
+    重新生成并保存商品的规格组合
+    :param create: 尚未生成时是否新建，信号中只更新已有的规格组合，避免删除商品时级联删除 sku 规格又新建规格组合
+    :return: json 字符串
+    """
+    matrix = json.dumps(build_goods_spec_matrix(goods_id), ensure_ascii=False, separators=(',', ':'))
+    if create:
+        GoodsSpecMatrix.objects.update_or_create(goods_id=goods_id, defaults={'matrix': matrix})
+    else:
+        GoodsSpecMatrix.objects.filter(goods_id=goods_id).update(matrix=matrix)
+    return matrix
+
+
+def parse_goods_spec_matrix(matrix):
+    """
+    :return: (规格组合字典, {sku_id: [选项id, ...]})，规格相同或没有规格的多个 sku 各自保留
+    """
+    matrix = json.loads(matrix)
+    sku_keys = {int(sku_id): [int(option_id) for option_id in key.split(',') if option_id]
+                for sku_id, key in matrix['sku_keys'].items()}
+    return matrix, sku_keys
+
+
+def get_goods_spec_matrix_json(goods_id):
+    """
+    读取商品规格组合的 json，尚未生成时生成并保存
+    :return: json 字符串，商品不存在时返回 None
+    """
+    matrix = GoodsSpecMatrix.objects.filter(goods_id=goods_id).values_list('matrix', flat=True).first()
+    if matrix is None:
+        if not Goods.objects.filter(id=goods_id).exists():
+            return None
+        matrix = save_goods_spec_matrix(goods_id)
+    return matrix
@@ -0,0 +1,432 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+
+from django import db
+from django.conf import settings
+from django.db.models import Prefetch
+from django.template import loader
+from django_redis import get_redis_connection
+
+from .models import Goods, GoodsSpecification, GoodsSpecMatrix, SKU
+from .spec_matrix import get_goods_spec_matrix_json, get_spec_key, parse_goods_spec_matrix
+from .utils import get_categories
+from . import constants
+
+# 工作进程中使用的商品分类菜单及其摘要，由主进程计算一次后传入
+_worker_categories = None
+_worker_categories_hash = None
+_worker_force = False
+
+# 详情页模板内容的摘要，每个进程计算一次
+_detail_template_hash = None
+
+
+def get_detail_goods_queryset():
+    """
+    生成详情页所需的商品查询集，一次预取商品的频道、规格组合、规格、选项及所有 SKU 的图片
+    """
+    return Goods.objects.select_related('category1', 'category2', 'category3', 'spec_matrix').prefetch_related(
+        'category1__goodschannel_set',
+        Prefetch('goodsspecification_set',
+                 queryset=GoodsSpecification.objects.order_by('id').prefetch_related('specificationoption_set')),
+        Prefetch('sku_set', queryset=SKU.objects.order_by('id').prefetch_related('skuimage_set')),
+    )
+
+
+def build_goods_detail_contexts(goods, sku_id=None):
+    """
+    构建一个商品 SPU 下各 SKU 详情页的规格信息，规格-sku 字典读取保存的规格组合
+    :param goods: 使用 get_detail_goods_queryset 查询的商品
+    :param sku_id: 只构建指定的 sku，为 None 时构建全部 sku
+    :return: 生成器 (sku, specs)，规格信息不完整的 sku 被跳过
+    """
+    # 面包屑导航信息中的频道
+    goods.channel = goods.category1.goodschannel_set.all()[0]
+
+    skus = goods.sku_set.all()
+
+    # 不同规格参数（选项）的sku字典
+    # spec_sku_map = {
+    #     '规格1参数id,规格2参数id,规格3参数id,...': sku_id,
+    #     ...
+    # }
+    try:
+        matrix = goods.spec_matrix.matrix
+    except GoodsSpecMatrix.DoesNotExist:
+        matrix = get_goods_spec_matrix_json(goods.id)
+    matrix, sku_keys = parse_goods_spec_matrix(matrix)
+    spec_sku_map = matrix['skus']
+
+    specs = goods.goodsspecification_set.all()
+
+    for sku in skus:
+        if sku_id is not None and sku.id != sku_id:
+            continue
+
+        # 若当前sku的规格信息不完整，则不再继续
+        sku_key = sku_keys.get(sku.id, [])
+        if len(sku_key) < len(specs):
+            continue
+
+        sku.images = sku.skuimage_set.all()
+
+        # 当前sku的规格信息，每个选项对应切换后的 sku
+        # specs = [{'name': '颜色', 'options': [{'value': '银色', 'sku_id': xxx}, ...]}, ...]
+        sku_specs = []
+        for index, spec in enumerate(specs):
+            # 复制当前sku的规格键
+            key = sku_key[:]
+            options = []
+            for option in spec.specificationoption_set.all():
+                key[index] = option.id
+                options.append({
+                    'id': option.id,
+                    'value': option.value,
+                    'sku_id': spec_sku_map.get(get_spec_key(key))
+                })
+            sku_specs.append({'name': spec.name, 'options': options})
+
+        yield sku, sku_specs
+
+
+def render_sku_detail_html(categories, goods, sku, specs):
+    """
+    渲染商品详情页
+    :return: html 文本
+    """
+    context = {
+        'categories': categories,
+        'goods': goods,
+        'specs': specs,
+        'sku': sku
+    }
+    template = loader.get_template('detail.html')
+    return template.render(context)
+
+
+def get_categories_hash(categories):
+    """
+    计算商品分类菜单的摘要
+    """
+    data = []
+    for group_id, group in categories.items():
+        sub_cats = []
+        for cat2 in group['sub_cats']:
+            sub_cats.append([cat2.id, cat2.name, [[cat3.id, cat3.name] for cat3 in cat2.sub_cats]])
+        data.append([group_id, group['channels'], sub_cats])
+    return _hash_data(data)
+
+
+def get_detail_template_hash():
+    """
+    计算详情页模板内容的摘要，模板修改后所有页面都需要重新生成
+    """
+    global _detail_template_hash
+    if _detail_template_hash is None:
+        template = loader.get_template('detail.html')
+        _detail_template_hash = hashlib.sha1(template.template.source.encode()).hexdigest()
+    return _detail_template_hash
+
+
+def get_sku_detail_input_hash(categories_hash, goods, sku, specs):
+    """
+    计算渲染详情页使用的所有数据的摘要
+    :param categories_hash: 商品分类菜单的摘要
+    :return: 摘要字符串
+    """
+    data = [
+        get_detail_template_hash(),
+        categories_hash,
+        [goods.id, goods.channel.url, goods.desc_detail, goods.desc_pack, goods.desc_service],
+        [[category.id, category.name] for category in (goods.category1, goods.category2, goods.category3)],
+        [sku.id, sku.name, sku.caption, str(sku.price), str(sku.market_price), sku.comments, sku.default_image_url],
+        specs,
+    ]
+    return _hash_data(data)
+
+
+def _hash_data(data):
+    return hashlib.sha1(json.dumps(data, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+def get_static_html_meta(page_list):
+    """
+    批量读取静态页面的生成记录
+    :param page_list: 页面路径列表，如 ['goods/1.html', ...]
+    :return: {页面路径: 生成记录字典 或 None}
+    """
+    if not page_list:
+        return {}
+    redis_conn = get_redis_connection('goods')
+    values = redis_conn.hmget('static_html_meta', *page_list)
+    return {page: json.loads(value.decode()) if value else None for page, value in zip(page_list, values)}
+
+
+def save_static_html_meta(meta_dict):
+    """
+    批量保存静态页面的生成记录
+    :param meta_dict: {页面路径: 生成记录字典}
+    """
+    if not meta_dict:
+        return
+    redis_conn = get_redis_connection('goods')
+    redis_conn.hmset('static_html_meta', {page: json.dumps(meta) for page, meta in meta_dict.items()})
+
+
+def write_static_html(page, html_text):
+    """
+    原子地保存静态文件，先写入同目录的临时文件再重命名，避免读取到未写完的页面
+    :param page: 页面路径，相对于 GENERATED_STATIC_HTML_FILES_DIR
+    """
+    file_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, page)
+    dir_name, file_name = os.path.split(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix='.%s.' % file_name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(html_text)
+        os.chmod(tmp_path, constants.STATIC_HTML_FILE_MODE)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def publish_sku_detail_html(items, categories, categories_hash, force=False):
+    """
+    生成一批sku的静态详情页，渲染数据与已生成的页面一致时跳过
+    :param items: [(goods, sku, specs), ...]
+    :param force: 是否忽略生成记录，强制重新生成
+    :return: 实际写入的页面数量
+    """
+    pages = ['goods/%s.html' % sku.id for goods, sku, specs in items]
+    old_meta_dict = get_static_html_meta(pages)
+    meta_dict = {} if force else old_meta_dict
+
+    # 记录页面依赖的数据
+    deps = {}
+    for page, (goods, sku, specs) in zip(pages, items):
+        page_deps = ['menu', 'goods_%s' % goods.id]
+        for spec in specs:
+            page_deps.extend('option_%s' % option['id'] for option in spec['options'])
+        deps[page] = page_deps
+    record_static_html_deps(deps, old_meta_dict)
+
+    new_meta_dict = {}
+    for page, (goods, sku, specs) in zip(pages, items):
+        input_hash = get_sku_detail_input_hash(categories_hash, goods, sku, specs)
+        file_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, page)
+        meta = meta_dict.get(page)
+        file_exists = os.path.exists(file_path)
+
+        # 渲染数据没有变化，跳过渲染
+        if meta and meta['input_hash'] == input_hash and file_exists:
+            continue
+
+        start = time.time()
+        html_text = render_sku_detail_html(categories, goods, sku, specs)
+        content_hash = hashlib.sha1(html_text.encode()).hexdigest()
+
+        # 渲染结果没有变化，跳过写入
+        written = not (meta and meta['content_hash'] == content_hash and file_exists)
+        if written:
+            write_static_html(page, html_text)
+
+        new_meta_dict[page] = {
+            'input_hash': input_hash,
+            'content_hash': content_hash,
+            'size': len(html_text),
+            'generated_at': int(time.time()),
+            'render_ms': int((time.time() - start) * 1000),
+            'written': written,
+            'deps': deps[page],
+        }
+
+    save_static_html_meta(new_meta_dict)
+    return sum(1 for meta in new_meta_dict.values() if meta['written'])
+
+
+def record_static_html_deps(deps, meta_dict=None):
+    """
+    记录静态页面依赖的数据，数据修改后据此找到需要重新生成的页面
+    依赖列表保存在页面的生成记录中，重新生成时与上次的依赖比较，从不再依赖的数据中移除页面
+    依赖名称: menu 商品分类菜单, goods_<id> 商品SPU及其规格, option_<id> 规格选项
+    :param deps: {页面路径: [依赖名称, ...]}
+    :param meta_dict: 已读取的生成记录 {页面路径: 生成记录字典 或 None}，不传时从 redis 读取
+    """
+    if not deps:
+        return
+    if meta_dict is None:
+        meta_dict = get_static_html_meta(list(deps))
+
+    added = {}
+    removed = {}
+    new_meta_dict = {}
+    for page, page_deps in deps.items():
+        meta = meta_dict.get(page) or {}
+        for dep in page_deps:
+            added.setdefault(dep, []).append(page)
+        for dep in set(meta.get('deps', [])) - set(page_deps):
+            removed.setdefault(dep, []).append(page)
+        if meta.get('deps') != page_deps:
+            new_meta_dict[page] = dict(meta, deps=page_deps)
+
+    redis_conn = get_redis_connection('goods')
+    pl = redis_conn.pipeline(transaction=False)
+    for dep, page_list in removed.items():
+        pl.srem('static_html_deps_%s' % dep, *page_list)
+    for dep, page_list in added.items():
+        pl.sadd('static_html_deps_%s' % dep, *page_list)
+    if new_meta_dict:
+        pl.hmset('static_html_meta', {page: json.dumps(meta) for page, meta in new_meta_dict.items()})
+    pl.execute()
+
+
+def mark_static_html_deps_changed(dep_list):
+    """
+    标记修改的数据，延迟调度异步任务重新生成依赖这些数据的页面，期间的修改合并处理
+    :param dep_list: [依赖名称, ...]
+    """
+    if not dep_list:
+        return
+    redis_conn = get_redis_connection('goods')
+    redis_conn.sadd('static_html_changed_deps', *dep_list)
+
+    # 已有等待执行的任务时不再重复调度
+    if redis_conn.set('static_html_fanout_lock', 1, nx=True, ex=constants.STATIC_HTML_FANOUT_LOCK_EXPIRES):
+        from celery_tasks.htmls.tasks import regenerate_static_html_dependents
+        regenerate_static_html_dependents.apply_async(countdown=constants.STATIC_HTML_FANOUT_DELAY)
+
+
+def pop_changed_static_html_pages():
+    """
+    取出已修改数据影响的所有页面，并清空修改标记
+    :return: 页面路径集合
+    """
+    redis_conn = get_redis_connection('goods')
+
+    # 先清除调度标记，之后的修改会重新调度任务
+    redis_conn.delete('static_html_fanout_lock')
+
+    pl = redis_conn.pipeline()
+    pl.smembers('static_html_changed_deps')
+    pl.delete('static_html_changed_deps')
+    dep_list = pl.execute()[0]
+    if not dep_list:
+        return set()
+
+    pages = redis_conn.sunion(['static_html_deps_%s' % dep.decode() for dep in dep_list])
+    return {page.decode() for page in pages}
+
+
+def generate_sku_detail_html(sku_id, categories=None, force=False):
+    """
+    生成单个sku的静态详情页
+    :param sku_id: 商品sku id
+    :param categories: 商品分类菜单，为 None 时查询
+    :param force: 是否强制重新生成
+    :return: 是否写入了页面
+    """
+    sku_id = int(sku_id)
+    goods = get_detail_goods_queryset().filter(sku__id=sku_id).first()
+    if goods is None:
+        return False
+
+    if categories is None:
+        categories = get_categories()
+
+    items = [(goods, sku, specs) for sku, specs in build_goods_detail_contexts(goods, sku_id)]
+    return publish_sku_detail_html(items, categories, get_categories_hash(categories), force) > 0
+
+
+def generate_goods_detail_html(goods_ids, categories, categories_hash=None, force=False):
+    """
+    生成一批商品 SPU 下所有sku的静态详情页
+    :param goods_ids: 商品 SPU id 列表
+    :param categories: 商品分类菜单
+    :param categories_hash: 商品分类菜单的摘要，为 None 时计算
+    :param force: 是否强制重新生成
+    :return: (页面数量, 实际写入的页面数量)
+    """
+    if categories_hash is None:
+        categories_hash = get_categories_hash(categories)
+
+    items = []
+    for goods in get_detail_goods_queryset().filter(id__in=goods_ids):
+        for sku, specs in build_goods_detail_contexts(goods):
+            items.append((goods, sku, specs))
+    return len(items), publish_sku_detail_html(items, categories, categories_hash, force)
+
+
+def get_goods_id_batches(sku_id_list, batch_size=constants.STATIC_HTML_GOODS_CHUNK_SIZE):
+    """
+    将sku所属的商品 SPU 分批，用于批量生成详情页
+    :return: [[goods_id, ...], ...]
+    """
+    goods_ids = sorted(set(SKU.objects.filter(id__in=sku_id_list).values_list('goods_id', flat=True)))
+    return [goods_ids[i:i + batch_size] for i in range(0, len(goods_ids), batch_size)]
+
+
+def _init_worker(categories, categories_hash, force):
+    """工作进程初始化，保存主进程计算的分类菜单"""
+    global _worker_categories, _worker_categories_hash, _worker_force
+    _worker_categories = categories
+    _worker_categories_hash = categories_hash
+    _worker_force = force
+
+
+def _generate_goods_chunk(goods_ids):
+    """工作进程中生成一批商品的详情页"""
+    pages, written = generate_goods_detail_html(goods_ids, _worker_categories, _worker_categories_hash, _worker_force)
+    return len(goods_ids), pages, written
+
+
+def regenerate_all_detail_html(processes=None, chunk_size=constants.STATIC_HTML_GOODS_CHUNK_SIZE, progress=None,
+                               force=False):
+    """
+    使用进程池重新生成所有sku的静态详情页，渲染数据没有变化的页面被跳过
+    :param processes: 进程数，默认为 cpu 核数，为 1 时在当前进程中生成
+    :param chunk_size: 每个任务包含的商品 SPU 数量
+    :param progress: 进度回调 progress(已完成 SPU 数, SPU 总数, 页面数, 实际写入的页面数, 已用秒数)
+    :param force: 是否强制重新生成所有页面
+    :return: (页面数量, 实际写入的页面数量, 用时秒数)
+    """
+    start = time.time()
+
+    # 分类菜单只计算一次
+    categories = get_categories()
+    categories_hash = get_categories_hash(categories)
+
+    goods_ids = list(Goods.objects.order_by('id').values_list('id', flat=True))
+    chunks = [goods_ids[i:i + chunk_size] for i in range(0, len(goods_ids), chunk_size)]
+
+    goods_done = 0
+    pages = 0
+    written = 0
+    pool = None
+
+    if processes == 1:
+        _init_worker(categories, categories_hash, force)
+        results = map(_generate_goods_chunk, chunks)
+    else:
+        # 子进程不能复用主进程的数据库连接，fork 之前先关闭
+        db.connections.close_all()
+        pool = Pool(processes, initializer=_init_worker, initargs=(categories, categories_hash, force))
+        results = pool.imap_unordered(_generate_goods_chunk, chunks)
+
+    try:
+        for goods_count, page_count, written_count in results:
+            goods_done += goods_count
+            pages += page_count
+            written += written_count
+            if progress:
+                progress(goods_done, len(goods_ids), pages, written, time.time() - start)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return pages, written, time.time() - start
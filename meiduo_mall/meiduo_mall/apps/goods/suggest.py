@@ -0,0 +1,323 @@
+"""
+搜索框输入提示
+每个进程在内存中维护一棵前缀树，包含上架商品名称、品牌名称、商品类别名称，按销量排序
+树的每个节点保存以该前缀开头的前几条提示，查询只需沿输入的前缀走到对应节点
+数据修改后记录到 redis 的修改集合，各进程定期读取修改集合增量更新前缀树
+"""
+import heapq
+import threading
+import time
+
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .models import Brand, GoodsCategory, SKU
+from . import constants
+
+# 当前进程的提示索引
+_suggest_index = None
+_suggest_lock = threading.Lock()
+
+# 分配修改序号并写入修改集合，在一个脚本中完成，刷新时不会先看到较大的序号再看到较小的序号
+# 同一数据只保留最新的修改序号，集合大小不超过数据总数
+# KEYS: suggest_change_seq, suggest_changes  ARGV: 修改的数据
+RECORD_SUGGEST_CHANGES_SCRIPT = """
+local seq = redis.call('incr', KEYS[1])
+for i = 1, #ARGV do
+    redis.call('zadd', KEYS[2], seq, ARGV[i])
+end
+return seq
+"""
+
+
+class _Node(object):
+    __slots__ = ('children', 'keys', 'top')
+
+    def __init__(self):
+        # 子节点 {字符: 节点}
+        self.children = {}
+        # 在此节点结束的提示
+        self.keys = set()
+        # 以此节点前缀开头的前几条提示 [(-权重, 文字, 提示键), ...]
+        self.top = []
+
+
+class SuggestTrie(object):
+    """
+    前缀树，提示的每个单词开头都可以匹配，如 "Apple iPhone 8" 可由 "app"、"iph" 匹配
+    """
+    def __init__(self, size=constants.SUGGEST_MAX_LIMIT):
+        self.size = size
+        self.root = _Node()
+        # {提示键: (文字, 权重)}
+        self.entries = {}
+
+    @staticmethod
+    def get_terms(text):
+        """
+        提示在前缀树中的路径，从每个单词开头截取
+        """
+        text = text.lower()
+        starts = [i for i, char in enumerate(text) if not char.isspace() and (i == 0 or text[i - 1].isspace())]
+        return {text[i:i + constants.SUGGEST_MAX_KEY_LENGTH] for i in starts}
+
+    def _get_path(self, term, create=False):
+        path = [self.root]
+        node = self.root
+        for char in term:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _Node()
+            path.append(child)
+            node = child
+        return path
+
+    def _update_top(self, node):
+        """
+        合并节点自身的提示与子节点的前几条提示，子节点需要已经更新
+        """
+        own = sorted((-self.entries[key][1], self.entries[key][0], key) for key in node.keys)
+        top = []
+        seen = set()
+        for item in heapq.merge(own, *(child.top for child in node.children.values())):
+            # 同一提示可能从不同单词开头进入同一子树
+            if item[2] in seen:
+                continue
+            seen.add(item[2])
+            top.append(item)
+            if len(top) == self.size:
+                break
+        node.top = top
+
+    def _insert(self, key, text):
+        for term in self.get_terms(text):
+            path = self._get_path(term, create=True)
+            path[-1].keys.add(key)
+            yield path
+
+    def set(self, key, text, weight, update=True):
+        """
+        添加或修改提示
+        :param key: 提示键，如 ('sku', 1)
+        :param update: 是否更新路径上节点的前几条提示，批量添加时最后统一调用 update_all
+        """
+        old = self.entries.get(key)
+        if old is not None and old[0] != text:
+            self.remove(key)
+            old = None
+        self.entries[key] = (text, weight)
+
+        if old is None:
+            paths = list(self._insert(key, text))
+        else:
+            paths = [self._get_path(term) for term in self.get_terms(text)]
+        if update:
+            for path in paths:
+                for node in reversed(path):
+                    self._update_top(node)
+
+    def remove(self, key):
+        """
+        删除提示
+        """
+        old = self.entries.get(key)
+        if old is None:
+            return
+        paths = []
+        for term in self.get_terms(old[0]):
+            path = self._get_path(term)
+            path[-1].keys.discard(key)
+            paths.append(path)
+        del self.entries[key]
+
+        for path in paths:
+            for node in reversed(path):
+                self._update_top(node)
+
+    def update_all(self):
+        """
+        更新所有节点的前几条提示
+        """
+        # 按先序遍历收集节点，倒序更新保证子节点先更新
+        nodes = [self.root]
+        for node in nodes:
+            nodes.extend(node.children.values())
+        for node in reversed(nodes):
+            self._update_top(node)
+
+    def search(self, prefix, limit):
+        """
+        :return: [(文字, 提示键), ...]
+        """
+        path = self._get_path(prefix.lower()[:constants.SUGGEST_MAX_KEY_LENGTH])
+        if path is None:
+            return []
+        return [(text, key) for _, text, key in path[-1].top[:limit]]
+
+
+class SuggestIndex(object):
+    """
+    提示索引，在前缀树之上维护商品所属品牌、类别，商品销量变化时同步修改品牌、类别的权重
+    """
+    def __init__(self):
+        self.trie = SuggestTrie()
+        # {sku_id: (品牌id, 类别id, 销量)}
+        self.skus = {}
+        self.brand_names = {}
+        self.category_names = {}
+        # {品牌id: [上架商品数, 销量]}
+        self.brand_stats = {}
+        self.category_stats = {}
+        # 已处理的修改序号
+        self.seq = 0
+        self.checked = 0
+
+    def build(self):
+        """
+        从数据库加载全部提示
+        """
+        # 先读取修改序号，加载期间的修改会在下次刷新时重新处理
+        self.seq = int(get_redis_connection('goods').get('suggest_change_seq') or 0)
+        self.checked = time.time()
+
+        queryset = SKU.objects.filter(is_launched=True).values_list(
+            'id', 'name', 'sales', 'goods__brand_id', 'category_id')
+        for sku_id, name, sales, brand_id, category_id in queryset.iterator():
+            self.skus[sku_id] = (brand_id, category_id, sales)
+            self.trie.set(('sku', sku_id), name, sales, update=False)
+            _add_stats(self.brand_stats, brand_id, sales)
+            _add_stats(self.category_stats, category_id, sales)
+
+        self.brand_names = dict(Brand.objects.filter(id__in=self.brand_stats).values_list('id', 'name'))
+        self.category_names = dict(GoodsCategory.objects.filter(id__in=self.category_stats).values_list('id', 'name'))
+        for brand_id in self.brand_stats:
+            self._set_group('brand', brand_id, update=False)
+        for category_id in self.category_stats:
+            self._set_group('category', category_id, update=False)
+        self.trie.update_all()
+
+    def _set_group(self, kind, group_id, update=True):
+        """
+        修改品牌或类别提示，没有上架商品时删除
+        """
+        stats = self.brand_stats if kind == 'brand' else self.category_stats
+        names = self.brand_names if kind == 'brand' else self.category_names
+        count, sales = stats.get(group_id, (0, 0))
+        if count and group_id in names:
+            self.trie.set((kind, group_id), names[group_id], sales, update=update)
+        else:
+            self.trie.remove((kind, group_id))
+
+    def refresh(self):
+        """
+        读取上次刷新后的修改，增量更新
+        """
+        self.checked = time.time()
+        changes = get_redis_connection('goods').zrangebyscore(
+            'suggest_changes', '(%d' % self.seq, '+inf', withscores=True)
+        if not changes:
+            return
+
+        sku_ids, goods_ids, brand_ids, category_ids = set(), set(), set(), set()
+        for member, seq in changes:
+            kind, object_id = member.decode().split('_')
+            {'sku': sku_ids, 'goods': goods_ids, 'brand': brand_ids, 'category': category_ids}[kind].add(
+                int(object_id))
+            self.seq = max(self.seq, int(seq))
+
+        # 从主库查询，避免从库延迟
+        rows = {}
+        queryset = SKU.objects.using('default').values_list(
+            'id', 'name', 'sales', 'is_launched', 'goods__brand_id', 'category_id')
+        if sku_ids:
+            rows.update((row[0], row) for row in queryset.filter(id__in=sku_ids))
+        if goods_ids:
+            rows.update((row[0], row) for row in queryset.filter(goods_id__in=goods_ids))
+            sku_ids.update(rows)
+
+        for sku_id in sku_ids:
+            old = self.skus.pop(sku_id, None)
+            if old is not None:
+                brand_ids.add(old[0])
+                category_ids.add(old[1])
+                _add_stats(self.brand_stats, old[0], -old[2], -1)
+                _add_stats(self.category_stats, old[1], -old[2], -1)
+
+            row = rows.get(sku_id)
+            if row is None or not row[3]:
+                self.trie.remove(('sku', sku_id))
+                continue
+            _, name, sales, _, brand_id, category_id = row
+            self.skus[sku_id] = (brand_id, category_id, sales)
+            self.trie.set(('sku', sku_id), name, sales)
+            brand_ids.add(brand_id)
+            category_ids.add(category_id)
+            _add_stats(self.brand_stats, brand_id, sales)
+            _add_stats(self.category_stats, category_id, sales)
+
+        # 已删除的品牌、类别查询不到名称，提示随之删除
+        for brand_id in brand_ids:
+            self.brand_names.pop(brand_id, None)
+        for category_id in category_ids:
+            self.category_names.pop(category_id, None)
+        self.brand_names.update(Brand.objects.using('default').filter(id__in=brand_ids).values_list('id', 'name'))
+        self.category_names.update(GoodsCategory.objects.using('default').filter(
+            id__in=category_ids).values_list('id', 'name'))
+        for brand_id in brand_ids:
+            self._set_group('brand', brand_id)
+        for category_id in category_ids:
+            self._set_group('category', category_id)
+
+
+def _add_stats(stats, group_id, sales, count=1):
+    item = stats.setdefault(group_id, [0, 0])
+    item[0] += count
+    item[1] += sales
+    if not item[0]:
+        del stats[group_id]
+
+
+def get_suggest_index():
+    """
+    获取当前进程的提示索引，首次使用时加载，之后定期增量更新
+    """
+    global _suggest_index
+    index = _suggest_index
+    if index is not None and time.time() - index.checked < constants.SUGGEST_REFRESH_INTERVAL:
+        return index
+
+    with _suggest_lock:
+        if _suggest_index is None:
+            index = SuggestIndex()
+            index.build()
+            _suggest_index = index
+        elif time.time() - _suggest_index.checked >= constants.SUGGEST_REFRESH_INTERVAL:
+            _suggest_index.refresh()
+        return _suggest_index
+
+
+def get_suggestions(prefix, limit=constants.SUGGEST_LIMIT):
+    """
+    查询输入提示
+    :return: [{'type': 'sku', 'id': 1, 'text': 'Apple iPhone 8'}, ...]
+    """
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    return [{'type': key[0], 'id': key[1], 'text': text}
+            for text, key in get_suggest_index().trie.search(prefix, limit)]
+
+
+def mark_suggest_changed(members):
+    """
+    记录修改的数据，事务提交后写入，各进程下次刷新时增量更新
+    :param members: 修改的数据，如 ['sku_1', 'goods_1', 'brand_1', 'category_1']
+    """
+    def record():
+        redis_conn = get_redis_connection('goods')
+        script = redis_conn.register_script(RECORD_SUGGEST_CHANGES_SCRIPT)
+        script(keys=['suggest_change_seq', 'suggest_changes'], args=members)
+
+    transaction.on_commit(record)
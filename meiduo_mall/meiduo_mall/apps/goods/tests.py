@@ -1,3 +1,123 @@
-from django.test import TestCase
+import os
+import tempfile
+
+from django.test import SimpleTestCase, TestCase
+
+from .facets import FacetIndex, _to_bitmap
+from .local_search import LocalIndex, build_local_index
+from .models import Brand, Goods, GoodsCategory, GoodsChannel, GoodsSpecification, SKU, SKUSpecification, \
+    SpecificationOption
+from .static_html import build_goods_detail_contexts, get_detail_goods_queryset
 
 # Create your tests here.
+
+
+class FacetIndexTest(SimpleTestCase):
+    """
+    类别筛选位图
+    """
+    def setUp(self):
+        # 商品 10、11 为品牌 1，12、13 为品牌 2；10、12 为金色(选项 1、3)，11、13 为银色(选项 2)
+        self.index = FacetIndex(1)
+        self.index.sku_ids = [10, 11, 12, 13]
+        self.index.all = 0b1111
+        self.index.brand_bitmaps = {1: _to_bitmap([0, 1], 4), 2: _to_bitmap([2, 3], 4)}
+        self.index.brand_names = {1: 'Apple', 2: '华为'}
+        self.index.spec_names = ['颜色']
+        self.index.option_bitmaps = {('颜色', '金色'): _to_bitmap([0, 2], 4), ('颜色', '银色'): _to_bitmap([1, 3], 4)}
+        self.index.option_groups = {1: ('颜色', '金色'), 2: ('颜色', '银色'), 3: ('颜色', '金色')}
+        self.index.group_ids = {('颜色', '金色'): 1, ('颜色', '银色'): 2}
+
+    def test_filter(self):
+        self.assertEqual(self.index.filter(), [10, 11, 12, 13])
+        self.assertEqual(self.index.filter([1], []), [10, 11])
+        self.assertEqual(self.index.filter([], [3]), [10, 12])
+        self.assertEqual(self.index.filter([2], [1, 2]), [12, 13])
+
+    def test_unknown_option(self):
+        """
+        不属于该类别的选项没有商品满足
+        """
+        self.assertEqual(self.index.filter([], [999]), [])
+        self.assertEqual(self.index.filter([1], [1, 999]), [])
+
+        counts = self.index.get_counts([], [999])
+        self.assertEqual(counts['count'], 0)
+        self.assertEqual([brand['count'] for brand in counts['brands']], [0, 0])
+        self.assertEqual([option['count'] for option in counts['specs'][0]['options']], [0, 0])
+
+
+class GoodsDetailContextsTest(TestCase):
+    """
+    详情页规格信息
+    """
+    def setUp(self):
+        self.category = GoodsCategory.objects.create(name='手机')
+        GoodsChannel.objects.create(group_id=1, category=self.category, url='http://shouji.jd.com', sequence=1)
+        brand = Brand.objects.create(name='Apple', logo='apple.jpg', first_letter='A')
+        self.goods = Goods.objects.create(name='iPhone 8', brand=brand, category1=self.category,
+                                          category2=self.category, category3=self.category)
+
+    def create_skus(self, count):
+        return [SKU.objects.create(name='iPhone 8 %s' % i, caption='', goods=self.goods, category=self.category,
+                                   price=1, cost_price=1, market_price=1) for i in range(count)]
+
+    def get_contexts(self):
+        goods = get_detail_goods_queryset().get(id=self.goods.id)
+        return list(build_goods_detail_contexts(goods))
+
+    def test_goods_without_specs(self):
+        """
+        没有规格的商品下的多个 sku 都生成详情页
+        """
+        skus = self.create_skus(2)
+
+        contexts = self.get_contexts()
+        self.assertEqual([sku.id for sku, specs in contexts], [sku.id for sku in skus])
+        self.assertEqual([specs for sku, specs in contexts], [[], []])
+
+    def test_skus_with_same_specs(self):
+        """
+        规格相同的多个 sku 都生成详情页
+        """
+        spec = GoodsSpecification.objects.create(goods=self.goods, name='颜色')
+        option = SpecificationOption.objects.create(spec=spec, value='金色')
+        skus = self.create_skus(2)
+        for sku in skus:
+            SKUSpecification.objects.create(sku=sku, spec=spec, option=option)
+
+        contexts = self.get_contexts()
+        self.assertEqual([sku.id for sku, specs in contexts], [sku.id for sku in skus])
+
+
+class LocalIndexTest(SimpleTestCase):
+    """
+    本地搜索索引
+    """
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        path = os.path.join(tmp_dir.name, 'skus.idx')
+        build_local_index(path, [
+            {'id': 1, 'text': 'Apple iPhone 8 手机'},
+            {'id': 2, 'text': '华为 HUAWEI P10 手机'},
+            {'id': 3, 'text': 'Apple MacBook Pro 笔记本'},
+        ], 'goods.sku')
+        self.index = LocalIndex(path)
+
+    def search(self, query):
+        hits, top = self.index.search(query)
+        return hits, sorted(self.index.get_document(ordinal)['id'] for ordinal, score in top)
+
+    def test_search(self):
+        self.assertEqual(self.search('apple'), (2, [1, 3]))
+        self.assertEqual(self.search('apple 手机'), (1, [1]))
+        self.assertEqual(self.search('电视'), (0, []))
+
+    def test_single_chinese_character(self):
+        """
+        单个汉字可以匹配包含该字的词
+        """
+        self.assertEqual(self.search('机'), (2, [1, 2]))
+        self.assertEqual(self.search('本'), (1, [3]))
+        self.assertEqual(self.search('华 机'), (1, [2]))
@@ -7,6 +7,9 @@ from . import views
 urlpatterns = [
     url(r'^categories/(?P<category_id>\d+)/hotskus/$', views.HotSKUListView.as_view()),  # 热销产品视图
     url(r'^categories/(?P<category_id>\d+)/skus/$', views.SKUListView.as_view()),  # 商品列表数据
+    url(r'^categories/(?P<category_id>\d+)/facets/$', views.SKUFacetView.as_view()),  # 商品列表筛选项
+    url(r'^goods/(?P<goods_id>\d+)/specs/$', views.GoodsSpecMatrixView.as_view()),  # 商品规格组合
+    url(r'^skus/suggestions/$', views.SuggestionView.as_view()),  # 搜索框输入提示
 ]
 
 router = DefaultRouter()
@@ -1,11 +1,86 @@
+import time
+import uuid
 from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
 
-from .models import GoodsChannel
+from django.core.cache import cache
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import GoodsCategory, GoodsChannel, SKU
+from . import constants
+
+# 当前进程中缓存的商品分类菜单 (版本号, 菜单字典)
+_categories_memo = (None, None)
+
+# 商品卡片缓存的字段
+SKU_CARD_FIELDS = ('id', 'name', 'price', 'default_image_url', 'stock', 'comments')
+
+# 仅在上架商品集合已存在时增删，避免集合只包含部分商品，同时增加集合的版本号
+# KEYS: launched_sku_ids, launched_sku_ids_version  ARGV: sku_id, 是否上架
+UPDATE_LAUNCHED_SKU_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    if ARGV[2] == '1' then
+        redis.call('sadd', KEYS[1], ARGV[1])
+    else
+        redis.call('srem', KEYS[1], ARGV[1])
+    end
+end
+redis.call('incr', KEYS[2])
+return 1
+"""
+
+# 加载期间版本号未变化且集合仍不存在时，将临时键重命名为上架商品集合，否则丢弃
+# KEYS: 临时键, launched_sku_ids, launched_sku_ids_version  ARGV: 加载前读取的版本号
+SAVE_LAUNCHED_SKU_IDS_SCRIPT = """
+if redis.call('get', KEYS[3]) == ARGV[1] and redis.call('exists', KEYS[2]) == 0 then
+    if redis.call('exists', KEYS[1]) == 1 then
+        redis.call('rename', KEYS[1], KEYS[2])
+        redis.call('persist', KEYS[2])
+    end
+    return 1
+end
+redis.call('del', KEYS[1])
+return 0
+"""
+
+# 仅在排行已存在时累加销量，避免排行只包含部分商品
+# KEYS: hot_skus_<category_id>  ARGV: 销量, sku_id
+INCR_HOT_SKU_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('zincrby', KEYS[1], ARGV[1], ARGV[2])
+end
+return 1
+"""
 
 
 def get_categories():
     """
-    获取商城商品分类菜单
+    获取商城商品分类菜单，按分类版本号缓存，分类或频道修改后版本号增加
+    :return 菜单字典
+    """
+    global _categories_memo
+    version = get_categories_version()
+
+    # 当前进程已构建过该版本
+    if _categories_memo[0] == version:
+        return _categories_memo[1]
+
+    key = 'categories_%s' % version
+    categories = cache.get(key)
+    if categories is None:
+        categories = build_categories()
+        cache.set(key, categories, constants.CATEGORIES_CACHE_EXPIRES)
+
+    _categories_memo = (version, categories)
+    return categories
+
+
+def build_categories():
+    """
+    构建商城商品分类菜单，一次查询所有类别后在内存中组装
+    从主库查询，菜单按版本号缓存，避免从库延迟时以旧数据缓存为最新版本
     :return 菜单字典
     """
     # 商品频道及分类菜单
@@ -19,15 +94,21 @@ def get_categories():
     #
     #     }
     # }
+    category_dict = OrderedDict()
+    sub_cats_dict = {}
+    for category in GoodsCategory.objects.using('default').order_by('id'):
+        category_dict[category.id] = category
+        sub_cats_dict.setdefault(category.parent_id, []).append(category)
+
     categories = OrderedDict()
-    channels = GoodsChannel.objects.order_by('group_id', 'sequence')
+    channels = GoodsChannel.objects.using('default').order_by('group_id', 'sequence')
     for channel in channels:
         group_id = channel.group_id  # 当前组
 
         if group_id not in categories:
             categories[group_id] = {'channels': [], 'sub_cats': []}
 
-        cat1 = channel.category  # 当前频道的类别
+        cat1 = category_dict[channel.category_id]  # 当前频道的类别
 
         # 追加当前频道
         categories[group_id]['channels'].append({
@@ -36,9 +117,247 @@ def get_categories():
             'url': channel.url
         })
         # 构建当前类别的子类别
-        for cat2 in cat1.goodscategory_set.all():
-            cat2.sub_cats = []
-            for cat3 in cat2.goodscategory_set.all():
-                cat2.sub_cats.append(cat3)
+        for cat2 in sub_cats_dict.get(cat1.id, []):
+            cat2.sub_cats = sub_cats_dict.get(cat2.id, [])
             categories[group_id]['sub_cats'].append(cat2)
-    return categories
\ No newline at end of file
+    return categories
+
+
+def get_categories_version():
+    """
+    获取商品分类菜单的版本号
+    """
+    redis_conn = get_redis_connection('goods')
+    version = redis_conn.get('categories_version')
+    if version is None:
+        # 版本号丢失时使用当前时间初始化，避免与之前的版本号重复
+        redis_conn.set('categories_version', int(time.time() * 1000), nx=True)
+        version = redis_conn.get('categories_version')
+    return int(version)
+
+
+def incr_categories_version():
+    """
+    商品分类、频道修改后增加菜单版本号，使缓存的菜单失效
+    """
+    # 确保版本号已初始化
+    get_categories_version()
+    redis_conn = get_redis_connection('goods')
+    redis_conn.incr('categories_version')
+
+
+def get_sku_cards(sku_id_list):
+    """
+    批量获取商品卡片数据，优先从 redis 中读取，未缓存的商品一次查询数据库并回写缓存
+    :param sku_id_list: 商品 sku id 列表
+    :return: 有序字典 {sku_id: {'id':, 'name':, 'price':, 'default_image_url':, 'stock':, 'comments':}, ...}
+    """
+    sku_id_list = [int(sku_id) for sku_id in sku_id_list]
+    if not sku_id_list:
+        return OrderedDict()
+
+    redis_conn = get_redis_connection('goods')
+
+    # 一次往返读取所有商品卡片
+    pl = redis_conn.pipeline()
+    for sku_id in sku_id_list:
+        pl.hmget('sku_card_%s' % sku_id, *SKU_CARD_FIELDS)
+    values_list = pl.execute()
+
+    cards = {}
+    missing = []
+    for sku_id, values in zip(sku_id_list, values_list):
+        if None in values:
+            missing.append(sku_id)
+            continue
+        card = dict(zip(SKU_CARD_FIELDS, [value.decode() for value in values]))
+        cards[sku_id] = _parse_sku_card(card)
+
+    if missing:
+        # 未缓存的商品一次查询主库，并写入缓存，避免从库延迟时缓存修改前的数据
+        skus = SKU.objects.using('default').filter(id__in=missing).values(*SKU_CARD_FIELDS)
+        pl = redis_conn.pipeline()
+        for card in skus:
+            cards[card['id']] = card
+            key = 'sku_card_%s' % card['id']
+            pl.hmset(key, {field: '' if card[field] is None else str(card[field]) for field in SKU_CARD_FIELDS})
+            pl.expire(key, constants.SKU_CARD_REDIS_EXPIRES)
+        pl.execute()
+
+    # 按照传入的顺序返回，忽略不存在的商品
+    return OrderedDict((sku_id, cards[sku_id]) for sku_id in sku_id_list if sku_id in cards)
+
+
+def _parse_sku_card(card):
+    """
+    将 redis 中读取的字符串转换为对应的类型
+    """
+    card['id'] = int(card['id'])
+    card['price'] = Decimal(card['price'])
+    card['stock'] = int(card['stock'])
+    card['comments'] = int(card['comments'])
+    return card
+
+
+def clear_sku_cards(sku_id_list):
+    """
+    删除商品卡片缓存
+    """
+    if not sku_id_list:
+        return
+    redis_conn = get_redis_connection('goods')
+    redis_conn.delete(*['sku_card_%s' % sku_id for sku_id in sku_id_list])
+
+
+def is_launched_sku(sku_id):
+    """
+    判断商品是否存在且已上架，使用 redis 中缓存的上架商品 id 集合
+    """
+    redis_conn = get_redis_connection('goods')
+    pl = redis_conn.pipeline()
+    pl.exists('launched_sku_ids')
+    pl.sismember('launched_sku_ids', sku_id)
+    exists, is_member = pl.execute()
+    if exists:
+        return is_member
+
+    return int(sku_id) in load_launched_sku_ids(redis_conn)
+
+
+def get_launched_sku_ids_version(redis_conn):
+    """
+    获取上架商品集合的版本号，每次商品上下架、删除后增加
+    """
+    version = redis_conn.get('launched_sku_ids_version')
+    if version is None:
+        # 版本号丢失时使用当前时间初始化，避免与之前的版本号重复
+        redis_conn.set('launched_sku_ids_version', int(time.time() * 1000), nx=True)
+        version = redis_conn.get('launched_sku_ids_version')
+    return version
+
+
+def load_launched_sku_ids(redis_conn):
+    """
+    集合不存在时从主库加载所有上架商品 id
+    先写入临时键，加载期间有商品上下架时丢弃，避免旧数据覆盖信号中的更新
+    :return: 上架商品 id 集合
+    """
+    version = get_launched_sku_ids_version(redis_conn)
+    sku_id_set = set(SKU.objects.using('default').filter(is_launched=True).values_list('id', flat=True))
+
+    sku_id_list = list(sku_id_set)
+    tmp_key = 'launched_sku_ids_tmp_%s' % uuid.uuid4().hex
+    pl = redis_conn.pipeline()
+    for i in range(0, len(sku_id_list), constants.LAUNCHED_SKU_IDS_BATCH_SIZE):
+        pl.sadd(tmp_key, *sku_id_list[i:i + constants.LAUNCHED_SKU_IDS_BATCH_SIZE])
+    pl.expire(tmp_key, constants.LAUNCHED_SKU_IDS_TMP_EXPIRES)
+    pl.execute()
+
+    script = redis_conn.register_script(SAVE_LAUNCHED_SKU_IDS_SCRIPT)
+    script(keys=[tmp_key, 'launched_sku_ids', 'launched_sku_ids_version'], args=[version])
+    return sku_id_set
+
+
+def update_launched_sku(sku_id, is_launched):
+    """
+    商品上下架、删除后更新上架商品 id 集合，需在事务提交后调用
+    """
+    redis_conn = get_redis_connection('goods')
+    # 确保版本号已初始化
+    get_launched_sku_ids_version(redis_conn)
+    script = redis_conn.register_script(UPDATE_LAUNCHED_SKU_SCRIPT)
+    script(keys=['launched_sku_ids', 'launched_sku_ids_version'], args=[sku_id, int(is_launched)])
+
+
+def get_hot_skus_daily_key(category_id, date):
+    """
+    按天统计的热销排行键名
+    """
+    return 'hot_skus_%s_%s' % (category_id, date.strftime('%Y%m%d'))
+
+
+def incr_hot_skus(sku_counts):
+    """
+    下单后累加商品在热销排行中的销量
+    :param sku_counts: [(sku_id, category_id, count), ...]
+    """
+    today = timezone.localdate()
+    redis_conn = get_redis_connection('goods')
+    script = redis_conn.register_script(INCR_HOT_SKU_SCRIPT)
+    pl = redis_conn.pipeline()
+    for sku_id, category_id, count in sku_counts:
+        script(keys=['hot_skus_%s' % category_id], args=[count, sku_id], client=pl)
+        daily_key = get_hot_skus_daily_key(category_id, today)
+        pl.zincrby(daily_key, count, sku_id)
+        pl.expire(daily_key, constants.HOT_SKUS_DAILY_EXPIRES)
+    pl.execute()
+
+
+def load_hot_skus(category_id):
+    """
+    从数据库加载类别的累计热销排行
+    """
+    sku_sales = SKU.objects.filter(category_id=category_id, is_launched=True).values_list('id', 'sales')
+    save_hot_skus('hot_skus_%s' % category_id, {sku_id: sales for sku_id, sales in sku_sales})
+
+
+def save_hot_skus(key, sku_scores, expires=None):
+    """
+    整体替换一个热销排行，先写入临时键再重命名
+    :param sku_scores: {sku_id: 销量}
+    """
+    redis_conn = get_redis_connection('goods')
+    if not sku_scores:
+        redis_conn.delete(key)
+        return
+    # 临时键加上随机后缀，同时重建同一个排行时不会互相覆盖
+    tmp_key = '%s_tmp_%s' % (key, uuid.uuid4().hex)
+    pl = redis_conn.pipeline()
+    pl.zadd(tmp_key, sku_scores)
+    pl.rename(tmp_key, key)
+    if expires:
+        pl.expire(key, expires)
+    pl.execute()
+
+
+def get_hot_sku_ids(category_id, window='all', limit=constants.HOT_SKUS_COUNT_LIMIT):
+    """
+    获取类别的热销商品，跳过已下架的商品
+    :param window: all 累计销量, day 当天销量, week 最近 7 天销量
+    :return: sku id 列表，按销量降序
+    """
+    redis_conn = get_redis_connection('goods')
+
+    if window == 'all':
+        key = 'hot_skus_%s' % category_id
+        if not redis_conn.exists(key):
+            load_hot_skus(category_id)
+    else:
+        days = constants.HOT_SKUS_WINDOWS[window]
+        today = timezone.localdate()
+        if days == 1:
+            key = get_hot_skus_daily_key(category_id, today)
+        else:
+            # 合并时间窗口内每天的销量，越早的销量权重越低，短时间缓存合并结果
+            key = 'hot_skus_%s_%s' % (category_id, window)
+            if not redis_conn.exists(key):
+                daily_keys = {get_hot_skus_daily_key(category_id, today - timedelta(days=i)):
+                              constants.HOT_SKUS_DAILY_DECAY ** i for i in range(days)}
+                pl = redis_conn.pipeline()
+                pl.zunionstore(key, daily_keys)
+                pl.expire(key, constants.HOT_SKUS_WINDOW_CACHE_EXPIRES)
+                pl.execute()
+
+    sku_id_list = []
+    start = 0
+    while len(sku_id_list) < limit and start < constants.HOT_SKUS_MAX_SCAN:
+        members = redis_conn.zrevrange(key, start, start + limit * 2 - 1)
+        if not members:
+            break
+        for sku_id in members:
+            if is_launched_sku(int(sku_id)):
+                sku_id_list.append(int(sku_id))
+                if len(sku_id_list) == limit:
+                    break
+        start += limit * 2
+    return sku_id_list
@@ -1,39 +1,147 @@
+import logging
+
+from django.http import HttpResponse
 from django.shortcuts import render
 from rest_framework.generics import ListAPIView
-from rest_framework_extensions.cache.mixins import ListCacheResponseMixin
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from drf_haystack.viewsets import HaystackViewSet
+from elasticsearch import TransportError
+
+from meiduo_mall.utils.pagination import KeysetPagination, StandardResultsSetPagination
 
 from .serializers import SKUSerializer, SKUIndexSerializer
+from .list_cache import get_sku_list_cache_params, get_sku_list_page, render_sku_list_page
+from .facets import get_facet_index
 from .models import SKU
+from .spec_matrix import get_goods_spec_matrix_json
+from .suggest import get_suggestions
+from .utils import get_hot_sku_ids, get_sku_cards
 from . import constants
 
+logger = logging.getLogger('django')
+
 # Create your views here.
 
 
-class HotSKUListView(ListCacheResponseMixin, ListAPIView):
+def get_facet_filters(request):
+    """
+    解析商品列表的筛选参数 ?brand=1,2&options=3,4
+    :return: (品牌id列表, 规格选项id列表)
+    """
+    filters = []
+    for name in ('brand', 'options'):
+        value = request.query_params.get(name, '')
+        try:
+            filters.append([int(item) for item in value.split(',') if item])
+        except ValueError:
+            raise ValidationError({name: '参数错误'})
+    return tuple(filters)
+
+
+class HotSKUListView(ListAPIView):
     """
-    热销产品，使用缓存扩展
+    热销产品，从 redis 热销排行中读取
+    ?window=day 当天, week 最近 7 天, 默认为累计销量
     """
     serializer_class = SKUSerializer
     pagination_class = None
 
     def get_queryset(self):
         category_id = self.kwargs['category_id']
-        return SKU.objects.filter(category_id=category_id, is_launched=True).order_by('-sales')[:constants.HOT_SKUS_COUNT_LIMIT]
+        window = self.request.query_params.get('window', 'all')
+        if window != 'all' and window not in constants.HOT_SKUS_WINDOWS:
+            raise ValidationError({'window': '不支持的时间窗口'})
+
+        sku_id_list = get_hot_sku_ids(category_id, window)
+        return list(get_sku_cards(sku_id_list).values())
 
 
 class SKUListView(ListAPIView):
     """
     商品列表数据
+    请求参数中有 cursor 时使用游标分页，首页传空的 cursor，之后使用返回的 next/previous 链接
+    ?brand=品牌id,...&options=规格选项id,... 按品牌、规格筛选
     """
     serializer_class = SKUSerializer
     filter_backends = (OrderingFilter,)
     ordering_fields = ('create_time', 'price', 'sales')
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.cursor_query_param in self.request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = StandardResultsSetPagination()
+        return self._paginator
+
     def get_queryset(self):
         category_id = self.kwargs['category_id']
-        return SKU.objects.filter(category_id=category_id, is_launched=True)
+        queryset = SKU.objects.filter(category_id=category_id, is_launched=True)
+
+        brand_ids, option_ids = get_facet_filters(self.request)
+        if brand_ids or option_ids:
+            # 使用筛选位图得到满足条件的商品，不再关联查询规格表
+            sku_ids = get_facet_index(category_id).filter(brand_ids, option_ids)
+            queryset = queryset.filter(id__in=sku_ids)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # 前几页使用缓存的 json 数据，筛选后的列表不使用缓存
+        params = None
+        if KeysetPagination.cursor_query_param not in request.query_params and not any(get_facet_filters(request)):
+            params = get_sku_list_cache_params(request, self.ordering_fields)
+        if params is None:
+            return super().list(request, *args, **kwargs)
+
+        ordering, page, page_size = params
+        data = get_sku_list_page(self.kwargs['category_id'], ordering, page, page_size)
+        if data is None:
+            return super().list(request, *args, **kwargs)
+
+        count, results = data
+        body = render_sku_list_page(request, count, results, page, page_size)
+        return HttpResponse(body, content_type='application/json; charset=utf-8')
+
+
+class SKUFacetView(APIView):
+    """
+    商品列表的品牌、规格筛选项及满足条件的商品数量
+    ?brand=品牌id,...&options=规格选项id,... 当前的筛选条件
+    """
+    def get(self, request, category_id):
+        brand_ids, option_ids = get_facet_filters(request)
+        return Response(get_facet_index(category_id).get_counts(brand_ids, option_ids))
+
+
+class GoodsSpecMatrixView(APIView):
+    """
+    商品 SPU 的规格及规格组合对应的 sku，直接返回保存的 json
+    """
+    def get(self, request, goods_id):
+        matrix = get_goods_spec_matrix_json(goods_id)
+        if matrix is None:
+            raise NotFound('商品不存在')
+        return HttpResponse(matrix, content_type='application/json; charset=utf-8')
+
+
+class SuggestionView(APIView):
+    """
+    搜索框输入提示，从当前进程的前缀树中查询
+    ?q=输入内容&limit=返回数量
+    """
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', constants.SUGGEST_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': '参数错误'})
+        if not 0 < limit <= constants.SUGGEST_MAX_LIMIT:
+            raise ValidationError({'limit': '参数错误'})
+
+        return Response(get_suggestions(request.query_params.get('q', ''), limit))
 
 
 class SKUSearchViewSet(HaystackViewSet):
@@ -44,4 +152,19 @@ class SKUSearchViewSet(HaystackViewSet):
 
     serializer_class = SKUIndexSerializer
 
+    # 查询使用的 haystack 连接
+    search_using = 'default'
+
+    def get_queryset(self, index_models=[]):
+        return super().get_queryset(index_models).using(self.search_using)
+
+    def list(self, request, *args, **kwargs):
+        try:
+            return super().list(request, *args, **kwargs)
+        except TransportError as e:
+            # elasticsearch 不可用时使用本地搜索
+            logger.error('elasticsearch 查询失败，使用本地搜索: %s' % e)
+            self.search_using = 'local'
+            return super().list(request, *args, **kwargs)
+
 
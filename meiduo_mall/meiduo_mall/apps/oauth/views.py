@@ -82,7 +82,7 @@ class OAuthQQUserView(GenericAPIView):
                 'user_id': user.id
             })
             # 合并购物车
-            response = merge_cart_cookie_to_redis(request, user, response)
+            response = merge_cart_cookie_to_redis(request, response, user)
             return response
 
     def post(self, request):
@@ -105,7 +105,7 @@ class OAuthQQUserView(GenericAPIView):
             'user_id': user.id
         })
         # 合并购物车
-        response = merge_cart_cookie_to_redis(request, user, response)
+        response = merge_cart_cookie_to_redis(request, response, user)
         return response
 
 
@@ -0,0 +1,8 @@
+# 下单遇到死锁、锁等待超时时的最大重试次数
+SAVE_ORDER_MAX_RETRIES = 3
+
+# 下单重试的退避基础间隔（秒），第 n 次重试前等待 interval * 2^n
+SAVE_ORDER_RETRY_INTERVAL = 0.05
+
+# 补充同步库存的定时任务每次处理的失败记录数量
+STOCK_SYNC_RETRY_BATCH_SIZE = 100
@@ -0,0 +1,12 @@
+import time
+
+from .utils import retry_failed_stock_sync
+
+
+def sync_failed_sku_stock():
+    """
+    补充同步调度失败或多次重试仍失败的预扣减库存
+    """
+    print('%s: sync_failed_sku_stock' % time.ctime())
+    count = retry_failed_stock_sync()
+    print('同步 %d 条记录' % count)
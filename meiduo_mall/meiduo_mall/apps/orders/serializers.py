@@ -1,13 +1,21 @@
+import logging
 from decimal import Decimal
 
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
-from django_redis import get_redis_connection
 from rest_framework import serializers
+from carts.repository import CartRepository
 from carts.serializers import CartsSKUSerializer
 from goods.models import SKU
+from goods.utils import incr_hot_skus
 
 from orders.models import OrderInfo, OrderGoods
+from celery_tasks.stocks.tasks import sync_sku_stock
+from .utils import reserve_sku_stock, run_with_retry, prededuct_sku_stock, restore_sku_stock, \
+    record_failed_stock_sync
+
+logger = logging.getLogger('django')
 
 
 class OrderSettlementSerializer(serializers.Serializer):
@@ -50,118 +58,83 @@ class SaveOrderSerializer(serializers.ModelSerializer):
         address = validated_data['address']
         pay_method = validated_data['pay_method']
 
-        # 生成订单  开启事务
-        with transaction.atomic():
-            # 创建一个保存点
-            save_id = transaction.savepoint()
-
+        # 从 redis 中获取勾选的购物车数据
+        cart_repository = CartRepository(user.id)
+        cart = cart_repository.get_selected()
+
+        if not cart:
+            raise serializers.ValidationError('没有勾选要结算的商品')
+
+        # 开启 redis 预扣减时，库存不足的请求直接拒绝，不访问数据库
+        stock_prededucted = settings.ORDER_STOCK_REDIS_PREDEDUCT
+        if stock_prededucted and not prededuct_sku_stock(cart):
+            raise serializers.ValidationError('商品库存不足')
+
+        try:
+            # 一次查询出所有商品数据
+            sku_obj_list = SKU.objects.filter(id__in=cart.keys())
+            if len(sku_obj_list) < len(cart):
+                raise serializers.ValidationError('商品不存在')
+
+            # 生成订单，遇到死锁等可重试的数据库错误时有限次重试
+            order = run_with_retry(self._save_order, order_id, user, address, pay_method, cart, sku_obj_list,
+                                   not stock_prededucted)
+        except Exception:
+            if stock_prededucted:
+                restore_sku_stock(cart)
+            raise
+
+        if stock_prededucted:
+            # 异步将预扣减的库存同步到 mysql，订单已保存，调度失败时记录后由定时任务补充同步
             try:
-                # 保存订单的基本信息数据 OrderInfo
-                order = OrderInfo.objects.create(
-                    order_id=order_id,
-                    user=user,
-                    address=address,
-                    total_count=0,
-                    total_amount=Decimal(0),
-                    freight=Decimal(10),
-                    pay_method=pay_method,
-                    status=OrderInfo.ORDER_STATUS_ENUM['UNSEND'] if pay_method == OrderInfo.PAY_METHODS_ENUM[
-                        'CASH'] else OrderInfo.ORDER_STATUS_ENUM['UNPAID']
-                )
-
-                # 从 redis 中获取购物车数据
-                redis_conn = get_redis_connection("cart")
-                cart_redis = redis_conn.hgetall("cart_%s" % user.id)
-                cart_selected = redis_conn.smembers('cart_selected_%s' % user.id)
-
-                # 将bytes类型转换为int类型，
-                cart = {}
-                for sku_id in cart_selected:
-                    cart[int(sku_id)] = int(cart_redis[sku_id])
-
-                # # 一次查询出所有商品数据
-                # sku_obj_list = SKU.objects.filter(id__in=cart.keys())
-
-                sku_id_list = cart.keys()
-
-                # 遍历勾选要下单的商品数据
-                for sku_id in sku_id_list:
-                    while True:
-
-                        sku = SKU.objects.get(id=sku_id)
-
-                        # 判断商品库存是否充足
-                        count = cart[sku.id]
-                        origin_stock = sku.stock
-                        origin_sales = sku.sales
-
-                        if sku.stock < count:
-                            # 事务回滚
-                            transaction.savepoint_rollback(save_id)
-                            raise serializers.ValidationError('商品库存不足')
-
-                        # 减少商品的库存 SKU，增加销量
-                        # sku.stock -= count
-                        # sku.sales += count
-                        new_stock = origin_stock - count
-                        new_sales = origin_sales + count
-
-                        # 根据原始库存条件更新，返回更新的条目数，乐观锁
-                        ret = SKU.objects.filter(id=sku.id, stock=origin_stock).update(stock=new_stock, sales=new_sales)
-                        if ret == 0:
-                            continue
-
-
-                        sku.save()
-
-                        # 累计订单基本信息的数据
-                        order.total_count += count  # 累计总额
-                        order.total_amount += (sku.price * count)  # 累计总金额
-
-                        # 保存到 OrderGoods
-                        OrderGoods.objects.create(
-                            order=order,
-                            sku=sku,
-                            count=count,
-                            price=sku.price,
-                        )
-
-                        # 更新成功
-                        break
-
-                # 更新订单的金额数量信息
-                order.save()
-
-            except serializers.ValidationError:
-                raise
-
-            except Exception:
-                transaction.savepoint_rollback(save_id)
-                raise
-
-            # 提交事务
-            transaction.savepoint_commit(save_id)
-
-            # 清除购物车中已经结算的商品,更新redis中保存的购物车数据
-            pl = redis_conn.pipeline()
-            pl.hdel('cart_%s' % user.id, *cart_selected)
-            pl.srem('cart_selected_%s' % user.id, *cart_selected)
-            pl.execute()
-
-            return order
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+                sync_sku_stock.delay(list(cart.items()))
+            except Exception as e:
+                logger.error('[sync_sku_stock] 调度失败 %s' % e)
+                record_failed_stock_sync(cart)
+
+        # 累加商品在热销排行中的销量
+        incr_hot_skus([(sku.id, sku.category_id, cart[sku.id]) for sku in sku_obj_list])
+
+        # 清除购物车中已经结算的商品,更新redis中保存的购物车数据
+        cart_repository.remove(*cart.keys())
+
+        return order
+
+    def _save_order(self, order_id, user, address, pay_method, cart, sku_obj_list, reserve_stock=True):
+        """
+        在一个事务中保存订单基本信息、扣减库存、保存订单商品
+        :param reserve_stock: 是否在事务中扣减 mysql 库存，库存已在 redis 中预扣减时由异步任务同步
+        """
+        # 累计订单基本信息的数据
+        total_count = 0
+        total_amount = Decimal(0)
+        for sku in sku_obj_list:
+            count = cart[sku.id]
+            total_count += count
+            total_amount += (sku.price * count)
+
+        # 生成订单  开启事务，发生异常时自动回滚
+        with transaction.atomic():
+            # 保存订单的基本信息数据 OrderInfo
+            order = OrderInfo.objects.create(
+                order_id=order_id,
+                user=user,
+                address=address,
+                total_count=total_count,
+                total_amount=total_amount,
+                freight=Decimal(10),
+                pay_method=pay_method,
+                status=OrderInfo.ORDER_STATUS_ENUM['UNSEND'] if pay_method == OrderInfo.PAY_METHODS_ENUM[
+                    'CASH'] else OrderInfo.ORDER_STATUS_ENUM['UNPAID']
+            )
+
+            # 一条语句批量扣减库存、增加销量
+            if reserve_stock and not reserve_sku_stock(cart):
+                raise serializers.ValidationError('商品库存不足')
+
+            # 批量保存到 OrderGoods
+            OrderGoods.objects.bulk_create([
+                OrderGoods(order=order, sku=sku, count=cart[sku.id], price=sku.price) for sku in sku_obj_list
+            ])
+
+        return order
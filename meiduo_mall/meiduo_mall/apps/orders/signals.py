@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from goods.models import SKU
+from .utils import clear_sku_stock_cache
+
+
+@receiver([post_save, post_delete], sender=SKU)
+def sku_stock_changed(sender, instance, **kwargs):
+    """
+    后台修改商品库存后，事务提交后删除 redis 中预扣减使用的库存，下单时重新加载
+    """
+    if settings.ORDER_STOCK_REDIS_PREDEDUCT:
+        clear_sku_stock_cache(instance.id)
@@ -0,0 +1,227 @@
+import json
+import logging
+import random
+import time
+import uuid
+
+from django.db import DatabaseError, OperationalError, transaction
+from django.db.models import Case, When, F, Q, IntegerField
+from django_redis import get_redis_connection
+
+from goods.models import SKU
+from goods.list_cache import clear_sku_list_cache_for_skus
+from goods.suggest import mark_suggest_changed
+from goods.utils import clear_sku_cards
+from . import constants
+
+logger = logging.getLogger('django')
+
+# 可重试的 MySQL 错误码：1205 锁等待超时，1213 死锁
+RETRYABLE_MYSQL_ERRORS = (1205, 1213)
+
+# 原子检查并扣减多个商品的库存，同时累加尚未同步到 mysql 的扣减数量
+# KEYS: 商品库存键，之后为对应的待同步数量键  ARGV: 对应的购买数量
+# 返回 1 扣减成功，0 库存不足，-1 有商品库存未加载到 redis
+PREDEDUCT_STOCK_SCRIPT = """
+local n = #ARGV
+for i = 1, n do
+    local stock = redis.call('get', KEYS[i])
+    if not stock then
+        return -1
+    end
+    if tonumber(stock) < tonumber(ARGV[i]) then
+        return 0
+    end
+end
+for i = 1, n do
+    redis.call('decrby', KEYS[i], ARGV[i])
+    redis.call('incrby', KEYS[n + i], ARGV[i])
+end
+return 1
+"""
+
+# 归还预扣减的库存并减少待同步数量，库存键已被删除（等待重新加载）时不再写入库存
+RESTORE_STOCK_SCRIPT = """
+local n = #ARGV
+for i = 1, n do
+    if redis.call('exists', KEYS[i]) == 1 then
+        redis.call('incrby', KEYS[i], ARGV[i])
+    end
+    redis.call('decrby', KEYS[n + i], ARGV[i])
+end
+return 1
+"""
+
+
+def reserve_sku_stock(cart, check_stock=True):
+    """
+    使用一条 UPDATE 语句批量扣减库存、增加销量
+    库存不足的商品不会被更新，通过更新的条目数判断是否全部扣减成功
+    :param cart: 要下单的商品 {sku_id: count, ...}
+    :param check_stock: 是否检查库存，库存已在 redis 中预扣减时不再检查
+    :return: True 全部扣减成功，False 有商品库存不足
+    """
+    condition = Q()
+    stock_cases = []
+    sales_cases = []
+    for sku_id, count in cart.items():
+        if check_stock:
+            condition |= Q(id=sku_id, stock__gte=count)
+        else:
+            condition |= Q(id=sku_id)
+        stock_cases.append(When(id=sku_id, then=F('stock') - count))
+        sales_cases.append(When(id=sku_id, then=F('sales') + count))
+
+    ret = SKU.objects.filter(condition).update(
+        stock=Case(*stock_cases, output_field=IntegerField()),
+        sales=Case(*sales_cases, output_field=IntegerField()),
+    )
+
+    # update 不会触发信号，事务提交后手动删除商品卡片缓存、商品列表缓存，更新输入提示的销量
+    sku_id_list = list(cart.keys())
+    transaction.on_commit(lambda: clear_sku_cards(sku_id_list))
+    transaction.on_commit(lambda: clear_sku_list_cache_for_skus(sku_id_list))
+    mark_suggest_changed(['sku_%s' % sku_id for sku_id in sku_id_list])
+
+    return ret == len(cart)
+
+
+def run_with_retry(func, *args, **kwargs):
+    """
+    执行数据库事务，遇到死锁、锁等待超时按指数退避有限次重试
+    """
+    retries = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if not e.args or e.args[0] not in RETRYABLE_MYSQL_ERRORS or retries >= constants.SAVE_ORDER_MAX_RETRIES:
+                raise
+
+            # 加入随机抖动，避免并发请求同时重试再次冲突
+            time.sleep(constants.SAVE_ORDER_RETRY_INTERVAL * (2 ** retries) * random.uniform(0.5, 1.5))
+            retries += 1
+
+
+def get_stock_keys(sku_id_list):
+    """
+    :return: 商品库存键列表 + 对应的待同步数量键列表
+    """
+    return ['stock_%s' % sku_id for sku_id in sku_id_list] + ['stock_pending_%s' % sku_id for sku_id in sku_id_list]
+
+
+def load_sku_stock_to_redis(redis_conn, sku_id_list):
+    """
+    将 mysql 中的商品库存加载到 redis，已存在的不覆盖
+    redis 中已预扣减、异步任务尚未同步到 mysql 的数量需要从 mysql 库存中减去
+    """
+    # 先读取待同步数量再读取 mysql，期间同步完成的扣减最多被重复减去，库存只会偏小，不会超卖
+    pending = redis_conn.mget(['stock_pending_%s' % sku_id for sku_id in sku_id_list])
+    pending = {sku_id: int(count or 0) for sku_id, count in zip(sku_id_list, pending)}
+
+    # 从主库读取，避免从库延迟导致库存偏大
+    skus = SKU.objects.using('default').filter(id__in=sku_id_list).values_list('id', 'stock')
+
+    pl = redis_conn.pipeline()
+    for sku_id, stock in skus:
+        pl.set('stock_%s' % sku_id, max(stock - pending.get(sku_id, 0), 0), nx=True)
+    pl.execute()
+
+
+def prededuct_sku_stock(cart):
+    """
+    在 redis 中原子地检查并预扣减所有商品的库存
+    :param cart: 要下单的商品 {sku_id: count, ...}
+    :return: True 扣减成功，False 库存不足
+    """
+    redis_conn = get_redis_connection('inventory')
+    sku_id_list = list(cart.keys())
+    keys = get_stock_keys(sku_id_list)
+    counts = [cart[sku_id] for sku_id in sku_id_list]
+
+    script = redis_conn.register_script(PREDEDUCT_STOCK_SCRIPT)
+    ret = script(keys=keys, args=counts)
+    if ret == -1:
+        # 首次购买的商品，库存还未加载到 redis 中
+        missing = [sku_id for sku_id, stock in zip(sku_id_list, redis_conn.mget(keys[:len(sku_id_list)]))
+                   if stock is None]
+        load_sku_stock_to_redis(redis_conn, missing)
+        ret = script(keys=keys, args=counts)
+
+    return ret == 1
+
+
+def restore_sku_stock(cart):
+    """
+    下单失败时归还 redis 中预扣减的库存
+    """
+    redis_conn = get_redis_connection('inventory')
+    sku_id_list = list(cart.keys())
+    keys = get_stock_keys(sku_id_list)
+    counts = [cart[sku_id] for sku_id in sku_id_list]
+
+    script = redis_conn.register_script(RESTORE_STOCK_SCRIPT)
+    script(keys=keys, args=counts)
+
+
+def finish_sku_stock_sync(cart):
+    """
+    预扣减的库存已同步到 mysql 后，减少 redis 中的待同步数量
+    需在同步的事务提交后调用，提交前重新加载库存会按未扣减的 mysql 库存计算
+    """
+    redis_conn = get_redis_connection('inventory')
+    pl = redis_conn.pipeline()
+    for sku_id, count in cart.items():
+        pl.decrby('stock_pending_%s' % sku_id, count)
+    pl.execute()
+
+
+def sync_prededucted_stock(cart):
+    """
+    将 redis 中预扣减的库存同步到 mysql，提交后减少待同步数量
+    """
+    with transaction.atomic():
+        reserve_sku_stock(cart, check_stock=False)
+        # 提交后才减少 redis 中的待同步数量，重新加载库存时不会重复计入这次扣减
+        transaction.on_commit(lambda: finish_sku_stock_sync(cart))
+
+
+def record_failed_stock_sync(cart):
+    """
+    记录未能调度或多次重试仍失败的库存同步，由定时任务 retry_failed_stock_sync 补充同步
+    """
+    entry = json.dumps({'id': uuid.uuid4().hex, 'cart': list(cart.items())})
+    redis_conn = get_redis_connection('inventory')
+    redis_conn.rpush('stock_sync_failed', entry)
+
+
+def retry_failed_stock_sync():
+    """
+    补充同步失败的库存，同步的事务提交后删除记录，避免 redis 与 mysql 的库存长期不一致
+    :return: 同步成功的记录数量
+    """
+    redis_conn = get_redis_connection('inventory')
+    entries = redis_conn.lrange('stock_sync_failed', 0, constants.STOCK_SYNC_RETRY_BATCH_SIZE - 1)
+    count = 0
+    for entry in entries:
+        cart = {int(sku_id): int(sku_count) for sku_id, sku_count in json.loads(entry.decode())['cart']}
+        try:
+            with transaction.atomic():
+                sync_prededucted_stock(cart)
+                transaction.on_commit(lambda entry=entry: redis_conn.lrem('stock_sync_failed', 1, entry))
+        except DatabaseError as e:
+            logger.error('[retry_failed_stock_sync] %s' % e)
+            break
+        count += 1
+    return count
+
+
+def clear_sku_stock_cache(sku_id):
+    """
+    事务提交后删除 redis 中的商品库存，下次下单时重新从 mysql 加载
+    """
+    def delete():
+        redis_conn = get_redis_connection('inventory')
+        redis_conn.delete('stock_%s' % sku_id)
+
+    transaction.on_commit(delete)
@@ -1,12 +1,12 @@
 from django.shortcuts import render
-from django_redis import get_redis_connection
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from decimal import Decimal
 from rest_framework.generics import CreateAPIView
 
-from goods.models import SKU
+from carts.repository import CartRepository
+from goods.utils import get_sku_cards
 from .serializers import OrderSettlementSerializer, SaveOrderSerializer
 # Create your views here.
 
@@ -24,19 +24,14 @@ class OrderSettlementView(APIView):
         user = request.user
 
         # 从购物车中获取用户勾选要结算的商品信息
-        redis_conn = get_redis_connection('cart')
-        redis_cart = redis_conn.hgetall('cart_%s' % user.id)
-        cart_selected = redis_conn.smembers('cart_selected_%s' % user.id)
-
-        cart = {}
-        for sku_id in cart_selected:
-            cart[int(sku_id)] = int(redis_cart[sku_id])
-
-        # 查询商品信息
-        skus = SKU.objects.filter(id__in=cart.keys())
-        for sku in skus:
-            sku.count = cart[sku.id]
-            sku.selected = True
+        cart = CartRepository(user.id).get_selected()
+
+        # 从缓存中批量获取商品信息
+        skus = []
+        for sku_id, sku in get_sku_cards(cart.keys()).items():
+            sku['count'] = cart[sku_id]
+            sku['selected'] = True
+            skus.append(sku)
 
         # 运费
         freight = Decimal('10.00')
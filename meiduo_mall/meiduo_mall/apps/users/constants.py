@@ -13,3 +13,18 @@ USER_ADDRESS_COUNTS_LIMIT = 20
 # 浏览历史记录数量
 USER_BROWSING_HISTORY_COUNTS_LIMIT = 5
 
+
+# 浏览历史事件流的最大长度
+USER_BROWSING_HISTORY_STREAM_MAXLEN = 100000
+
+# 浏览历史事件写入后，延迟多少秒批量处理，期间的事件合并处理
+USER_BROWSING_HISTORY_CONSUME_DELAY = 1
+
+# 批量处理浏览历史事件时，每批读取的事件数量
+USER_BROWSING_HISTORY_CONSUME_BATCH_SIZE = 1000
+
+# 批量处理任务调度标记的有效期，防止任务异常退出后不再调度
+USER_BROWSING_HISTORY_CONSUME_LOCK_EXPIRES = 60
+
+# 批量处理任务执行锁的有效期，每处理一批事件后延长，任务异常退出后自动释放
+USER_BROWSING_HISTORY_CONSUME_RUN_LOCK_EXPIRES = 60
@@ -1,11 +1,14 @@
 import re
 
+from django.conf import settings
 from django_redis import get_redis_connection
 from rest_framework import serializers
 from rest_framework_jwt.settings import api_settings
 
+from areas.tree import get_area_tree
 from celery_tasks.emails.tasks import send_verify_email
-from goods.models import SKU
+from celery_tasks.history.tasks import consume_browsing_history
+from goods.utils import is_launched_sku
 from users.models import User
 from .utils import get_user_by_account
 from .models import Address
@@ -209,13 +212,28 @@ class EmailSerializer(serializers.ModelSerializer):
         return instance
 
 
+class AreaNameField(serializers.ReadOnlyField):
+    """
+    行政区划名称，从行政区划树中读取，不再查询数据库
+    """
+    def get_attribute(self, instance):
+        return instance
+
+    def to_representation(self, instance):
+        name = get_area_tree().get_name(getattr(instance, '%s_id' % self.source))
+        if name is None:
+            # 行政区划树中没有的区划，读取外键
+            return str(getattr(instance, self.source))
+        return name
+
+
 class UserAddressSerializer(serializers.ModelSerializer):
     """
     用户地址序列化器
     """
-    province = serializers.StringRelatedField(read_only=True)
-    city = serializers.StringRelatedField(read_only=True)
-    district = serializers.StringRelatedField(read_only=True)
+    province = AreaNameField()
+    city = AreaNameField()
+    district = AreaNameField()
     province_id = serializers.IntegerField(label='省ID', required=True)
     city_id = serializers.IntegerField(label='市ID', required=True)
     district_id = serializers.IntegerField(label='区ID', required=True)
@@ -232,6 +250,23 @@ class UserAddressSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('手机号格式错误')
         return value
 
+    def validate(self, attrs):
+        """
+        使用行政区划树检查 省-市-区 的上下级关系
+        """
+        tree = get_area_tree()
+        province_id = attrs.get('province_id', getattr(self.instance, 'province_id', None))
+        city_id = attrs.get('city_id', getattr(self.instance, 'city_id', None))
+        district_id = attrs.get('district_id', getattr(self.instance, 'district_id', None))
+
+        if not tree.is_child(None, province_id):
+            raise serializers.ValidationError({'province_id': '省份不存在'})
+        if not tree.is_child(province_id, city_id):
+            raise serializers.ValidationError({'city_id': '城市不属于所选省份'})
+        if not tree.is_child(city_id, district_id):
+            raise serializers.ValidationError({'district_id': '区县不属于所选城市'})
+        return attrs
+
     def create(self, validated_data):
         """
         保存
@@ -256,9 +291,8 @@ class AddUserHistorySerializer(serializers.Serializer):
     sku_id = serializers.IntegerField(min_value=1)
 
     def validate_sku_id(self, value):
-        try:
-            SKU.objects.get(id=value)
-        except SKU.DoesNotExist:
+        # 使用缓存的上架商品集合校验，不再查询数据库
+        if not is_launched_sku(value):
             raise serializers.ValidationError("sku id 不存在")
 
         return value
@@ -272,6 +306,18 @@ class AddUserHistorySerializer(serializers.Serializer):
         # 保存数据到 redis 中
         redis_conn = get_redis_connection('history')
 
+        if settings.USER_BROWSING_HISTORY_ASYNC:
+            # 写入事件流，由异步任务合并后批量保存
+            redis_conn.xadd('history_stream', {'user_id': user_id, 'sku_id': sku_id},
+                            maxlen=constants.USER_BROWSING_HISTORY_STREAM_MAXLEN, approximate=True)
+
+            # 已有等待执行的任务时不再重复调度
+            if redis_conn.set('history_consume_lock', 1, nx=True,
+                              ex=constants.USER_BROWSING_HISTORY_CONSUME_LOCK_EXPIRES):
+                consume_browsing_history.apply_async(countdown=constants.USER_BROWSING_HISTORY_CONSUME_DELAY)
+
+            return validated_data
+
         pl = redis_conn.pipeline()
 
         # 清除 sku_id 在 redis 中的记录
@@ -287,6 +333,3 @@ class AddUserHistorySerializer(serializers.Serializer):
         pl.execute()
 
         return validated_data
-
-
-
@@ -18,7 +18,7 @@ from . import serializers
 from .models import User
 from .utils import get_user_by_account
 from . import constants
-from goods.models import SKU
+from goods.utils import get_sku_cards
 from goods.serializers import SKUSerializer
 from carts.utils import merge_cart_cookie_to_redis
 
@@ -186,7 +186,8 @@ class AddressViewSet(mixins.CreateModelMixin, mixins.UpdateModelMixin, GenericVi
         """
         用户地址列表数据
         """
-        queryset = self.get_queryset()
+        # 一次查询地址及其省市区
+        queryset = self.get_queryset().select_related('province', 'city', 'district')
         serializer = self.get_serializer(queryset, many=True)
         user = self.request.user
         return Response({
@@ -262,11 +263,8 @@ class UserHistoryView(mixins.CreateModelMixin, GenericAPIView):
 
         redis_conn = get_redis_connection("history")
         history = redis_conn.lrange("history_%s" % user_id, 0, constants.USER_BROWSING_HISTORY_COUNTS_LIMIT - 1)
-        sku_list = []
-        # 为了保持查询出的顺序与用户的浏览历史保存顺序一致
-        for sku_id in history:
-            sku = SKU.objects.get(id=sku_id)
-            sku_list.append(sku)
+        # 批量获取商品数据，返回的顺序与用户的浏览历史保存顺序一致
+        sku_list = list(get_sku_cards(history).values())
 
         s = SKUSerializer(sku_list, many=True)
         return Response(s.data)
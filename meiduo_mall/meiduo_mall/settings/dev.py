@@ -58,6 +58,7 @@ INSTALLED_APPS = [
     'areas.apps.AreasConfig',
     'goods.apps.GoodsConfig',
     'contents.apps.ContentsConfig',
+    'carts.apps.CartsConfig',
     'orders.apps.OrdersConfig',
     'payment.apps.PaymentConfig',
 ]
@@ -156,6 +157,20 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     },
+    "inventory": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/5",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
+    "goods": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/6",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
 }
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
@@ -332,7 +347,9 @@ GENERATED_STATIC_HTML_FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(B
 # 定时任务
 CRONJOBS = [
     # 每5分钟执行一次生成主页静态文件
-    ('*/5 * * * *', 'contents.crons.generate_static_index_html', '>> /home/python/Desktop/meiduo/meiduo_mall/logs/crontab.log')
+    ('*/5 * * * *', 'contents.crons.generate_static_index_html', '>> /home/python/Desktop/meiduo/meiduo_mall/logs/crontab.log'),
+    # 每分钟补充同步失败的预扣减库存
+    ('* * * * *', 'orders.crons.sync_failed_sku_stock', '>> /home/python/Desktop/meiduo/meiduo_mall/logs/crontab.log'),
 ]
 
 # 解决crontab中文问题
@@ -344,16 +361,39 @@ HAYSTACK_CONNECTIONS = {
         'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
         'URL': 'http://192.168.195.140:9200/',  # 此处为elasticsearch运行的服务器ip地址，端口号固定为9200
         'INDEX_NAME': 'meiduo',  # 指定elasticsearch建立的索引库的名称
+        'SILENTLY_FAIL': False,  # 查询出错时抛出异常，由搜索视图切换到本地搜索
+    },
+    # elasticsearch 不可用时使用的本地搜索，索引文件由 python manage.py build_local_search_index 构建
+    'local': {
+        'ENGINE': 'goods.local_search.LocalSearchEngine',
+        'PATH': os.path.join(os.path.dirname(BASE_DIR), 'search_index/skus.idx'),
     },
 }
 
-# 当添加、修改、删除数据时，自动生成索引
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# 当添加、修改、删除数据时，放入队列由异步任务批量更新索引
+HAYSTACK_SIGNAL_PROCESSOR = 'goods.search_signals.QueuedSignalProcessor'
 
 # 支付宝
 ALIPAY_APPID = 2016091900549384
 ALIPAY_DEBUG = True
 ALIPAY_GETWAY_URL = 'https://openapi.alipaydev.com/gateway.do'
 
+# 下单时在 redis 中原子预扣减库存，再异步同步到 mysql（秒杀等高并发场景开启）
+ORDER_STOCK_REDIS_PREDEDUCT = False
+
+# 登录用户购物车的 redis 存储结构
+# carts.repository.RedisCartStorage: hash 保存数量 + set 保存勾选
+# carts.repository.PackedRedisCartStorage: 单 hash 保存数量与勾选，切换后执行 python manage.py migrate_cart_layout 迁移
+CART_STORAGE_CLASS = 'carts.repository.RedisCartStorage'
+
+# 登录时合并 cookie 购物车，已有商品数量的合并策略: overwrite 覆盖, sum 相加, max 取较大值
+CART_MERGE_POLICY = 'overwrite'
+
+# 浏览历史是否先写入事件流，由异步任务合并后批量保存
+USER_BROWSING_HISTORY_ASYNC = False
+
+# 行政区划树文件，由 python manage.py build_area_tree 生成，各进程通过 mmap 共享，文件不存在时从数据库加载
+AREA_TREE_FILE = os.path.join(os.path.dirname(BASE_DIR), 'data/area_tree.bin')
+
 # 收集静态文件
 STATIC_ROOT = os.path.join(os.path.dirname(os.path.dirname(BASE_DIR)), 'front_end_pc/static')
@@ -1,4 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -7,3 +17,110 @@ class StandardResultsSetPagination(PageNumberPagination):
     # 前端请求的每页数量上限
     max_page_size = 20
 
+
+
+class KeysetPagination(BasePagination):
+    """
+    游标分页，按 (排序字段, id) 定位上一页的最后一条数据，不使用 OFFSET，也不查询总数
+    排序字段取查询集的第一个排序字段，id 用于区分排序字段值相同的数据
+    """
+    page_size = 5
+    page_size_query_param = 'page_size'
+    # 前端请求的每页数量上限
+    max_page_size = 20
+    cursor_query_param = 'cursor'
+    # 查询集没有排序时使用的排序字段
+    default_ordering = '-create_time'
+    invalid_cursor_message = '无效的游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        ordering = queryset.query.order_by[0] if queryset.query.order_by else self.default_ordering
+        self.reverse = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+
+        cursor = self.decode_cursor(request, queryset.model)
+        previous = False
+        if cursor is not None:
+            value, pk, previous = cursor
+            # 向前翻页时按相反的方向查询
+            after = self.reverse == previous
+            if after:
+                position = Q(**{self.field + '__gt': value}) | Q(**{self.field: value, 'pk__gt': pk})
+            else:
+                position = Q(**{self.field + '__lt': value}) | Q(**{self.field: value, 'pk__lt': pk})
+            queryset = queryset.filter(position)
+
+        if self.reverse == previous:
+            queryset = queryset.order_by(self.field, 'pk')
+        else:
+            queryset = queryset.order_by('-' + self.field, '-pk')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if previous:
+            results.reverse()
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], True)
+
+    def encode_cursor(self, obj, previous):
+        """
+        生成翻页链接，游标为 [排序字段值, id, 是否向前翻页] 的 base64 编码
+        """
+        value = getattr(obj, self.field)
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        data = json.dumps([value, obj.pk, int(previous)])
+        cursor = base64.urlsafe_b64encode(data.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """
+        解析游标
+        :return: (排序字段值, id, 是否向前翻页)，没有游标时返回 None
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk, previous = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            value = model._meta.get_field(self.field).to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, bool(previous)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+功能：对比未登录购物车 cookie 新旧格式（varint+签名 / pickle+base64）的大小与编解码耗时
+使用方法:
+    ./bench_cart_cookie.py [商品数量 ...]
+"""
+import sys
+sys.path.insert(0, '../')
+sys.path.insert(0, '../meiduo_mall/apps')
+
+import os
+if not os.getenv('DJANGO_SETTINGS_MODULE'):
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'meiduo_mall.settings.dev'
+
+import base64
+import pickle
+import random
+import timeit
+
+from carts.cookie import encode_cart_cookie, decode_cart_cookie
+
+
+def pickle_encode(cart_dict):
+    """原有格式编码"""
+    return base64.b64encode(pickle.dumps(cart_dict)).decode()
+
+
+def pickle_decode(cart_str):
+    """原有格式解码"""
+    return pickle.loads(base64.b64decode(cart_str.encode()))
+
+
+def make_cart(size):
+    """生成随机购物车数据"""
+    cart_dict = {}
+    for sku_id in random.sample(range(1, 100000), size):
+        cart_dict[sku_id] = {
+            'count': random.randint(1, 10),
+            'selected': random.random() < 0.8
+        }
+    return cart_dict
+
+
+def bench(size, number=2000):
+    cart_dict = make_cart(size)
+    print('商品数量: %s' % size)
+    for name, encode, decode in (('pickle+base64', pickle_encode, pickle_decode),
+                                 ('varint+hmac', encode_cart_cookie, decode_cart_cookie)):
+        cart_str = encode(cart_dict)
+        assert decode(cart_str) == cart_dict
+        encode_time = timeit.timeit(lambda: encode(cart_dict), number=number) / number * 1e6
+        decode_time = timeit.timeit(lambda: decode(cart_str), number=number) / number * 1e6
+        print('    %-14s 大小: %5d 字节  编码: %7.2f us  解码: %7.2f us' % (name, len(cart_str), encode_time, decode_time))
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or [1, 5, 20, 50]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+功能：购物车数据仓库压测，模拟大量用户同时操作购物车
+默认使用进程内存存储，不需要 redis；指定 --storage 可压测 redis 存储
+使用方法:
+    ./bench_cart_repository.py [--users 1000 10000 100000] [--threads 4]
+    ./bench_cart_repository.py --storage carts.repository.PackedRedisCartStorage --users 1000
+"""
+import sys
+sys.path.insert(0, '../')
+sys.path.insert(0, '../meiduo_mall/apps')
+
+import os
+if not os.getenv('DJANGO_SETTINGS_MODULE'):
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'meiduo_mall.settings.dev'
+
+import argparse
+import random
+import threading
+import time
+
+from django.utils.module_loading import import_string
+
+from carts.repository import CartRepository, MemoryCartStorage
+
+# 每个模拟用户的一次购物车会话
+SESSION_STEPS = ('add_many', 'add', 'get_all', 'update_many', 'select_all', 'get_selected', 'remove')
+
+# 模拟商品数量
+SKU_COUNT = 10000
+
+
+def run_step(repository, step, rand):
+    """执行会话中的一步"""
+    if step == 'add_many':
+        repository.add_many({
+            rand.randint(1, SKU_COUNT): {'count': rand.randint(1, 5), 'selected': True} for _ in range(5)
+        })
+    elif step == 'add':
+        repository.add(rand.randint(1, SKU_COUNT), 1, rand.random() < 0.5)
+    elif step == 'get_all':
+        repository.get_all()
+    elif step == 'update_many':
+        cart_dict = repository.get_all()
+        repository.update_many({sku_id: {'count': item['count'] + 1, 'selected': not item['selected']}
+                                for sku_id, item in list(cart_dict.items())[:3]})
+    elif step == 'select_all':
+        repository.select_all(True)
+    elif step == 'get_selected':
+        repository.get_selected()
+    elif step == 'remove':
+        repository.remove(*list(repository.get_all().keys())[:2])
+
+
+def worker(user_id_list, storage_class, latencies, seed):
+    """
+    所有用户交替执行会话中的每一步，模拟同时在线的用户
+    """
+    rand = random.Random(seed)
+    storage = storage_class()
+    repositories = [CartRepository(user_id, storage) for user_id in user_id_list]
+    for step in SESSION_STEPS:
+        samples = latencies.setdefault(step, [])
+        for repository in repositories:
+            start = time.perf_counter()
+            run_step(repository, step, rand)
+            samples.append(time.perf_counter() - start)
+
+
+def percentile(samples, percent):
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+def bench(users, storage_class, threads):
+    if storage_class is MemoryCartStorage:
+        MemoryCartStorage.clear()
+
+    user_id_list = list(range(1, users + 1))
+    latencies_list = [{} for _ in range(threads)]
+    thread_list = [
+        threading.Thread(target=worker, args=(user_id_list[i::threads], storage_class, latencies_list[i], i))
+        for i in range(threads)
+    ]
+
+    start = time.perf_counter()
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = users * len(SESSION_STEPS)
+    print('用户数: %d  操作数: %d  耗时: %.2f s  吞吐: %.0f ops/s' % (users, total, elapsed, total / elapsed))
+    for step in SESSION_STEPS:
+        samples = sorted(sample for latencies in latencies_list for sample in latencies[step])
+        print('    %-14s p50: %8.1f us  p99: %8.1f us' % (
+            step, percentile(samples, 50) * 1e6, percentile(samples, 99) * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='购物车数据仓库压测')
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000, 100000], help='模拟用户数')
+    parser.add_argument('--storage', default='carts.repository.MemoryCartStorage', help='购物车存储类')
+    parser.add_argument('--threads', type=int, default=1, help='并发线程数')
+    args = parser.parse_args()
+
+    storage_class = import_string(args.storage)
+    for users in args.users:
+        bench(users, storage_class, args.threads)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+功能：本地搜索压测，生成模拟商品数据构建本地索引，统计查询延迟；指定 --es-url 时写入相同数据到 elasticsearch 对比
+使用方法:
+    ./bench_local_search.py [--skus 1000000] [--queries 1000]
+    ./bench_local_search.py --skus 1000000 --es-url http://127.0.0.1:9200/
+"""
+import sys
+sys.path.insert(0, '../')
+sys.path.insert(0, '../meiduo_mall/apps')
+
+import os
+if not os.getenv('DJANGO_SETTINGS_MODULE'):
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'meiduo_mall.settings.dev'
+
+import django
+django.setup()
+
+import argparse
+import random
+import tempfile
+import time
+
+from goods.local_search import LocalSearchBackend, build_local_index
+
+BRANDS = ('Apple', '华为', '小米', '三星', 'OPPO', 'vivo', '联想', '戴尔', '索尼', '佳能', '美的', '格力', '海尔')
+PRODUCTS = ('手机', '笔记本电脑', '平板电脑', '智能手表', '蓝牙耳机', '数码相机', '显示器', '路由器', '空调', '冰箱',
+            '洗衣机', '电视', '移动电源', '机械键盘', '无线鼠标')
+COLORS = ('黑色', '白色', '银色', '金色', '深空灰', '玫瑰金', '蓝色', '红色', '绿色')
+SPECS = ('64GB', '128GB', '256GB', '512GB', '8GB+128GB', '16GB+512GB', '1.5匹', '55英寸', '65英寸', '10000mAh')
+CAPTIONS = ('全面屏', '轻薄便携', '超长续航', '旗舰芯片', '快充', '降噪', '高清', '变频节能', '一级能效', '防水',
+            '游戏', '商务', '学生', '新品上市', '限时优惠')
+
+
+def generate_documents(count, seed=0):
+    """生成模拟商品索引数据"""
+    rand = random.Random(seed)
+    for sku_id in range(1, count + 1):
+        name = '%s %s %s %s %s' % (rand.choice(BRANDS), rand.choice(PRODUCTS), rand.choice(COLORS),
+                                   rand.choice(SPECS), rand.randint(1, 999))
+        caption = ' '.join(rand.sample(CAPTIONS, 3))
+        yield {
+            'text': '%s\n%s\n%s' % (name, caption, sku_id),
+            'id': sku_id,
+            'name': name,
+            'price': '%d.00' % rand.randint(10, 20000),
+            'default_image_url': 'http://image.meiduo.site:8888/group1/M00/00/00/%d.jpg' % sku_id,
+            'comments': rand.randint(0, 10000),
+        }
+
+
+def generate_queries(count, seed=1):
+    """生成查询词，包含单个词和组合词"""
+    rand = random.Random(seed)
+    words = BRANDS + PRODUCTS + COLORS + SPECS + CAPTIONS
+    return [' '.join(rand.sample(words, rand.randint(1, 3))) for _ in range(count)]
+
+
+def percentile(samples, percent):
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    print('    %-14s p50: %8.2f ms  p95: %8.2f ms  p99: %8.2f ms' % (
+        name, percentile(samples, 50) * 1e3, percentile(samples, 95) * 1e3, percentile(samples, 99) * 1e3))
+
+
+def bench_local(skus, queries, page_size):
+    with tempfile.TemporaryDirectory() as dir_name:
+        path = os.path.join(dir_name, 'skus.idx')
+        start = time.perf_counter()
+        build_local_index(path, generate_documents(skus), 'goods.sku')
+        print('本地索引  商品数: %d  构建耗时: %.1f s  文件大小: %.1f MB' % (
+            skus, time.perf_counter() - start, os.path.getsize(path) / 1024 / 1024))
+
+        backend = LocalSearchBackend('bench', PATH=path)
+        latencies = {'first_page': [], 'deep_page': []}
+        for query in queries:
+            for name, start_offset in (('first_page', 0), ('deep_page', page_size * 10)):
+                start = time.perf_counter()
+                backend.search(query, start_offset, start_offset + page_size)
+                latencies[name].append(time.perf_counter() - start)
+        for name, samples in latencies.items():
+            report(name, samples)
+
+
+def bench_es(skus, queries, page_size, es_url):
+    from elasticsearch import Elasticsearch
+    from elasticsearch.helpers import bulk
+
+    conn = Elasticsearch(es_url)
+    index_name = 'meiduo_bench_%d' % time.time()
+    conn.indices.create(index=index_name, body={
+        'settings': {'index': {'refresh_interval': '-1'}},
+        'mappings': {'modelresult': {'properties': {'text': {'type': 'text'}}}},
+    })
+    try:
+        start = time.perf_counter()
+        actions = ({'_index': index_name, '_type': 'modelresult', '_id': document['id'], '_source': document}
+                   for document in generate_documents(skus))
+        bulk(conn, actions, chunk_size=5000)
+        conn.indices.put_settings(index=index_name, body={'index': {'refresh_interval': '1s'}})
+        conn.indices.refresh(index=index_name)
+        print('elasticsearch  商品数: %d  写入耗时: %.1f s' % (skus, time.perf_counter() - start))
+
+        latencies = {'first_page': [], 'deep_page': []}
+        for query in queries:
+            for name, start_offset in (('first_page', 0), ('deep_page', page_size * 10)):
+                body = {
+                    'query': {'match': {'text': {'query': query, 'operator': 'and'}}},
+                    'from': start_offset,
+                    'size': page_size,
+                }
+                start = time.perf_counter()
+                conn.search(index=index_name, body=body)
+                latencies[name].append(time.perf_counter() - start)
+        for name, samples in latencies.items():
+            report(name, samples)
+    finally:
+        conn.indices.delete(index=index_name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地搜索压测')
+    parser.add_argument('--skus', type=int, default=1000000, help='模拟商品数量')
+    parser.add_argument('--queries', type=int, default=1000, help='查询次数')
+    parser.add_argument('--page-size', type=int, default=20, help='每页数量')
+    parser.add_argument('--es-url', default=None, help='elasticsearch 地址，指定时对比 elasticsearch 的查询延迟')
+    args = parser.parse_args()
+
+    queries = generate_queries(args.queries)
+    bench_local(args.skus, queries, args.page_size)
+    if args.es_url:
+        bench_es(args.skus, queries, args.page_size, args.es_url)
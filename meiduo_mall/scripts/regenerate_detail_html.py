@@ -3,7 +3,7 @@
 """
 功能：手动生成所有SKU的静态detail html文件
 使用方法:
-    ./regenerate_detail_html.py
+    ./regenerate_detail_html.py [--processes 4] [--chunk-size 20] [--force]
 """
 import sys
 sys.path.insert(0, '../')
@@ -16,89 +16,28 @@ if not os.getenv('DJANGO_SETTINGS_MODULE'):
 import django
 django.setup()
 
-from django.template import loader
-from django.conf import settings
+import argparse
 
-from goods.utils import get_categories
-from goods.models import SKU
+from goods import constants
+from goods.static_html import regenerate_all_detail_html
 
 
-def generate_static_sku_detail_html(sku_id):
+def print_progress(goods_done, goods_total, pages, written, elapsed):
     """
-    生成静态商品详情页面
-    :param sku_id: 商品sku id
+    输出生成进度与吞吐量
     """
-    # 商品分类菜单
-    categories = get_categories()
-
-    # 获取当前sku的信息
-    sku = SKU.objects.get(id=sku_id)
-    sku.images = sku.skuimage_set.all()
-
-    # 面包屑导航信息中的频道
-    goods = sku.goods
-    goods.channel = goods.category1.goodschannel_set.all()[0]
-
-    # 构建当前商品的规格键
-    sku_specs = sku.skuspecification_set.order_by('spec_id')
-    sku_key = []
-    for spec in sku_specs:
-        sku_key.append(spec.option.id)
-
-    # 获取当前商品的所有SKU
-    skus = goods.sku_set.all()
-
-    # 构建不同规格参数（选项）的sku字典
-    # spec_sku_map = {
-    #     (规格1参数id, 规格2参数id, 规格3参数id, ...): sku_id,
-    #     (规格1参数id, 规格2参数id, 规格3参数id, ...): sku_id,
-    #     ...
-    # }
-    spec_sku_map = {}
-    for s in skus:
-        # 获取sku的规格参数
-        s_specs = s.skuspecification_set.order_by('spec_id')
-        # 用于形成规格参数-sku字典的键
-        key = []
-        for spec in s_specs:
-            key.append(spec.option.id)
-        # 向规格参数-sku字典添加记录
-        spec_sku_map[tuple(key)] = s.id
-
-    # 获取当前商品的规格信息
-    specs = goods.goodsspecification_set.order_by('id')
-    # 若当前sku的规格信息不完整，则不再继续
-    if len(sku_key) < len(specs):
-        return
-    for index, spec in enumerate(specs):
-        # 复制当前sku的规格键
-        key = sku_key[:]
-        # 该规格的选项
-        options = spec.specificationoption_set.all()
-        for option in options:
-            # 在规格参数sku字典中查找符合当前规格的sku
-            key[index] = option.id
-            option.sku_id = spec_sku_map.get(tuple(key))
-
-        spec.options = options
-
-    # 渲染模板，生成静态html文件
-    context = {
-        'categories': categories,
-        'goods': goods,
-        'specs': specs,
-        'sku': sku
-    }
-
-    template = loader.get_template('detail.html')
-    html_text = template.render(context)
-    file_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'goods/'+str(sku_id)+'.html')
-    with open(file_path, 'w') as f:
-        f.write(html_text)
+    rate = pages / elapsed if elapsed else 0
+    print('商品 %d/%d  页面 %d  写入 %d  用时 %.1fs  %.1f 页/秒' % (
+        goods_done, goods_total, pages, written, elapsed, rate))
 
 
 if __name__ == '__main__':
-    skus = SKU.objects.all()
-    for sku in skus:
-        print(sku.id)
-        generate_static_sku_detail_html(sku.id)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='生成所有SKU的静态详情页')
+    parser.add_argument('--processes', type=int, default=None, help='进程数，默认为 cpu 核数')
+    parser.add_argument('--chunk-size', type=int, default=constants.STATIC_HTML_GOODS_CHUNK_SIZE,
+                        help='每个任务包含的商品 SPU 数量')
+    parser.add_argument('--force', action='store_true', help='忽略生成记录，重新生成所有页面')
+    args = parser.parse_args()
+
+    pages, written, elapsed = regenerate_all_detail_html(args.processes, args.chunk_size, print_progress, args.force)
+    print('完成，共 %d 个页面，写入 %d 个，用时 %.1fs' % (pages, written, elapsed))
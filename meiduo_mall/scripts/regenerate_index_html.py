@@ -22,4 +22,4 @@ from contents.crons import generate_static_index_html
 
 
 if __name__ == '__main__':
-    generate_static_index_html()
\ No newline at end of file
+    generate_static_index_html(force=True)
\ No newline at end of file